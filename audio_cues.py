@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import math
+import queue
+import threading
+from array import array
+from collections import deque
+from itertools import repeat, zip_longest
+
+from event_names import EVENT_MEDKIT, EVENT_DEATH, EVENT_RESURRECTION, EVENT_STATE
+from metrics import REGISTRY
+
+# Каталог с клипами: sounds/<звук>.wav (имя звука - поле "sound" в items.json)
+SOUNDS_DIR = "sounds"
+# Формат потока: моно 16 бит. Клипы приводятся к нему один раз при загрузке
+RATE = 22050
+PERIOD_FRAMES = 256
+# Буфер ALSA (мкс): меньше - ниже задержка, но выше риск опустошения
+ALSA_LATENCY_US = 40000
+# Одновременно звучащих клипов; лишние ждут в очереди
+MAX_VOICES = 4
+# Тот же звук, запрошенный снова в этом окне (шторм флешек), не дублируется
+DEDUPE_WINDOW = 0.15
+VOLUME = 0.6
+
+# Звуки событий (кроме аптечек - у них звук из каталога предметов)
+CUE_DEATH = "death"
+CUE_RESURRECTION = "resurrect"
+CUE_RADIATION = "radiation"
+# Пороги радиации - те же, что у предупреждений дисплея
+RADIATION_LEVELS = (2000, 5000, 8000)
+
+# Тоны на случай, если клипа нет: (частота Гц, длительность с) по нотам
+FALLBACK_TONES = {
+    "medkit": ((660, 0.08), (880, 0.12)),
+    "antidote": ((520, 0.08), (780, 0.12)),
+    "vodka": ((440, 0.1), (330, 0.15)),
+    CUE_RESURRECTION: ((440, 0.1), (660, 0.1), (880, 0.2)),
+    CUE_DEATH: ((330, 0.2), (220, 0.2), (165, 0.4)),
+    CUE_RADIATION: ((1800, 0.02), (0, 0.04), (1800, 0.02), (0, 0.04), (1800, 0.02)),
+}
+
+CUE_LATENCY_SECONDS = REGISTRY.histogram("medkit_cue_latency_seconds",
+                                         "От запроса звука до передачи первого периода в вывод")
+CUES_PLAYED = REGISTRY.counter("medkit_cues_played_total", "Воспроизведенные звуки")
+CUES_DROPPED = REGISTRY.counter("medkit_cues_dropped_total", "Неизвестные или повторные звуки")
+
+
+def load_wav(path, rate=RATE):
+    """Читает WAV (8 или 16 бит) и приводит к моно 16 бит с частотой rate"""
+    import wave
+
+    with wave.open(path, 'rb') as f:
+        channels, width, source_rate, frames = f.getnchannels(), f.getsampwidth(), f.getframerate(), f.getnframes()
+        data = f.readframes(frames)
+    if width == 1:
+        samples = array('h', ((b - 128) << 8 for b in data))
+    elif width == 2:
+        samples = array('h', data)
+        if sys.byteorder == 'big':
+            samples.byteswap()
+    else:
+        raise ValueError(f"unsupported sample width: {width * 8} bit")
+    if channels > 1:
+        samples = array('h', (sum(samples[i:i + channels]) // channels
+                              for i in range(0, len(samples), channels)))
+    if source_rate != rate:
+        step = source_rate / rate
+        samples = array('h', (samples[int(i * step)] for i in range(int(len(samples) / step))))
+    return samples
+
+
+def make_tone(notes, rate=RATE):
+    """Синтезирует последовательность нот (частота 0 - пауза)"""
+    samples = array('h')
+    for freq, duration in notes:
+        count = int(rate * duration)
+        # Короткое нарастание и спад, чтобы не щелкало
+        fade = min(count // 4, rate // 200) or 1
+        for i in range(count):
+            envelope = min(1.0, i / fade, (count - i) / fade)
+            samples.append(int(32767 * envelope * math.sin(2 * math.pi * freq * i / rate)))
+    return samples
+
+
+def load_clips(names, directory=SOUNDS_DIR, rate=RATE, volume=VOLUME):
+    """Загружает и декодирует все клипы один раз. Нет файла - встроенный тон"""
+    clips = {}
+    for name in names:
+        path = os.path.join(directory, f"{name}.wav")
+        try:
+            samples = load_wav(path, rate)
+        except FileNotFoundError:
+            samples = make_tone(FALLBACK_TONES.get(name, ((1000, 0.1),)), rate)
+        except Exception as e:
+            print(f"Error loading sound {path}: {e}")
+            continue
+        clips[name] = array('h', (int(s * volume) for s in samples))
+    return clips
+
+
+class NullSink:
+    """Вывод в никуда для тестов и бенчмарков. realtime - писать со скоростью устройства"""
+
+    def __init__(self, rate=RATE, realtime=True):
+        self.rate = rate
+        self.realtime = realtime
+        self.frames = 0
+        self._clock = None
+
+    def write(self, data):
+        frames = len(data) // 2
+        self.frames += frames
+        if not self.realtime:
+            return
+        # Как у звуковой карты: запись блокируется, пока буфер не освободится
+        now = time.perf_counter()
+        if self._clock is None or self._clock < now:
+            self._clock = now
+        self._clock += frames / self.rate
+        delay = self._clock - now - ALSA_LATENCY_US / 1e6
+        if delay > 0:
+            time.sleep(delay)
+
+    def close(self):
+        pass
+
+
+class AlsaSink:
+    """Один постоянно открытый поток ALSA через libasound (ctypes, без fork aplay)"""
+
+    SND_PCM_STREAM_PLAYBACK = 0
+    SND_PCM_FORMAT_S16_LE = 2
+    SND_PCM_FORMAT_S16_BE = 3
+    SND_PCM_ACCESS_RW_INTERLEAVED = 3
+
+    def __init__(self, device="default", rate=RATE, latency_us=ALSA_LATENCY_US):
+        import ctypes
+
+        self.rate = rate
+        lib = self._lib = ctypes.CDLL("libasound.so.2")
+        lib.snd_strerror.restype = ctypes.c_char_p
+        lib.snd_pcm_writei.argtypes = (ctypes.c_void_p, ctypes.c_char_p, ctypes.c_ulong)
+        lib.snd_pcm_writei.restype = ctypes.c_long
+        lib.snd_pcm_recover.argtypes = (ctypes.c_void_p, ctypes.c_int, ctypes.c_int)
+        self._pcm = ctypes.c_void_p()
+        self._check(lib.snd_pcm_open(ctypes.byref(self._pcm), device.encode(),
+                                     self.SND_PCM_STREAM_PLAYBACK, 0))
+        pcm_format = self.SND_PCM_FORMAT_S16_LE if sys.byteorder == 'little' else self.SND_PCM_FORMAT_S16_BE
+        # soft_resample=1: если карта не умеет 22050 Гц, ALSA пересчитает сама
+        self._check(lib.snd_pcm_set_params(self._pcm, pcm_format, self.SND_PCM_ACCESS_RW_INTERLEAVED,
+                                           1, rate, 1, latency_us))
+
+    def _check(self, err):
+        if err < 0:
+            raise OSError(-err, self._lib.snd_strerror(err).decode())
+        return err
+
+    def write(self, data):
+        frames = len(data) // 2
+        written = self._lib.snd_pcm_writei(self._pcm, data, frames)
+        if written < 0:
+            # Опустошение буфера после тишины - восстанавливаем поток и пишем еще раз
+            self._check(self._lib.snd_pcm_recover(self._pcm, written, 1))
+            self._lib.snd_pcm_writei(self._pcm, data, frames)
+
+    def close(self):
+        if self._pcm:
+            self._lib.snd_pcm_drain(self._pcm)
+            self._lib.snd_pcm_close(self._pcm)
+            self._pcm = None
+
+
+def open_sink(device=None):
+    """ALSA, если есть libasound и устройство; иначе NullSink"""
+    if device == "null":
+        return NullSink()
+    try:
+        return AlsaSink(device or "default")
+    except OSError as e:
+        print(f"Audio unavailable ({e}), sounds are muted")
+        return NullSink()
+
+
+class AudioEngine:
+    """Микшер в отдельном потоке: запросы звуков не блокируют цикл обнаружения"""
+
+    def __init__(self, sink, clips, period=PERIOD_FRAMES, max_voices=MAX_VOICES,
+                 dedupe_window=DEDUPE_WINDOW):
+        self.sink = sink
+        self.clips = clips
+        self.period = period
+        self.max_voices = max_voices
+        self.dedupe_window = dedupe_window
+        # Задержки последних звуков (секунды) - для бенчмарка
+        self.latencies = deque(maxlen=1000)
+        self._requests = queue.SimpleQueue()
+        self._last_request = {}
+        self._silence = bytes(period * 2)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def play(self, cue):
+        """Запрашивает звук. Возвращает False, если такого звука нет или он только что звучал"""
+        now = time.perf_counter()
+        if cue not in self.clips or now - self._last_request.get(cue, -math.inf) < self.dedupe_window:
+            CUES_DROPPED.inc()
+            return False
+        self._last_request[cue] = now
+        self._requests.put((cue, now))
+        return True
+
+    def _run(self):
+        voices = []
+        waiting = deque()
+        period = self.period
+        while True:
+            # Тишина - ждем запроса без записи в поток
+            requests = [self._requests.get()] if not voices and not waiting else []
+            while True:
+                try:
+                    requests.append(self._requests.get_nowait())
+                except queue.Empty:
+                    break
+            if None in requests:
+                return
+            waiting.extend(requests)
+            while waiting and len(voices) < self.max_voices:
+                cue, requested = waiting.popleft()
+                # [отсчеты, позиция, время запроса]
+                voices.append([self.clips[cue], 0, requested])
+
+            if len(voices) == 1:
+                # Один звук - без смешивания
+                samples, position, _ = voices[0]
+                chunk = samples[position:position + period]
+                data = chunk.tobytes() + self._silence[len(chunk) * 2:]
+            else:
+                # Сумма и ограничение - встроенными map/zip, без цикла Python по отсчетам
+                mixed = map(sum, zip_longest(*(samples[position:position + period]
+                                               for samples, position, _ in voices), fillvalue=0))
+                data = array('h', map(max, repeat(-32768), map(min, repeat(32767), mixed))).tobytes()
+                data += self._silence[len(data):]
+
+            now = time.perf_counter()
+            for voice in voices:
+                if voice[1] == 0:
+                    latency = now - voice[2]
+                    CUE_LATENCY_SECONDS.observe(latency)
+                    self.latencies.append(latency)
+                    CUES_PLAYED.inc()
+                voice[1] += period
+            voices = [voice for voice in voices if voice[1] < len(voice[0])]
+            try:
+                self.sink.write(data)
+            except OSError as e:
+                print(f"Audio error: {e}")
+
+    def close(self):
+        self._requests.put(None)
+        self._thread.join()
+        self.sink.close()
+
+
+class CueTrigger:
+    """Переводит события демона (event_bus) в звуки"""
+
+    def __init__(self, engine, catalog=None, character_id=None):
+        self.engine = engine
+        self.catalog = catalog
+        # Дисплей озвучивает только своего персонажа
+        self.character_id = character_id
+        # Последний уровень радиации по персонажу
+        self._levels = {}
+
+    def radiation_level(self, radiation):
+        return sum(1 for threshold in RADIATION_LEVELS if radiation >= threshold)
+
+    def on_event(self, event):
+        character = event.get('character')
+        if self.character_id is not None and character != self.character_id:
+            return
+        kind = event.get('type')
+        if kind == EVENT_MEDKIT:
+            sound = self.catalog.sound(event.get('item')) if self.catalog is not None else None
+            self.engine.play(sound or "medkit")
+        elif kind == EVENT_DEATH:
+            self.engine.play(CUE_DEATH)
+        elif kind == EVENT_RESURRECTION:
+            self.engine.play(CUE_RESURRECTION)
+
+        state = event.get('state')
+        if kind == EVENT_STATE and state:
+            level = self.radiation_level(state.get('radiation', 0))
+            # Звук только при переходе порога вверх
+            if level > self._levels.get(character, level):
+                self.engine.play(CUE_RADIATION)
+            self._levels[character] = level
+        elif state:
+            self._levels[character] = self.radiation_level(state.get('radiation', 0))
+
+    def close(self):
+        self.engine.close()
+
+
+def start_audio(device=None, catalog=None, character_id=None, directory=SOUNDS_DIR):
+    """Загружает клипы, открывает вывод и возвращает CueTrigger"""
+    names = set(FALLBACK_TONES)
+    if catalog is not None:
+        names.update(info["sound"] for info in catalog.info.values() if info.get("sound"))
+    engine = AudioEngine(open_sink(device), load_clips(sorted(names), directory))
+    return CueTrigger(engine, catalog, character_id)
@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import random
+from bisect import bisect_left
+
+from item_catalog import ItemCatalog, CATALOG_FILE
+from medkit_daemon import apply_medkit_effects
+from simulation import (SIMULATION_FILE, DEFAULT_SETTINGS, RADIATION_DAMAGE, MAX_RADIATION,
+                        advance_state, merge_settings)
+from state_schema import DEFAULT_STATE, FIELD_LIMITS, validate_state
+from state_store import check_death_status
+
+# Сценарий: стартовое состояние и последовательность шагов.
+# Шаг - предмет (или ничего), затем STEP_SECONDS в зоне, как в симуляции демона
+SEQUENCE_LENGTH = 6
+STEP_SECONDS = 300
+START_HEALTH = (25, 50, 85)
+START_RADIATION = (1250, 5000)
+# Сценариев за один проход: ограничивает память под массивы
+CHUNK = 1 << 18
+# Границы корзин распределения радиации в конце - пороги урона симуляции
+RADIATION_BUCKETS = tuple(sorted(threshold for threshold, _ in RADIATION_DAMAGE))
+NO_ITEM = "-"
+
+
+class Sweep:
+    """Перебор: стартовые состояния × последовательности предметов.
+
+    Последовательность задается числом-кодом: цифра j в системе счисления
+    len(items) + 1 - предмет на шаге j (0 - ничего). Так строку сценария можно
+    восстановить по номеру, не храня миллион списков"""
+
+    def __init__(self, effects, starts, length=SEQUENCE_LENGTH, step_seconds=STEP_SECONDS,
+                 exposure=0, protection=0.0, sample=None, seed=0):
+        # [(файл предмета, эффекты)] - эффекты в формате ItemCatalog.effects
+        self.items = list(effects.items())
+        for filename, item in self.items:
+            if not isinstance(item['health_restore'], int):
+                # Дробное здоровье не пройдет проверку схемы и в демоне
+                raise ValueError(f"{filename}: health_restore must be an integer")
+        self.base = len(self.items) + 1
+        self.length = length
+        self.step_seconds = step_seconds
+        self.exposure = exposure
+        self.protection = protection
+        # Стартовые состояния проходят ту же проверку, что и при загрузке файла
+        self.starts = []
+        for health, radiation in starts:
+            config = dict(DEFAULT_STATE, health=health, radiation=radiation, is_dead=False)
+            check_death_status(config, verbose=False, allow_revive=False)
+            self.starts.append(validate_state(config))
+        # Все последовательности или случайная выборка без повторов
+        space = self.base ** length
+        if sample is None or sample >= space:
+            self.codes = range(space)
+        else:
+            self.codes = sorted(random.Random(seed).sample(range(space), sample))
+
+    def __len__(self):
+        return len(self.starts) * len(self.codes)
+
+    def scenario(self, row):
+        """(стартовое состояние, [эффекты или None по шагам]) сценария номер row"""
+        start, index = divmod(row, len(self.codes))
+        code = self.codes[index]
+        steps = []
+        for _ in range(self.length):
+            code, digit = divmod(code, self.base)
+            steps.append(self.items[digit - 1][1] if digit else None)
+        return self.starts[start], steps
+
+    def describe(self, row):
+        start, index = divmod(row, len(self.codes))
+        code = self.codes[index]
+        names = []
+        for _ in range(self.length):
+            code, digit = divmod(code, self.base)
+            names.append(self.items[digit - 1][0] if digit else NO_ITEM)
+        state = self.starts[start]
+        return f"❤ {state['health']} ☢ {state['radiation']}: {' '.join(names)}"
+
+
+def run_scalar(sweep, row):
+    """Эталон: тот же путь, что у демона - apply_medkit_effects и advance_state через
+    проверку смерти и схемы, как в StateStore.modify. Возвращает (состояние, [жив по шагам])"""
+    config, steps = sweep.scenario(row)
+    health_debt = 0.0
+    alive = []
+    for effects in steps:
+        if effects is not None:
+            state = dict(config)
+            # Мертвому без воскрешения аптечка не применяется и не тратится
+            if apply_medkit_effects(state, effects, verbose=False) is not None:
+                check_death_status(state, verbose=False)
+                config = validate_state(state)
+        state = dict(config)
+        health_debt = advance_state(state, sweep.step_seconds, sweep.exposure, sweep.protection,
+                                    health_debt)
+        if state['health'] != config['health'] or state['radiation'] != config['radiation']:
+            check_death_status(state, verbose=False)
+            config = validate_state(state)
+        alive.append(not config['is_dead'])
+    return config, alive
+
+
+def evaluate_python(sweep, rows):
+    """Пакет сценариев без NumPy: те же формулы, но без словарей и копий на каждом шаге.
+
+    Возвращает (здоровье, радиация, мертв, [живых на шаге]) - списки по rows"""
+    dt = sweep.step_seconds
+    dose = sweep.exposure * (1 - sweep.protection) * dt / 60
+    health_low, health_high = FIELD_LIMITS['health']
+    radiation_low, radiation_high = FIELD_LIMITS['radiation']
+    table = [None] + [(item['health_restore'], item['radiation_reduce'] / 100,
+                       item.get('is_ressurect', False)) for _, item in sweep.items]
+    base, count = sweep.base, len(sweep.codes)
+    codes, starts = sweep.codes, sweep.starts
+
+    healths, radiations, deads = [], [], []
+    survivors = [0] * sweep.length
+    for row in rows:
+        start, index = divmod(row, count)
+        code = codes[index]
+        state = starts[start]
+        health, radiation, dead = state['health'], state['radiation'], state['is_dead']
+        debt = 0.0
+        for step in range(sweep.length):
+            code, digit = divmod(code, base)
+            if digit:
+                restore, reduce, ressurect = table[digit]
+                if dead:
+                    if ressurect:
+                        health, radiation, dead = 100, 0, False
+                else:
+                    health = min(100, health + restore)
+                    radiation = max(0, radiation - reduce * radiation)
+                    if health <= 0:
+                        health, dead = 0, True
+                    health = min(health_high, max(health_low, health))
+                    radiation = min(radiation_high, max(radiation_low, radiation))
+            if not dead and dt > 0:
+                if dose:
+                    radiation = round(min(MAX_RADIATION, radiation + dose), 2)
+                rate = 0
+                for threshold, damage_rate in RADIATION_DAMAGE:
+                    if radiation >= threshold:
+                        rate = damage_rate
+                        break
+                debt += rate * dt / 60
+                damage = int(debt)
+                if damage:
+                    health = max(0, health - damage)
+                    debt -= damage
+                    if health <= 0:
+                        dead = True
+                radiation = min(radiation_high, max(radiation_low, radiation))
+            if not dead:
+                survivors[step] += 1
+        healths.append(health)
+        radiations.append(radiation)
+        deads.append(dead)
+    return healths, radiations, deads, survivors
+
+
+def _round2(np, values):
+    """round(x, 2) для массива с тем же результатом, что у Python.
+
+    np.round умножает на 100 и округляет до целого: у значений возле границы .5
+    ошибка умножения может выбрать другой сосед. Их (единицы) досчитываем round()"""
+    rounded = np.round(values, 2)
+    scaled = values * 100
+    near = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    if near.any():
+        rounded[near] = [round(value, 2) for value in values[near].tolist()]
+    return rounded
+
+
+def evaluate_numpy(sweep, rows):
+    """Пакет сценариев массивами NumPy: каждый шаг - несколько операций над всеми сразу"""
+    import numpy as np
+
+    dt = sweep.step_seconds
+    dose = sweep.exposure * (1 - sweep.protection) * dt / 60
+    health_low, health_high = FIELD_LIMITS['health']
+    radiation_low, radiation_high = FIELD_LIMITS['radiation']
+    restore = np.array([0] + [item['health_restore'] for _, item in sweep.items], dtype=np.float64)
+    # Деление на 100 до умножения на радиацию - в том же порядке, что в apply_medkit_effects
+    reduce = np.array([0] + [item['radiation_reduce'] for _, item in sweep.items],
+                      dtype=np.float64) / 100
+    ressurect = np.array([False] + [item.get('is_ressurect', False) for _, item in sweep.items])
+    thresholds = [threshold for threshold, _ in RADIATION_DAMAGE]
+    rates = [float(rate) for _, rate in RADIATION_DAMAGE]
+
+    rows = np.arange(rows.start, rows.stop) if isinstance(rows, range) else np.asarray(rows, dtype=np.int64)
+    start, index = np.divmod(rows, len(sweep.codes))
+    if isinstance(sweep.codes, range):
+        codes = index
+    else:
+        codes = np.asarray(sweep.codes, dtype=np.int64)[index]
+    health = np.array([state['health'] for state in sweep.starts], dtype=np.float64)[start]
+    radiation = np.array([state['radiation'] for state in sweep.starts], dtype=np.float64)[start]
+    dead = np.array([state['is_dead'] for state in sweep.starts])[start]
+    debt = np.zeros(len(rows))
+
+    survivors = []
+    for _ in range(sweep.length):
+        codes, digit = np.divmod(codes, sweep.base)
+        used = digit > 0
+        revive = used & dead & ressurect[digit]
+        applied = used & ~dead
+        health = np.where(applied, np.minimum(100, health + restore[digit]), health)
+        radiation = np.where(applied, np.maximum(0, radiation - reduce[digit] * radiation), radiation)
+        died = applied & (health <= 0)
+        health[died] = 0
+        dead |= died
+        health[revive] = 100
+        radiation[revive] = 0
+        dead &= ~revive
+        np.clip(health, health_low, health_high, out=health)
+        np.clip(radiation, radiation_low, radiation_high, out=radiation)
+
+        if dt > 0:
+            alive = ~dead
+            if dose:
+                irradiated = _round2(np, np.minimum(MAX_RADIATION, radiation + dose))
+                radiation = np.where(alive, irradiated, radiation)
+            rate = np.select([radiation >= threshold for threshold in thresholds], rates, 0.0)
+            debt = np.where(alive, debt + rate * dt / 60, debt)
+            damage = np.where(alive, np.trunc(debt), 0)
+            health = np.maximum(0, health - damage)
+            debt -= damage
+            dead |= alive & (health <= 0)
+            np.clip(radiation, radiation_low, radiation_high, out=radiation)
+        survivors.append(int(np.count_nonzero(~dead)))
+    return health, radiation, dead, survivors
+
+
+def numpy_available():
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def sweep_stats(sweep, use_numpy=None, chunk=CHUNK):
+    """Прогоняет все сценарии пачками. Возвращает выживание по шагам и по стартам,
+    отсортированную радиацию в конце и время"""
+    if use_numpy is None:
+        use_numpy = numpy_available()
+    evaluate = evaluate_numpy if use_numpy else evaluate_python
+    total = len(sweep)
+    survivors = [0] * sweep.length
+    by_start = [0] * len(sweep.starts)
+    radiation = []
+    per_start = len(sweep.codes)
+    started = time.perf_counter()
+    for first in range(0, total, chunk):
+        rows = range(first, min(total, first + chunk))
+        _, final_radiation, dead, alive = evaluate(sweep, rows)
+        survivors = [a + b for a, b in zip(survivors, alive)]
+        if use_numpy:
+            import numpy as np
+
+            starts = np.arange(rows.start, rows.stop) // per_start
+            by_start = [a + int(b) for a, b in zip(by_start, np.bincount(
+                starts[~dead], minlength=len(sweep.starts)))]
+            radiation.extend(final_radiation.tolist())
+        else:
+            for row, is_dead in zip(rows, dead):
+                if not is_dead:
+                    by_start[row // per_start] += 1
+            radiation.extend(final_radiation)
+    radiation.sort()
+    return {"total": total, "survivors": survivors, "by_start": by_start, "radiation": radiation,
+            "seconds": time.perf_counter() - started, "backend": "numpy" if use_numpy else "python"}
+
+
+def check(sweep, count=1000, use_numpy=None, seed=0):
+    """Сверяет пакетный расчет с эталонным на случайных сценариях. Возвращает расхождения"""
+    if use_numpy is None:
+        use_numpy = numpy_available()
+    evaluate = evaluate_numpy if use_numpy else evaluate_python
+    rows = sorted(random.Random(seed).sample(range(len(sweep)), min(count, len(sweep))))
+    health, radiation, dead, _ = evaluate(sweep, rows)
+    if use_numpy:
+        health, radiation, dead = health.tolist(), radiation.tolist(), dead.tolist()
+    mismatches = []
+    for i, row in enumerate(rows):
+        config, _ = run_scalar(sweep, row)
+        expected = (config['health'], config['radiation'], config['is_dead'])
+        if expected != (health[i], radiation[i], dead[i]):
+            mismatches.append((row, expected, (health[i], radiation[i], dead[i])))
+    return mismatches
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def print_report(sweep, stats):
+    total = stats["total"]
+    print(f"Сценариев: {total} ({len(sweep.starts)} стартов × {len(sweep.codes)} последовательностей "
+          f"по {sweep.length} шагов), {stats['backend']}: {stats['seconds']:.2f} с")
+    print("\nВыживание по шагам:")
+    for step, alive in enumerate(stats["survivors"], 1):
+        share = alive / total
+        print(f"  {step:>3} ({step * sweep.step_seconds / 60:>5.0f} мин)  {share * 100:6.2f}%  "
+              f"{'█' * round(share * 40)}")
+
+    print("\nВыжили к концу по стартовому состоянию:")
+    for state, alive in zip(sweep.starts, stats["by_start"]):
+        print(f"  ❤ {state['health']:>3}  ☢ {state['radiation']:>6}   "
+              f"{alive / len(sweep.codes) * 100:6.2f}%")
+
+    radiation = stats["radiation"]
+    print("\nРадиация в конце:")
+    print(f"  p50 {percentile(radiation, 0.5):.0f}   p90 {percentile(radiation, 0.9):.0f}   "
+          f"p99 {percentile(radiation, 0.99):.0f}   max {radiation[-1]:.0f}")
+    bounds = (0,) + RADIATION_BUCKETS
+    for low, high in zip(bounds, RADIATION_BUCKETS + (None,)):
+        # radiation отсортирована - границы корзины бинарным поиском
+        count = (bisect_left(radiation, high) if high is not None else total) - bisect_left(radiation, low)
+        label = f"{low}-{high}" if high is not None else f"{low}+"
+        print(f"  {label:>11}  {count / total * 100:6.2f}%  {'█' * round(count / total * 40)}")
+
+
+def load_settings(path=SIMULATION_FILE):
+    """Настройки симуляции (зоны и костюмы), как их видит демон"""
+    settings = dict(DEFAULT_SETTINGS)
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                # Слияние по ключам, как в демоне: {"zones": {...}} не стирает остальные зоны
+                settings = merge_settings(DEFAULT_SETTINGS, json.load(f))
+        except Exception as e:
+            print(f"Error loading simulation settings: {e}")
+    return settings
+
+
+def _numbers(text):
+    return [float(value) if '.' in value else int(value) for value in text.split(',')]
+
+
+def main():
+    args = sys.argv[1:]
+
+    def option(name, default=None):
+        return args[args.index(name) + 1] if name in args[:-1] else default
+
+    if "--help" in args or "-h" in args:
+        print("Использование:")
+        print("  python3 balance.py [--length 6] [--step 300] [--zone anomaly] [--suit 'SEVA Suit']")
+        print("                     [--health 25,50,85] [--radiation 1250,5000] [--items items.json]")
+        print("                     [--only a.txt,b.txt] [--set ФАЙЛ:ПОЛЕ=ЗНАЧЕНИЕ ...]")
+        print("                     [--sample N] [--seed S] [--check N] [--python]")
+        return 0
+
+    catalog = ItemCatalog(option("--items", CATALOG_FILE))
+    effects = {filename: dict(item) for filename, item in catalog.effects.items()}
+    only = option("--only")
+    if only:
+        effects = {filename: effects[filename] for filename in only.split(',') if filename in effects}
+    # --set medkit_regular.txt:radiation_reduce=20 - правка без изменения items.json
+    for i, arg in enumerate(args[:-1]):
+        if arg != "--set":
+            continue
+        try:
+            target, value = args[i + 1].split('=', 1)
+            filename, field = target.split(':', 1)
+            if filename not in effects or field not in ("health_restore", "radiation_reduce"):
+                raise ValueError(f"неизвестный предмет или поле: {target}")
+            effects[filename][field] = _numbers(value)[0]
+        except ValueError as e:
+            print(f"✗ Ошибка в --set {args[i + 1]}: {e}")
+            return 1
+
+    settings = load_settings()
+    zone = option("--zone", settings["zone"])
+    if "--zone" in args[:-1] and zone not in settings["zones"]:
+        print(f"✗ Неизвестная зона: {zone} (есть: {', '.join(settings['zones'])})")
+        return 1
+    suit = option("--suit", DEFAULT_STATE['suit'])
+    exposure = settings["zones"].get(zone, 0)
+    protection = min(1.0, max(0.0, settings["suit_protection"].get(suit, 0)))
+    starts = [(health, radiation)
+              for health in _numbers(option("--health", ",".join(map(str, START_HEALTH))))
+              for radiation in _numbers(option("--radiation", ",".join(map(str, START_RADIATION))))]
+    sample = option("--sample")
+    try:
+        sweep = Sweep(effects, starts, length=int(option("--length", SEQUENCE_LENGTH)),
+                      step_seconds=float(option("--step", STEP_SECONDS)), exposure=exposure,
+                      protection=protection, sample=int(sample) if sample else None,
+                      seed=int(option("--seed", 0)))
+    except ValueError as e:
+        print(f"✗ Ошибка: {e}")
+        return 1
+
+    use_numpy = False if "--python" in args else numpy_available()
+    print(f"Зона {zone} ({exposure} R/мин), костюм {suit} (защита {protection:.0%}), "
+          f"шаг {sweep.step_seconds:.0f} с, предметы: {', '.join(effects) or '-'}")
+    if not use_numpy and "--python" not in args:
+        print("NumPy не установлен - расчет на чистом Python (медленнее)")
+    print_report(sweep, sweep_stats(sweep, use_numpy))
+
+    checks = int(option("--check", 1000))
+    if checks:
+        mismatches = check(sweep, checks, use_numpy)
+        if mismatches:
+            print(f"\n✗ Расхождений с демоном: {len(mismatches)} из {checks}")
+            for row, expected, got in mismatches[:5]:
+                print(f"  {sweep.describe(row)}  демон {expected}  пакет {got}")
+            return 1
+        print(f"\n✓ {checks} случайных сценариев совпали с расчетом демона")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
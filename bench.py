@@ -0,0 +1,680 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import tempfile
+import argparse
+
+
+def report(name, timings):
+    """Печатает среднее и медиану времени одной операции"""
+    timings = sorted(timings)
+    mean = sum(timings) / len(timings)
+    median = timings[len(timings) // 2]
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    print(f"{name:<28} mean {mean * 1000:8.3f} ms   median {median * 1000:8.3f} ms   "
+          f"p95 {p95 * 1000:8.3f} ms   p99 {p99 * 1000:8.3f} ms   (n={len(timings)})")
+
+
+def bench_mark(args):
+    """Стоимость пометки одной аптечки: in-process fsync против touch+sync через fork"""
+    import subprocess
+    from usb_io import create_used_marker
+
+    prefix = ['sudo'] if args.sudo else []
+
+    def mark_subprocess(used_file):
+        subprocess.run(prefix + ['touch', used_file], capture_output=True, text=True)
+        subprocess.run(prefix + ['sync', used_file], check=False)
+
+    methods = [("in-process (os.open+fsync)", create_used_marker),
+               (("sudo " if args.sudo else "") + "touch + sync (fork)", mark_subprocess)]
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as root:
+        for name, mark in methods:
+            timings = []
+            for i in range(args.runs):
+                used_file = os.path.join(root, f"USED_{i}.txt")
+                start = time.perf_counter()
+                mark(used_file)
+                timings.append(time.perf_counter() - start)
+                os.unlink(used_file)
+            report(name, timings)
+
+
+def bench_multi(args):
+    """Нагрузочный тест: N персонажей и N флешек, вставленных одновременно"""
+    import json
+    import asyncio
+    import contextlib
+    from character_table import CharacterTable, OWNER_FILE
+    from consumption_ledger import ConsumptionLedger
+    from event_journal import JournalWriter
+    from medkit_async import AsyncMedkitDaemon
+    from medkit_daemon import MedkitDaemon
+    from state_store import StateStore
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as root:
+        path = os.path.join(root, "characters.json")
+        characters = {f"p{i:04d}": {"name": f"Stalker {i}", "suit": "Заря", "health": 40,
+                                    "radiation": 1000, "is_dead": False}
+                      for i in range(args.runs)}
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"characters": characters}, f, ensure_ascii=False)
+
+        drives = []
+        for i, char_id in enumerate(characters):
+            drive = os.path.join(root, f"stick{i}")
+            os.mkdir(drive)
+            with open(os.path.join(drive, OWNER_FILE), 'w', encoding='utf-8') as f:
+                f.write(char_id)
+            open(os.path.join(drive, "medkit_regular.txt"), 'w').close()
+            drives.append(drive)
+
+        table = CharacterTable(path, coalesce_window=None)
+        daemon = MedkitDaemon(store=StateStore(os.path.join(root, "unused.json"), coalesce_window=None),
+                              characters=table, journal=JournalWriter(os.path.join(root, "journal.bin")),
+                              ledger=ConsumptionLedger(os.path.join(root, "ledger.log")))
+        daemon.mount_generations = {drive: i for i, drive in enumerate(drives)}
+        runner = AsyncMedkitDaemon(daemon)
+        latencies = []
+
+        async def insert(drive):
+            start = time.perf_counter()
+            result = await runner.handle_drive(drive)
+            latencies.append(time.perf_counter() - start)
+            return result
+
+        async def insert_all():
+            runner.config_dirty = asyncio.Event()
+            runner.log_queue = asyncio.Queue()
+            return await asyncio.gather(*(insert(drive) for drive in drives))
+
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            results = asyncio.run(insert_all())
+            table.flush()
+            daemon.commit_durable()
+            total = time.perf_counter() - start
+
+        check = CharacterTable(path)
+        check.refresh()
+        healed = sum(1 for c in check.characters.values() if c.health == 100)
+        report("per insertion (latency)", latencies)
+        print(f"{len(drives)} sticks in {total:.3f} s, applied {sum(results)}, "
+              f"healed {healed}, table writes {table.writes}, "
+              f"uncommitted transactions {len(daemon.ledger.pending)}")
+
+
+def bench_edit(args):
+    """Стоимость одной правки: процесс на правку, пакетный режим и сервер команд"""
+    import json
+    import socket
+    import subprocess
+
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "edit_config.py")
+    with tempfile.TemporaryDirectory(dir=args.dir) as root:
+        with open(os.path.join(root, "stalker_config.json"), 'w', encoding='utf-8') as f:
+            json.dump({"name": "A", "suit": "Заря", "health": 100, "radiation": 0, "is_dead": False}, f)
+
+        timings = []
+        for i in range(args.runs):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, script, "--radiation", str(i)], cwd=root,
+                           stdout=subprocess.DEVNULL, check=True)
+            timings.append(time.perf_counter() - start)
+        report("process per change", timings)
+
+        commands = "".join("radiation += 1\n" for _ in range(args.runs)).encode()
+        start = time.perf_counter()
+        subprocess.run([sys.executable, script, "--batch"], cwd=root, input=commands,
+                       stdout=subprocess.DEVNULL, check=True)
+        report("batch (one process)", [(time.perf_counter() - start) / args.runs])
+
+        sock_path = os.path.join(root, "edit.sock")
+        server = subprocess.Popen([sys.executable, script, "--serve", sock_path], cwd=root,
+                                  stdout=subprocess.DEVNULL)
+        try:
+            for _ in range(100):
+                if os.path.exists(sock_path):
+                    break
+                time.sleep(0.05)
+            timings = []
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+                client.connect(sock_path)
+                stream = client.makefile('rwb')
+                for _ in range(args.runs):
+                    start = time.perf_counter()
+                    stream.write(b"health -= 0\n")
+                    stream.flush()
+                    stream.readline()
+                    timings.append(time.perf_counter() - start)
+            report("server round trip", timings)
+        finally:
+            server.terminate()
+            server.wait()
+
+
+def bench_startup(args):
+    """Холодный запуск точек входа: время процесса и самые дорогие импорты (-X importtime)"""
+    import subprocess
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    entries = [("python (пустой)", "pass")] + [
+        (module, f"import {module}")
+        for module in ("medkit_daemon", "stalker_display", "edit_config")
+    ]
+    for name, code in entries:
+        timings = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=here,
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+                                    check=True)
+            timings.append(time.perf_counter() - start)
+        report(name, timings)
+
+        # Строки вида "import time: self | cumulative | module" (микросекунды)
+        imports = []
+        for line in result.stderr.splitlines():
+            parts = line.split("|")
+            if len(parts) == 3 and parts[1].strip().isdigit():
+                imports.append((int(parts[1]), parts[2].strip()))
+        for cumulative, module in sorted(imports, reverse=True)[:5]:
+            print(f"    {module:<30} {cumulative / 1000:8.3f} ms")
+
+
+def bench_pipeline(args):
+    """Конвейер обнаружение -> применение -> пометка -> запись на фальшивом корне"""
+    from replay_harness import generate_trace, load_trace, save_trace, replay
+
+    if args.trace and os.path.exists(args.trace):
+        trace = load_trace(args.trace)
+    else:
+        trace = generate_trace(seed=args.seed, sticks=args.sticks, events=args.events)
+        if args.trace:
+            save_trace(trace, args.trace)
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as root:
+        result = replay(trace, root)
+
+    print(f"trace: seed {trace['seed']}, {len(trace['sticks'])} sticks, {result['events']} events, "
+          f"digest {result['digest']}")
+    print(f"throughput: {result['events'] / result['seconds']:.0f} events/s, "
+          f"{result['medkits'] / result['seconds']:.0f} medkits/s ({result['medkits']} applied, "
+          f"{result['rejected']} rejected)")
+    if result['latencies']:
+        report("latency per event", result["latencies"])
+    print(f"config writes: {result['config_writes']}   forks: {result['forks']}")
+    for event, count in result['syscalls'].most_common(8):
+        print(f"    {event:<24} {count}")
+
+
+def apply_terminal_output(screen, text):
+    """Применяет вывод TerminalBackend к экрану (список строк): текст и \\033[2J, [H, [R;CH, [K"""
+    import re
+
+    row = col = 0
+    for match in re.finditer(r"\033\[(\d*)(?:;(\d*))?([HJK])|([^\033]+)", text):
+        first, second, command, chunk = match.groups()
+        if chunk is not None:
+            while len(screen) <= row:
+                screen.append("")
+            line = screen[row].ljust(col)
+            screen[row] = line[:col] + chunk + line[col + len(chunk):]
+            col += len(chunk)
+        elif command == "H":
+            row, col = int(first or 1) - 1, int(second or 1) - 1
+        elif command == "J":
+            screen.clear()
+        elif row < len(screen):
+            screen[row] = screen[row][:col]
+    # Пустые строки в конце на экране не видны
+    while screen and not screen[-1]:
+        screen.pop()
+    return screen
+
+
+def check_terminal_frames(display, states):
+    """Сверяет разностный вывод с полной перерисовкой. Возвращает (кадров, расхождений)"""
+    import io
+    from display_backends import TerminalBackend
+
+    stream = display.backend.stream
+    screen = apply_terminal_output([], stream.getvalue())
+    mismatches = 0
+    for state in states:
+        position = stream.tell()
+        display.character_data.update(state)
+        display.update_display()
+        # Байты разностного кадра поверх предыдущего экрана
+        screen = apply_terminal_output(screen, stream.getvalue()[position:])
+        # Тот же кадр целиком на чистом экране
+        full = TerminalBackend(io.StringIO())
+        full.clear()
+        full.draw(display.build_view())
+        if screen != apply_terminal_output([], full.stream.getvalue()):
+            mismatches += 1
+    return len(states), mismatches
+
+
+def bench_display(args):
+    """Стоимость одного обновления экрана: после изменения здоровья и без изменений"""
+    import io
+    import random
+    import contextlib
+    from state_store import StateStore, atomic_write_json
+    from state_schema import DEFAULT_STATE
+    from display_backends import TerminalBackend, MemoryFramebufferBackend
+    from stalker_display import StalkerDisplay
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as root:
+        path = os.path.join(root, "stalker_config.json")
+        atomic_write_json(path, dict(DEFAULT_STATE))
+        backends = [
+            ("terminal", TerminalBackend(io.StringIO())),
+            ("fb 320x240 RGB565", MemoryFramebufferBackend(320, 240, 16)),
+            ("fb 480x320 XRGB", MemoryFramebufferBackend(480, 320, 32)),
+        ]
+        for name, backend in backends:
+            display = StalkerDisplay(StateStore(path), backend=backend)
+            display.clear_screen()
+            timings = []
+            for i in range(args.runs):
+                display.character_data['health'] = 21 + i % 80
+                start = time.perf_counter()
+                display.update_display()
+                timings.append(time.perf_counter() - start)
+            report(name, timings)
+
+            timings = []
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                display.update_display()
+                timings.append(time.perf_counter() - start)
+            report(f"{name} idle", timings)
+
+        # Разностный вывод терминала: экран после него совпадает с полной перерисовкой.
+        # Состояния с повторами, смертью, дробной радиацией и меняющимся числом предупреждений
+        rng = random.Random(args.seed)
+        display = StalkerDisplay(StateStore(path), backend=TerminalBackend(io.StringIO()))
+        display.clear_screen()
+        states = []
+        for _ in range(args.runs * 10):
+            if states and rng.random() < 0.2:
+                states.append(dict(states[-1]))
+                continue
+            radiation = rng.choice((0, 999, 1250, 5000, 9999, rng.randint(0, 10000), rng.uniform(0, 10000)))
+            states.append({'health': rng.choice((0, 5, 20, 21, 50, 100, rng.randint(-10, 100))),
+                           'radiation': radiation, 'is_dead': rng.random() < 0.1,
+                           'name': rng.choice(("Стрелок", "Меченый", "S"))})
+        # Сообщения о смерти здесь не нужны
+        with contextlib.redirect_stdout(io.StringIO()):
+            checked, mismatches = check_terminal_frames(display, states)
+        if mismatches:
+            print(f"✗ terminal diff: {mismatches} of {checked} frames differ from a full redraw")
+            return 1
+        print(f"✓ terminal diff: {checked} frames match a full redraw")
+
+
+def bench_load(args):
+    """Загрузка состояния новым читателем: разбор JSON против двоичного снимка через mmap"""
+    from state_store import StateStore
+    from state_schema import DEFAULT_STATE
+    from character_table import CharacterTable
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as root:
+        path = os.path.join(root, "stalker_config.json")
+        StateStore(path).save(dict(DEFAULT_STATE))
+        for snapshot in (False, True):
+            timings = []
+            for _ in range(args.runs):
+                store = StateStore(path, snapshot=snapshot)
+                start = time.perf_counter()
+                store.refresh()
+                timings.append(time.perf_counter() - start)
+            report("state " + ("snapshot" if snapshot else "json"), timings)
+
+        for count in (100, 1000):
+            path = os.path.join(root, f"characters_{count}.json")
+            table = CharacterTable(path, coalesce_window=0)
+            for i in range(count):
+                table.stage(f"p{i:04d}", dict(DEFAULT_STATE, name=f"Stalker {i}"))
+            table.flush()
+            for snapshot in (False, True):
+                timings = []
+                for _ in range(args.runs):
+                    table = CharacterTable(path, snapshot=snapshot)
+                    start = time.perf_counter()
+                    table.refresh()
+                    timings.append(time.perf_counter() - start)
+                report(f"table {count} " + ("snapshot" if snapshot else "json"), timings)
+
+
+def _stress_worker(path, mode, count, results):
+    """Процесс нагрузочного теста: count раз прибавляет 1 к радиации"""
+    from state_store import StateStore
+    from character_table import CharacterTable
+    from metrics import LOCK_CONTENDED, LOCK_WAIT_SECONDS, MERGED_UPDATES
+
+    def bump(config):
+        config['radiation'] += 1
+        return True
+
+    if mode == "table":
+        store = CharacterTable(path, coalesce_window=0).store("p0")
+    else:
+        store = StateStore(path, coalesce_window=None if mode == "coalesced" else 0)
+    timings = []
+    for i in range(count):
+        start = time.perf_counter()
+        if mode == "get+save":
+            # Без блокировки: чтение и запись по отдельности
+            config = store.get()
+            bump(config)
+            store.save(config)
+        elif mode == "coalesced":
+            # Изменения копятся в памяти и пишутся пачкой - при конфликте они повторяются
+            store.modify(bump)
+            if i % 5 == 4 or i == count - 1:
+                store.flush()
+        else:
+            store.modify(bump)
+        timings.append(time.perf_counter() - start)
+    results.put({"timings": timings, "contended": LOCK_CONTENDED.value,
+                 "wait": LOCK_WAIT_SECONDS.sum, "merged": MERGED_UPDATES.value})
+
+
+def _stress_reader(path, mode, stop, results):
+    """Читатель без блокировки: считает чтения, пока писатели работают"""
+    from state_store import StateStore
+    from character_table import CharacterTable
+
+    store = CharacterTable(path) if mode == "table" else StateStore(path)
+    reads = 0
+    while not stop.is_set():
+        store.refresh()
+        reads += 1
+    results.put(reads)
+
+
+def bench_crash(args):
+    """Писатель убивается посреди atomic_write_json: файл должен быть старым или новым целиком"""
+    from crash_harness import run, print_report
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as root:
+        result = run(root, rounds=args.runs, seed=args.seed)
+    print_report(result)
+
+
+def bench_contention(args):
+    """Несколько процессов одновременно меняют один файл: потерянные обновления и ожидание блокировки"""
+    import multiprocessing
+    from state_store import StateStore
+    from state_schema import DEFAULT_STATE
+    from character_table import CharacterTable
+
+    ctx = multiprocessing.get_context("fork")
+    expected = args.procs * args.runs
+    with tempfile.TemporaryDirectory(dir=args.dir) as root:
+        for mode in ("get+save", "modify", "coalesced", "table"):
+            if mode == "table":
+                path = os.path.join(root, "characters.json")
+                CharacterTable(path, coalesce_window=0).save("p0", dict(DEFAULT_STATE, radiation=0))
+            else:
+                path = os.path.join(root, f"stalker_config_{mode}.json")
+                StateStore(path).save(dict(DEFAULT_STATE, radiation=0))
+
+            results = ctx.Queue()
+            reads = ctx.Queue()
+            stop = ctx.Event()
+            reader = ctx.Process(target=_stress_reader, args=(path, mode, stop, reads))
+            reader.start()
+            workers = [ctx.Process(target=_stress_worker, args=(path, mode, args.runs, results))
+                       for _ in range(args.procs)]
+            start = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            stats = [results.get() for _ in workers]
+            for worker in workers:
+                worker.join()
+            total = time.perf_counter() - start
+            stop.set()
+            read_count = reads.get()
+            reader.join()
+
+            if mode == "table":
+                got = CharacterTable(path).get("p0")['radiation']
+            else:
+                got = StateStore(path).get()['radiation']
+            report(f"{mode} ({args.procs} proc)", [t for stat in stats for t in stat['timings']])
+            print(f"    updates {got}/{expected}   lost {expected - got}   "
+                  f"{expected / total:.0f} upd/s   contended {sum(s['contended'] for s in stats)}   "
+                  f"wait {sum(s['wait'] for s in stats) * 1000:.1f} ms   "
+                  f"merged {sum(s['merged'] for s in stats)}   reads {read_count}")
+
+
+def bench_audio(args):
+    """Задержка звука: от события до вывода первого периода (NullSink в темпе звуковой карты)"""
+    import shutil
+    import subprocess
+    from audio_cues import AudioEngine, NullSink, load_clips, FALLBACK_TONES, SOUNDS_DIR
+
+    start = time.perf_counter()
+    clips = load_clips(sorted(FALLBACK_TONES), directory=args.sounds or SOUNDS_DIR)
+    print(f"clips decoded once: {len(clips)} in {(time.perf_counter() - start) * 1000:.1f} ms, "
+          f"{sum(len(c) for c in clips.values()) * 2 // 1024} KiB")
+
+    engine = AudioEngine(NullSink(), clips, dedupe_window=0)
+    names = sorted(clips)
+    calls = []
+    for i in range(args.runs):
+        start = time.perf_counter()
+        engine.play(names[i % len(names)])
+        calls.append(time.perf_counter() - start)
+        # Звуки по одному, с паузами
+        time.sleep(0.6)
+    report("play() call", calls)
+    report("cue latency (single)", list(engine.latencies))
+
+    engine.latencies.clear()
+    for i in range(args.runs):
+        # Несколько разных звуков разом - смешиваются
+        for name in names[:4]:
+            engine.play(name)
+        time.sleep(1.0)
+    report("cue latency (4 overlapping)", list(engine.latencies))
+    engine.close()
+
+    # Наивный вариант: процесс на каждый звук (без самого воспроизведения)
+    player = shutil.which("aplay")
+    command = [player, "-q", "/dev/null"] if player else ["true"]
+    timings = []
+    for _ in range(min(args.runs, 20)):
+        start = time.perf_counter()
+        subprocess.run(command, capture_output=True)
+        timings.append(time.perf_counter() - start)
+    report("fork " + ("aplay" if player else "true (no aplay)"), timings)
+
+
+def bench_sync(args):
+    """Синхронизация со станцией мастера: байты на изменение и досылка после разрыва"""
+    import json
+    import random
+    from state_store import StateStore
+    from state_schema import DEFAULT_STATE
+    from state_sync import Collector, SyncAgent
+
+    rng = random.Random(args.seed)
+    collector = Collector()
+    clock = [0.0]
+    with tempfile.TemporaryDirectory(dir=args.dir) as root:
+        devices = []
+        for i in range(args.sticks):
+            store = StateStore(os.path.join(root, f"pda{i}.json"))
+            store.save(dict(DEFAULT_STATE, name=f"Stalker {i}"))
+            agent = SyncAgent(f"pda{i}", lambda store=store: {None: store},
+                              connect=collector.local_link, clock=lambda: clock[0])
+            devices.append((agent, store))
+
+        def tick(seconds=1.0):
+            clock[0] += seconds
+            for agent, _ in devices:
+                agent.step()
+            collector.pump()
+            for agent, _ in devices:
+                if agent.link is not None:
+                    agent.step()
+
+        def change(store):
+            def apply(config):
+                config['radiation'] = min(10000, config['radiation'] + rng.randint(1, 50))
+                if rng.random() < 0.3:
+                    config['health'] = max(1, config['health'] - rng.randint(1, 5))
+                return True
+            store.modify(apply)
+
+        tick()
+        tick()
+        full_json = 0
+        updates = 0
+        dropped = 0
+        timings = []
+        for round_number in range(args.runs):
+            for agent, store in devices:
+                change(store)
+                full_json += len(json.dumps(store.get(), ensure_ascii=False).encode('utf-8'))
+                updates += 1
+            if round_number == args.runs // 2:
+                # Разрыв у половины устройств: изменения копятся и досылаются после подключения
+                for agent, _ in devices[::2]:
+                    dropped += agent.link.bytes_sent
+                    agent.disconnect()
+            start = time.perf_counter()
+            tick(5.0 if round_number == args.runs // 2 + 3 else 1.0)
+            timings.append(time.perf_counter() - start)
+        for _ in range(3):
+            tick(5.0)
+
+        sent = dropped + sum(agent.link.bytes_sent for agent, _ in devices if agent.link is not None)
+        lost = sum(1 for agent, store in devices
+                   if collector.devices[agent.device]["characters"].get("") !=
+                   {key: value for key, value in store.get().items()})
+        report(f"batch round ({len(devices)} PDA)", timings)
+        print(f"updates {updates}   full JSON {full_json} B   sync {sent} B   "
+              f"applied {collector.deltas}   mismatched devices {lost}")
+
+
+def bench_balance(args):
+    """Калькулятор баланса: сценариев в секунду у эталона (путь демона), пакета на Python и NumPy"""
+    import random
+    import balance
+    from item_catalog import ItemCatalog
+
+    sweep = balance.Sweep(ItemCatalog().effects, [(h, r) for h in (25, 50, 85) for r in (1250, 5000)],
+                          exposure=60, protection=0.6)
+    rng = random.Random(args.seed)
+
+    def measure(name, evaluate, count):
+        rows = sorted(rng.sample(range(len(sweep)), count))
+        start = time.perf_counter()
+        evaluate(rows)
+        elapsed = time.perf_counter() - start
+        print(f"{name:<28} {count / elapsed:12.0f} scenarios/s   1M in {1e6 / count * elapsed:8.2f} s")
+
+    measure("scalar (daemon path)", lambda rows: [balance.run_scalar(sweep, row) for row in rows], 2000)
+    measure("batched python", lambda rows: balance.evaluate_python(sweep, rows), 50000)
+    if balance.numpy_available():
+        measure("numpy", lambda rows: balance.evaluate_numpy(sweep, rows), min(len(sweep), 500000))
+    else:
+        print("numpy not installed")
+
+
+def bench_power(args):
+    """День игры (12 ч) на фальшивых часах: пробуждения опроса флешек и задержка обнаружения"""
+    import random
+    from collections import deque
+    from power_scheduler import AdaptiveScheduler, IDLE_INTERVAL
+
+    rng = random.Random(args.seed)
+    day = 12 * 3600
+    # Флешки вставляют пачками (бой, визит к торговцу), между ними затишье
+    inserts = []
+    moment = 0.0
+    while moment < day:
+        moment += rng.expovariate(1 / 1800)
+        inserts.extend(moment + rng.uniform(0, 120) for _ in range(rng.randint(1, 4)))
+    inserts = sorted(t for t in inserts if t < day)
+    # Окна критического здоровья: игрок ранен и ищет аптечку
+    critical = sorted((start, start + rng.uniform(60, 600))
+                      for start in (rng.uniform(0, day) for _ in range(20)))
+
+    def is_critical(now):
+        return any(start <= now < end for start, end in critical)
+
+    modes = [("fixed 1 s (as before)", {}),
+             ("low-power", {"idle_interval": IDLE_INTERVAL}),
+             ("low-power, 4 wakeups/min", {"idle_interval": IDLE_INTERVAL, "budget": 4})]
+    print(f"{len(inserts)} sticks, {len(critical)} critical windows in {day // 3600} h")
+    for name, options in modes:
+        clock = [0.0]
+        scheduler = AdaptiveScheduler("bench_power", clock=lambda: clock[0], **options)
+        pending = deque(inserts)
+        latencies = []
+        critical_latencies = []
+        while clock[0] < day:
+            clock[0] += scheduler.delay()
+            scheduler.wakeup()
+            found = False
+            while pending and pending[0] <= clock[0]:
+                inserted = pending.popleft()
+                (critical_latencies if is_critical(inserted) else latencies).append(clock[0] - inserted)
+                found = True
+            if found:
+                scheduler.activity()
+            scheduler.set_critical(is_critical(clock[0]))
+        latencies.sort()
+        worst_critical = max(critical_latencies, default=0.0)
+        print(f"{name:<28} wakeups {scheduler.wakeups:6d} ({scheduler.wakeups / (day / 3600):6.0f}/h)   "
+              f"latency p50 {latencies[len(latencies) // 2]:5.2f} s   "
+              f"p95 {latencies[int(len(latencies) * 0.95)]:5.2f} s   max {latencies[-1]:5.2f} s   "
+              f"critical max {worst_critical:5.2f} s")
+
+
+BENCHMARKS = {
+    "mark": bench_mark,
+    "multi": bench_multi,
+    "edit": bench_edit,
+    "startup": bench_startup,
+    "pipeline": bench_pipeline,
+    "display": bench_display,
+    "load": bench_load,
+    "contention": bench_contention,
+    "audio": bench_audio,
+    "sync": bench_sync,
+    "balance": bench_balance,
+    "power": bench_power,
+    "crash": bench_crash,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Микро-бенчмарки PDA")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--runs", type=int, default=50, help="число повторов")
+    parser.add_argument("--dir", default=None, help="каталог для файлов (например, точка монтирования флешки)")
+    parser.add_argument("--sudo", action="store_true", help="вызывать внешние команды через sudo")
+    parser.add_argument("--procs", type=int, default=4, help="число процессов-писателей (contention)")
+    parser.add_argument("--seed", type=int, default=0, help="seed синтетической трассы (pipeline)")
+    parser.add_argument("--sticks", type=int, default=50, help="число флешек в трассе (pipeline) или КПК (sync)")
+    parser.add_argument("--events", type=int, default=500, help="число событий в трассе (pipeline)")
+    parser.add_argument("--trace", default=None, help="файл трассы: воспроизвести, а если его нет - сохранить (pipeline)")
+    parser.add_argument("--sounds", default=None, help="каталог с клипами <звук>.wav (audio)")
+    args = parser.parse_args()
+    return BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
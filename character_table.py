@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import threading
+
+from state_store import atomic_write_json, check_death_status
+from state_schema import (DEFAULT_STATE, validate_state, load_table, dump_table, snapshot_path,
+                          write_snapshot, SnapshotReader)
+from metrics import CONFIG_WRITE_SECONDS, CONFIG_WRITES, MERGED_UPDATES
+from file_lock import FileLock
+
+CHARACTERS_FILE = "characters.json"
+# Файл на флешке с ID владельца (игрока)
+OWNER_FILE = "owner.txt"
+# Окно объединения записей таблицы (секунды)
+TABLE_COALESCE_WINDOW = 0.5
+
+
+class Character:
+    """Компактная запись персонажа"""
+
+    __slots__ = ('name', 'suit', 'health', 'radiation', 'is_dead')
+
+    def __init__(self, name, suit, health, radiation, is_dead):
+        self.name = name
+        self.suit = suit
+        self.health = health
+        self.radiation = radiation
+        self.is_dead = is_dead
+
+    @classmethod
+    def from_dict(cls, data):
+        values = dict(DEFAULT_STATE)
+        values.update(data)
+        return cls(**validate_state(values))
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'suit': self.suit,
+            'health': self.health,
+            'radiation': self.radiation,
+            'is_dead': self.is_dead
+        }
+
+
+def _replace_with(character):
+    """Изменение "записать персонажа целиком" для повтора в CharacterTable.flush"""
+    def replace(config):
+        config.update(character.to_dict())
+        return True
+    return replace
+
+
+class CharacterTable:
+    """Состояние всех персонажей в одном файле. Поиск по ID за O(1), запись пачкой"""
+
+    def __init__(self, path=CHARACTERS_FILE, coalesce_window=TABLE_COALESCE_WINDOW, snapshot=True):
+        self.path = path
+        self.coalesce_window = coalesce_window
+        self.characters = {}
+        self.writes = 0
+        self._stamp = None
+        self._dirty = False
+        self._timer = None
+        # (char_id, изменение), еще не записанные на диск
+        self._pending = []
+        self._lock = threading.RLock()
+        self._file_lock = FileLock(path)
+        # Двоичный снимок таблицы рядом с JSON (см. state_schema)
+        self._snapshot = SnapshotReader(snapshot_path(path)) if snapshot else None
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def refresh(self):
+        """Перечитывает файл, если он изменился. Возвращает True при перезагрузке"""
+        with self._lock:
+            if self._dirty:
+                return False
+            stamp = self._file_stamp()
+            if stamp is None or stamp == self._stamp:
+                return False
+            characters = self._load(stamp)
+            if characters is None:
+                return False
+            self.characters = characters
+            self._stamp = stamp
+            return True
+
+    def _load(self, stamp):
+        """Читает таблицу с диска: снимок, а если он устарел - JSON"""
+        states = self._snapshot.read(stamp) if self._snapshot is not None else None
+        if states is None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    # Миграция старых версий и проверка каждого персонажа
+                    states = load_table(json.load(f)).items()
+            except Exception as e:
+                print(f"Error loading characters: {e}")
+                return None
+        return {char_id: Character(**state) for char_id, state in states}
+
+    def get(self, char_id):
+        """Возвращает копию состояния персонажа или None, если его нет"""
+        with self._lock:
+            self.refresh()
+            character = self.characters.get(char_id)
+            return None if character is None else character.to_dict()
+
+    def modify(self, char_id, func, defer=False):
+        """Чтение-изменение-запись одного персонажа без потери чужих обновлений (см. StateStore.modify)"""
+        with self._lock, self._file_lock:
+            self.refresh()
+            character = self.characters.get(char_id)
+            config = character.to_dict() if character is not None else dict(DEFAULT_STATE)
+            try:
+                result = func(config)
+                if result is None:
+                    return None
+                check_death_status(config)
+                character = Character.from_dict(config)
+            except (ValueError, TypeError, KeyError) as e:
+                print(f"Error updating character {char_id}: {e}")
+                return None
+            if not self._put(char_id, character, func, defer):
+                return None
+            return result
+
+    def save(self, char_id, config):
+        """Обновляет персонажа (с проверкой смерти); запись на диск откладывается"""
+        check_death_status(config)
+        character = Character.from_dict(config)
+        return self._put(char_id, character, _replace_with(character), defer=False)
+
+    def stage(self, char_id, config):
+        """Обновляет персонажа только в памяти; на диск попадет при следующем flush()"""
+        check_death_status(config)
+        character = Character.from_dict(config)
+        self._put(char_id, character, _replace_with(character), defer=True)
+
+    def _put(self, char_id, character, func, defer):
+        with self._lock:
+            self.characters[char_id] = character
+            self._dirty = True
+            self._pending.append((char_id, func))
+            if defer or self.coalesce_window is None:
+                return True
+            if self.coalesce_window <= 0:
+                return self.flush()
+            if self._timer is None:
+                self._timer = threading.Timer(self.coalesce_window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+            return True
+
+    @property
+    def dirty(self):
+        return self._dirty
+
+    def flush(self):
+        """Записывает всю таблицу одной атомарной записью"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._dirty:
+                return True
+            with self._file_lock:
+                stamp = self._file_stamp()
+                if stamp is not None and stamp != self._stamp:
+                    # Таблицу записал другой процесс - переносим свои изменения на его версию
+                    characters = self._load(stamp)
+                    if characters is not None:
+                        for char_id, func in self._pending:
+                            character = characters.get(char_id)
+                            config = character.to_dict() if character is not None else dict(DEFAULT_STATE)
+                            try:
+                                func(config)
+                                check_death_status(config, verbose=False)
+                                characters[char_id] = Character.from_dict(config)
+                            except (ValueError, TypeError, KeyError) as e:
+                                # Изменение не прошло проверку на чужой версии - пропускаем
+                                print(f"Error replaying update of {char_id}: {e}")
+                        self.characters = characters
+                        MERGED_UPDATES.inc(len(self._pending))
+                states = {char_id: character.to_dict()
+                          for char_id, character in self.characters.items()}
+                try:
+                    with CONFIG_WRITE_SECONDS.time():
+                        atomic_write_json(self.path, dump_table(states))
+                except Exception as e:
+                    print(f"Error saving characters: {e}")
+                    return False
+                self._stamp = self._file_stamp()
+                if self._snapshot is not None and self._stamp is not None:
+                    write_snapshot(self._snapshot.path, self._stamp, list(states.items()))
+            CONFIG_WRITES.inc()
+            self.writes += 1
+            self._dirty = False
+            self._pending = []
+            return True
+
+    def close(self):
+        self.flush()
+
+    def store(self, char_id):
+        """Хранилище одного персонажа с интерфейсом StateStore"""
+        return CharacterStore(self, char_id)
+
+
+class CharacterStore:
+    """Один персонаж из таблицы; подходит везде, где ожидается StateStore"""
+
+    def __init__(self, table, char_id):
+        self.table = table
+        self.char_id = char_id
+
+    @property
+    def path(self):
+        return self.table.path
+
+    @property
+    def dirty(self):
+        return self.table.dirty
+
+    def refresh(self):
+        return self.table.refresh()
+
+    def get(self):
+        return self.table.get(self.char_id)
+
+    def save(self, config):
+        return self.table.save(self.char_id, config)
+
+    def modify(self, func, defer=False):
+        return self.table.modify(self.char_id, func, defer)
+
+    def stage(self, config):
+        self.table.stage(self.char_id, config)
+
+    def flush(self):
+        return self.table.flush()
+
+    def close(self):
+        self.table.close()
+
+
+def read_owner(drive_path):
+    """Читает ID владельца флешки или None"""
+    try:
+        with open(os.path.join(drive_path, OWNER_FILE), 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
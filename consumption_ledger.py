@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+import threading
+
+from state_schema import DEFAULT_STATE, validate_state
+
+LEDGER_FILE = "medkit_ledger.log"
+# После стольких строк журнал при открытии сжимается до незавершенных транзакций
+LEDGER_COMPACT_RECORDS = 1000
+
+# Поля состояния, по которым восстановление понимает, применена ли транзакция
+STATE_FIELDS = ('health', 'radiation', 'is_dead')
+
+
+def _finish(config, record):
+    """Применяет новое состояние транзакции, если персонаж еще в состоянии до нее"""
+    current = {field: config.get(field) for field in STATE_FIELDS}
+    if current != record['old'] or record['old'] == record['new']:
+        return None
+    config.update(record['new'])
+    return True
+
+
+class ConsumptionLedger:
+    """Журнал упреждающей записи для использования аптечек.
+
+    begin (с fsync) пишется до изменения состояния и до USED.txt: с этого
+    момента аптечка считается использованной. commit пишется, когда и метка
+    на флешке, и новое состояние уже на диске. Незавершенные транзакции
+    доводятся до конца при запуске (recover) и при появлении флешки."""
+
+    def __init__(self, path=LEDGER_FILE, compact_records=LEDGER_COMPACT_RECORDS):
+        self.path = path
+        # txid -> запись begin, для которой еще нет commit
+        self.pending = {}
+        self._next_txid = 1
+        self._lock = threading.Lock()
+        if self._load() > compact_records:
+            self.compact()
+
+    def _load(self):
+        """Читает журнал и отрезает оборванную последнюю строку (сбой во время записи)"""
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return 0
+        complete = data[:data.rfind(b"\n") + 1]
+        if len(complete) != len(data):
+            # Иначе следующая запись склеится с обрывком
+            os.truncate(self.path, len(complete))
+        lines = complete.decode('utf-8', 'replace').splitlines()
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            txid = record.get('txid', 0)
+            self._next_txid = max(self._next_txid, txid + 1)
+            if record.get('op') == 'begin':
+                self.pending[txid] = record
+            elif record.get('op') in ('commit', 'abort'):
+                self.pending.pop(txid, None)
+        return len(lines)
+
+    def _append(self, record, sync):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def begin(self, stick, item, owner, old_state, new_state):
+        """Фиксирует использование аптечки до любых изменений. Возвращает txid"""
+        with self._lock:
+            txid = self._next_txid
+            self._next_txid += 1
+            record = {
+                'op': 'begin', 'txid': txid, 'time': time.time(),
+                'stick': stick, 'item': item, 'owner': owner,
+                'old': {field: old_state.get(field) for field in STATE_FIELDS},
+                'new': {field: new_state.get(field) for field in STATE_FIELDS}
+            }
+            # fsync: после сбоя аптечка не должна примениться второй раз
+            self._append(record, sync=True)
+            self.pending[txid] = record
+            return txid
+
+    def commit(self, txid):
+        """Метка создана и состояние записано - транзакция завершена"""
+        with self._lock:
+            if self.pending.pop(txid, None) is None:
+                return
+            # Потерянный commit безопасен: повторная метка и проверка состояния идемпотентны
+            self._append({'op': 'commit', 'txid': txid}, sync=False)
+
+    def abort(self, txid):
+        """Отменяет транзакцию, которую нельзя довести (неверное новое состояние)"""
+        with self._lock:
+            if self.pending.pop(txid, None) is None:
+                return
+            self._append({'op': 'abort', 'txid': txid}, sync=True)
+
+    def pending_for(self, stick):
+        """txid незавершенных транзакций флешки (по UUID)"""
+        if stick is None:
+            return []
+        with self._lock:
+            return [txid for txid, record in self.pending.items() if record['stick'] == stick]
+
+    def recover(self, store_for):
+        """Доводит транзакции, прерванные сбоем: состояние применяется ровно один раз.
+
+        store_for(owner) возвращает хранилище персонажа. Если его состояние еще
+        равно состоянию до транзакции, записывается новое; если уже равно новому
+        или изменено кем-то еще - не трогаем. Метку ставит демон при появлении флешки"""
+        recovered = 0
+        for txid, record in list(self.pending.items()):
+            try:
+                validate_state(dict(DEFAULT_STATE, **record['new']))
+            except (ValueError, TypeError, KeyError) as e:
+                # Такое состояние не запишется никогда - не мешаем запуску демона
+                print(f"Ledger transaction {txid} aborted: {e}")
+                self.abort(txid)
+                continue
+            store = store_for(record.get('owner'))
+            if store is None:
+                continue
+            if not store.get():
+                continue
+            if store.modify(lambda config, record=record: _finish(config, record)):
+                store.flush()
+                recovered += 1
+            if record.get('stick') is None:
+                # Флешку без UUID не узнать - метку поставить негде
+                self.commit(txid)
+        return recovered
+
+    def compact(self):
+        """Переписывает журнал, оставляя только незавершенные транзакции"""
+        with self._lock:
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for record in self.pending.values():
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import random
+import signal
+import hashlib
+import multiprocessing
+from collections import Counter
+
+from state_store import atomic_write_json
+
+# Размер заполнителя: запись должна длиться дольше, чем промах сигнала
+PADDING_BYTES = 256 * 1024
+
+
+def make_payload(version, size=PADDING_BYTES):
+    """Версия файла с контрольной суммой - по ней видно, что JSON целый и чей он"""
+    padding = hashlib.sha256(str(version).encode()).hexdigest() * (size // 64)
+    return {"version": version, "padding": padding,
+            "check": hashlib.sha256(padding.encode()).hexdigest()}
+
+
+def check_file(path):
+    """Номер версии целого файла или None, если файл оборван или испорчен"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if hashlib.sha256(data["padding"].encode()).hexdigest() != data["check"]:
+            return None
+        return data["version"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _writer(path, first, size, ack_fd):
+    """Процесс-писатель: версии first, first+1, ...; номер уходит в канал после записи"""
+    version = first
+    while True:
+        atomic_write_json(path, make_payload(version, size))
+        os.write(ack_fd, f"{version}\n".encode())
+        version += 1
+
+
+def crash_once(path, version, size, delay):
+    """Запускает писателя, убивает его через delay секунд (SIGKILL).
+    Возвращает (последняя подтвержденная версия, версия в файле)"""
+    ctx = multiprocessing.get_context("fork")
+    read_fd, write_fd = os.pipe()
+    writer = ctx.Process(target=_writer, args=(path, version + 1, size, write_fd))
+    writer.start()
+    os.close(write_fd)
+    time.sleep(delay)
+    os.kill(writer.pid, signal.SIGKILL)
+    writer.join()
+
+    acked = version
+    with os.fdopen(read_fd, 'rb') as pipe:
+        for line in pipe.read().split(b"\n"):
+            if line:
+                acked = int(line)
+    return acked, check_file(path)
+
+
+def run(root, rounds=50, size=PADDING_BYTES, seed=0):
+    """rounds убийств писателя посреди atomic_write_json. Возвращает словарь с результатами"""
+    rng = random.Random(seed)
+    path = os.path.join(root, "stalker_config.json")
+    atomic_write_json(path, make_payload(0, size))
+
+    # Длительность одной записи - убиваем в случайный момент одной-двух записей
+    start = time.perf_counter()
+    atomic_write_json(path, make_payload(0, size))
+    write_seconds = time.perf_counter() - start
+
+    outcomes = Counter()
+    failures = []
+    leftovers = 0
+    version = 0
+    for i in range(rounds):
+        acked, found = crash_once(path, version, size, rng.uniform(0, 2 * write_seconds))
+        if found == acked:
+            outcomes["old"] += 1
+        elif found == acked + 1:
+            # Переименование прошло, подтверждение не успело уйти
+            outcomes["new"] += 1
+        else:
+            failures.append((i, acked, found))
+        version = found if found is not None else acked
+        # Временный файл убитого писателя остается - его никто не читает
+        for name in os.listdir(root):
+            if name.endswith(".tmp"):
+                leftovers += 1
+                os.unlink(os.path.join(root, name))
+    return {"rounds": rounds, "write_seconds": write_seconds, "outcomes": outcomes,
+            "failures": failures, "leftovers": leftovers}
+
+
+def print_report(result):
+    print(f"{result['rounds']} kills, one write {result['write_seconds'] * 1000:.1f} ms: "
+          f"old file {result['outcomes']['old']}, new file {result['outcomes']['new']}, "
+          f"torn {len(result['failures'])}, leftover temp files {result['leftovers']}")
+    for i, acked, found in result['failures']:
+        print(f"    ✗ round {i}: written {acked}, file has {found}")
+
+
+def main():
+    """crash_harness.py КАТАЛОГ [РАУНДЫ]: проверка атомарной записи убийством писателя"""
+    import tempfile
+
+    if len(sys.argv) > 1 and sys.argv[1] in ("-h", "--help"):
+        print(main.__doc__)
+        return 0
+    directory = sys.argv[1] if len(sys.argv) > 1 else None
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    with tempfile.TemporaryDirectory(dir=directory) as root:
+        result = run(root, rounds)
+    print_report(result)
+    return 1 if result['failures'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import struct
+from collections import namedtuple
+
+# Данные для одного кадра: значения и уже отформатированный текст
+DisplayView = namedtuple("DisplayView", [
+    "name", "suit", "status", "is_dead",
+    "health", "health_text", "radiation", "radiation_text", "radiation_fraction",
+    "warnings", "lines"
+])
+
+# Консольные шрифты с кириллицей (пакет console-setup)
+CONSOLE_FONT_DIR = "/usr/share/consolefonts"
+CONSOLE_FONTS = ("Uni2-Fixed16.psf.gz", "Uni2-VGA16.psf.gz", "CyrSlav-Fixed16.psf.gz",
+                 "Uni2-Terminus16.psf.gz", "default8x16.psf.gz")
+
+PSF1_MAGIC = b"\x36\x04"
+PSF2_MAGIC = b"\x72\xb5\x4a\x86"
+
+# Цвета (R, G, B)
+COLOR_BACKGROUND = (0, 0, 0)
+COLOR_TEXT = (230, 230, 210)
+COLOR_TITLE = (240, 180, 40)
+COLOR_HEALTH = (60, 200, 60)
+COLOR_RADIATION = (230, 200, 40)
+COLOR_BAR_EMPTY = (40, 40, 40)
+COLOR_DEAD = (220, 40, 40)
+COLOR_WARNING = (240, 140, 40)
+
+
+class TerminalBackend:
+    """Вывод в терминал ANSI-последовательностями: перерисовываются только изменившиеся строки"""
+
+    # Бэкенду нужен кадр в виде строк текста (DisplayView.lines)
+    wants_lines = True
+
+    def __init__(self, stream=None):
+        self.stream = stream if stream is not None else sys.stdout
+        self.last_frame = []
+
+    def clear(self):
+        self.stream.write("\033[2J\033[H")
+        self.stream.flush()
+        self.last_frame = []
+
+    def draw(self, view):
+        frame = view.lines
+        out = []
+        for row, line in enumerate(frame):
+            if row >= len(self.last_frame) or self.last_frame[row] != line:
+                out.append(f"\033[{row + 1};1H{line}\033[K")
+        # Стираем строки, оставшиеся от более длинного кадра
+        for row in range(len(frame), len(self.last_frame)):
+            out.append(f"\033[{row + 1};1H\033[K")
+
+        if out:
+            out.append(f"\033[{len(frame) + 1};1H")
+            self.stream.write("".join(out))
+            self.stream.flush()
+        self.last_frame = frame
+
+    def close(self):
+        pass
+
+
+class PsfFont:
+    """Растровый консольный шрифт PSF1/PSF2: глиф - список строк-битовых масок"""
+
+    def __init__(self, width, height, glyphs, default=None):
+        self.width = width
+        self.height = height
+        self.glyphs = glyphs
+        self.default = default if default is not None else [0] * height
+
+    def rows(self, char):
+        return self.glyphs.get(char, self.default)
+
+
+class BlockFont:
+    """Запасной шрифт без файлов: каждый символ - закрашенный прямоугольник"""
+
+    def __init__(self, width=8, height=16):
+        self.width = width
+        self.height = height
+        block = ((1 << (width - 1)) - 1) << 1
+        self._block = [0] * 3 + [block] * (height - 5) + [0] * 2
+        self._space = [0] * height
+
+    def rows(self, char):
+        return self._space if char.isspace() else self._block
+
+
+def _psf_unicode_table(data, glyph_count, utf8):
+    """Таблица юникода PSF: для каждого глифа - символы, которые он изображает"""
+    table = {}
+    glyph = 0
+    i = 0
+    while glyph < glyph_count and i < len(data):
+        if utf8:
+            end = data.find(b"\xff", i)
+            if end < 0:
+                break
+            entry = data[i:end].split(b"\xfe")[0]
+            for char in entry.decode('utf-8', 'ignore'):
+                table.setdefault(char, glyph)
+            i = end + 1
+        else:
+            codes = []
+            while i + 2 <= len(data):
+                (code,) = struct.unpack_from("<H", data, i)
+                i += 2
+                if code == 0xFFFF:
+                    break
+                codes.append(code)
+            for code in codes:
+                if code == 0xFFFE:
+                    break
+                table.setdefault(chr(code), glyph)
+        glyph += 1
+    return table
+
+
+def load_psf(path):
+    """Загружает консольный шрифт (.psf или .psf.gz)"""
+    if path.endswith(".gz"):
+        import gzip
+        with gzip.open(path, 'rb') as f:
+            data = f.read()
+    else:
+        with open(path, 'rb') as f:
+            data = f.read()
+
+    if data.startswith(PSF2_MAGIC):
+        _, _, header_size, flags, count, char_size, height, width = struct.unpack_from("<8I", data)
+        offset = header_size
+        has_table = flags & 1
+        utf8 = True
+    elif data.startswith(PSF1_MAGIC):
+        mode, char_size = data[2], data[3]
+        count = 512 if mode & 1 else 256
+        width, height = 8, char_size
+        offset = 4
+        has_table = mode & 6
+        utf8 = False
+    else:
+        raise ValueError(f"{path}: not a PSF font")
+
+    row_bytes = (width + 7) // 8
+    pad = row_bytes * 8 - width
+    bitmaps = []
+    for glyph in range(count):
+        start = offset + glyph * char_size
+        bitmaps.append([int.from_bytes(data[start + row * row_bytes:start + (row + 1) * row_bytes], 'big') >> pad
+                        for row in range(height)])
+
+    if has_table:
+        table = _psf_unicode_table(data[offset + count * char_size:], count, utf8)
+    else:
+        table = {chr(code): code for code in range(min(count, 256))}
+    glyphs = {char: bitmaps[glyph] for char, glyph in table.items()}
+    return PsfFont(width, height, glyphs, default=glyphs.get("?"))
+
+
+def find_console_font(font_dir=CONSOLE_FONT_DIR):
+    """Первый установленный консольный шрифт с кириллицей или BlockFont"""
+    for name in CONSOLE_FONTS:
+        path = os.path.join(font_dir, name)
+        if os.path.exists(path):
+            try:
+                return load_psf(path)
+            except (OSError, ValueError) as e:
+                print(f"Error loading font {path}: {e}")
+    return BlockFont()
+
+
+def pack_color(color, bpp):
+    """Цвет (R, G, B) в байтах пикселя: RGB565 или XRGB8888 (little-endian)"""
+    r, g, b = color
+    if bpp == 16:
+        return struct.pack("<H", ((r >> 3) << 11) | ((g >> 2) << 5) | (b >> 3))
+    if bpp == 32:
+        return bytes((b, g, r, 0))
+    raise ValueError(f"unsupported bits per pixel: {bpp}")
+
+
+class FramebufferBackend:
+    """Рисует кадр прямо в память кадра. Каждая область (имя, полосы, статус...)
+    перерисовывается и копируется только когда ее содержимое изменилось"""
+
+    wants_lines = False
+
+    def __init__(self, buffer, width, height, bpp=16, stride=None, font=None, scale=1):
+        self.buffer = buffer
+        self.width = width
+        self.height = height
+        self.bpp = bpp
+        self.pixel_size = bpp // 8
+        self.stride = stride if stride is not None else width * self.pixel_size
+        self.font = font if font is not None else find_console_font()
+        self.scale = scale
+        self._colors = {}
+        # (символ, цвет) -> строки глифа, уже в байтах пикселей
+        self._glyphs = {}
+        self._regions = {}
+        # Сколько областей скопировано в память кадра (для тестов и бенчмарков)
+        self.blits = 0
+        self._layout()
+
+    def _layout(self):
+        """Делит экран на области по строкам шрифта"""
+        line = self.font.height * self.scale + 4
+        rows = ("title", "name", "suit", "status",
+                "health_text", "health_bar", "radiation_text", "radiation_bar")
+        self.layout = {}
+        y = 2
+        for name in rows:
+            self.layout[name] = (y, line)
+            y += line
+        # Остаток экрана - предупреждения, по одной области на строку
+        self.warning_rows = max(0, (self.height - y) // line)
+        for i in range(self.warning_rows):
+            self.layout[f"warning{i}"] = (y + i * line, line)
+
+    def color(self, color):
+        packed = self._colors.get(color)
+        if packed is None:
+            packed = self._colors[color] = pack_color(color, self.bpp)
+        return packed
+
+    def clear(self):
+        row = self.color(COLOR_BACKGROUND) * self.width
+        for y in range(self.height):
+            offset = y * self.stride
+            self.buffer[offset:offset + len(row)] = row
+        self._regions = {}
+
+    def draw(self, view):
+        status_color = COLOR_DEAD if view.is_dead else COLOR_TEXT
+        contents = {
+            "title": ("text", "STALKER STATUS", COLOR_TITLE),
+            "name": ("text", f"Name: {view.name}", COLOR_TEXT),
+            "suit": ("text", f"Suit: {view.suit}", COLOR_TEXT),
+            "status": ("text", f"Status: {view.status}", status_color),
+            "health_text": ("text", f"Health: {view.health_text}", COLOR_TEXT),
+            "health_bar": ("bar", max(0.0, min(1.0, view.health / 100)), COLOR_HEALTH),
+            "radiation_text": ("text", f"Radiation: {view.radiation_text}", COLOR_TEXT),
+            "radiation_bar": ("bar", view.radiation_fraction, COLOR_RADIATION),
+        }
+        for i in range(self.warning_rows):
+            text = view.warnings[i].strip() if i < len(view.warnings) else ""
+            contents[f"warning{i}"] = ("text", text, COLOR_WARNING)
+
+        for name, content in contents.items():
+            if self._regions.get(name) != content:
+                self._draw_region(name, content)
+                self._regions[name] = content
+
+    def _draw_region(self, name, content):
+        y, height = self.layout[name]
+        height = min(height, self.height - y)
+        if height <= 0:
+            return
+        kind, value, color = content
+        if kind == "bar":
+            rows = self._bar_rows(value, color, height)
+        else:
+            rows = self._text_rows(value, color, height)
+        for i, row in enumerate(rows):
+            offset = (y + i) * self.stride
+            self.buffer[offset:offset + len(row)] = row
+        self.blits += 1
+
+    def _bar_rows(self, fraction, color, height):
+        margin = 4
+        inner = self.width - 2 * margin
+        filled = int(inner * fraction)
+        background = self.color(COLOR_BACKGROUND)
+        bar = (background * margin + self.color(color) * filled
+               + self.color(COLOR_BAR_EMPTY) * (inner - filled) + background * margin)
+        empty = background * self.width
+        return [empty] * 2 + [bar] * (height - 4) + [empty] * 2
+
+    def _glyph(self, char, color):
+        """Глиф в байтах пикселей: строки шириной font.width * scale"""
+        key = (char, color)
+        rows = self._glyphs.get(key)
+        if rows is None:
+            font = self.font
+            pixels = (self.color(COLOR_BACKGROUND), self.color(color))
+            rows = []
+            for bits in font.rows(char):
+                row = b"".join(pixels[(bits >> (font.width - 1 - x)) & 1] * self.scale
+                               for x in range(font.width))
+                rows.extend([row] * self.scale)
+            rows = self._glyphs[key] = rows
+        return rows
+
+    def _text_rows(self, text, color, height):
+        glyph_width = self.font.width * self.scale
+        text = text[:max(0, (self.width - 4) // glyph_width)]
+        glyphs = [self._glyph(char, color) for char in text]
+        text_height = self.font.height * self.scale
+        top = (height - text_height) // 2
+
+        background = self.color(COLOR_BACKGROUND)
+        empty = background * self.width
+        left = background * 4
+        right = background * (self.width - 4 - glyph_width * len(text))
+        rows = []
+        for y in range(height):
+            if not glyphs or not 0 <= y - top < text_height:
+                rows.append(empty)
+            else:
+                rows.append(left + b"".join(glyph[y - top] for glyph in glyphs) + right)
+        return rows
+
+    def close(self):
+        pass
+
+
+class MemoryFramebufferBackend(FramebufferBackend):
+    """Память кадра в bytearray - для тестов и работы без экрана"""
+
+    def __init__(self, width=320, height=240, bpp=16, font=None, scale=1):
+        stride = width * (bpp // 8)
+        super().__init__(bytearray(stride * height), width, height, bpp, stride, font, scale)
+
+    def pixel(self, x, y):
+        offset = y * self.stride + x * self.pixel_size
+        return bytes(self.buffer[offset:offset + self.pixel_size])
+
+
+class DeviceFramebufferBackend(FramebufferBackend):
+    """Linux framebuffer (/dev/fb*) через mmap. SPI LCD с драйвером fbtft - тоже /dev/fbN"""
+
+    def __init__(self, device="/dev/fb0", font=None, scale=1):
+        import mmap
+
+        name = os.path.basename(device)
+        sysfs = f"/sys/class/graphics/{name}"
+        width, height = (int(v) for v in _read_sysfs(sysfs, "virtual_size").split(","))
+        bpp = int(_read_sysfs(sysfs, "bits_per_pixel"))
+        stride = int(_read_sysfs(sysfs, "stride"))
+
+        self.fd = os.open(device, os.O_RDWR)
+        try:
+            framebuffer = mmap.mmap(self.fd, stride * height, mmap.MAP_SHARED,
+                                    mmap.PROT_READ | mmap.PROT_WRITE)
+        except OSError:
+            os.close(self.fd)
+            raise
+        super().__init__(framebuffer, width, height, bpp, stride, font, scale)
+
+    def close(self):
+        self.buffer.close()
+        os.close(self.fd)
+
+
+def _read_sysfs(directory, name):
+    with open(os.path.join(directory, name), 'r') as f:
+        return f.read().strip()
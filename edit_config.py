@@ -1,49 +1,59 @@
 #!/usr/bin/env python3
 
-import json
-import os
+from state_store import StateStore, CONFIG_FILE
+from state_schema import DEFAULT_STATE, FIELD_LIMITS, FIELD_TYPES, TEXT_FIELDS, validate_state
 
-CONFIG_FILE = "stalker_config.json"
+store = StateStore(CONFIG_FILE)
+
+# Сокет сервера команд (режим --serve)
+EDIT_SOCKET = "/tmp/stalker_edit.sock"
+
+# Разбор команд нужен только пакетному режиму и серверу: re и operator импортируются
+# при первой команде, а не при каждом запуске (--radiation N)
+_syntax = {}
+
+
+def command_syntax():
+    """(регулярное выражение команды, операции сравнения)"""
+    if not _syntax:
+        import re
+        import operator
+        # [if ПОЛЕ СРАВНЕНИЕ ЧИСЛО:] ПОЛЕ (= | += | -=) ЗНАЧЕНИЕ
+        _syntax['command'] = re.compile(
+            r"^(?:if\s+(\w+)\s*(<=|>=|==|!=|<|>)\s*(-?[\d.]+)\s*:\s*)?(\w+)\s*(\+=|-=|=)\s*(.+)$")
+        _syntax['comparisons'] = {
+            '<': operator.lt,
+            '<=': operator.le,
+            '>': operator.gt,
+            '>=': operator.ge,
+            '==': operator.eq,
+            '!=': operator.ne
+        }
+    return _syntax['command'], _syntax['comparisons']
 
 def load_config():
     """Загружает конфигурацию"""
-    default_config = {
-        'name': 'STALKER',
-        'suit': 'SEVA Suit', 
-        'health': 85,
-        'radiation': 1250
-    }
-    
-    try:
-        if os.path.exists(CONFIG_FILE):
-            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        else:
-            return default_config
-    except:
-        return default_config
-
-def save_config(config):
-    """Сохраняет конфигурацию"""
-    # АВТОМАТИЧЕСКАЯ ПРОВЕРКА СМЕРТИ ПЕРЕД СОХРАНЕНИЕМ
-    if config['health'] <= 0 and not config.get('is_dead', False):
-        config['is_dead'] = True
-        config['health'] = 0
-        print("💀 Сталкер умер от потери здоровья!")
-    elif config['health'] > 0 and config.get('is_dead', False):
-        config['is_dead'] = False
-        print("✨ Сталкер ожил!")
-    
-    try:
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(config, f, ensure_ascii=False, indent=2)
+    config = store.get()
+    if config is None:
+        return dict(DEFAULT_STATE)
+    return config
+
+def save_config(changes):
+    """Сохраняет измененные поля поверх актуального состояния"""
+    def apply(config):
+        config.update(changes)
+        return True
+    # Блокировка файла: изменения демона за время редактирования не теряются.
+    # Проверка смерти выполняется в StateStore.modify
+    if store.modify(apply):
         print("✓ Конфигурация сохранена!")
-    except Exception as e:
-        print(f"✗ Ошибка сохранения: {e}")
+    else:
+        print("✗ Ошибка сохранения")
 
 def edit_config():
     """Редактирует конфигурацию"""
     config = load_config()
+    original = dict(config)
     
     print("╔══════════════════════════════════════╗")
     print("║        РЕДАКТИРОВАНИЕ КОНФИГА       ║")
@@ -95,7 +105,7 @@ def edit_config():
                     print("✗ Ошибка: введите число")
             
             elif choice == '5':
-                save_config(config)
+                save_config({key: value for key, value in config.items() if value != original[key]})
                 break
             
             elif choice == '6':
@@ -118,48 +128,237 @@ def edit_config():
 
 def quick_set(name=None, suit=None, health=None, radiation=None):
     """Быстрая установка значений через аргументы"""
-    config = load_config()
-    
-    changes = False
+    changes = {}
     
     if name is not None:
-        config['name'] = name
+        changes['name'] = name
         print(f"✓ Имя установлено: {name}")
-        changes = True
     
     if suit is not None:
-        config['suit'] = suit
+        changes['suit'] = suit
         print(f"✓ Костюм установлен: {suit}")
-        changes = True
     
     if health is not None:
         if 0 <= health <= 100:
-            config['health'] = health
+            changes['health'] = health
             print(f"✓ Здоровье установлено: {health}%")
-            changes = True
         else:
             print("✗ Ошибка: здоровье должно быть от 0 до 100")
     
     if radiation is not None:
         if 0 <= radiation <= 10000:
-            config['radiation'] = radiation
+            changes['radiation'] = radiation
             print(f"✓ Радиация установлена: {radiation}")
-            changes = True
         else:
             print("✗ Ошибка: радиация должна быть от 0 до 10000")
     
     if changes:
-        save_config(config)
+        save_config(changes)
     else:
+        config = load_config()
         print("Текущая конфигурация:")
         print(f"  Имя: {config['name']}")
         print(f"  Костюм: {config['suit']}")
         print(f"  Здоровье: {config['health']}%")
         print(f"  Радиация: {config['radiation']}")
 
+def parse_number(text):
+    value = float(text)
+    return int(value) if value.is_integer() else value
+
+def parse_command(line):
+    """Разбирает команду: текстовую (health -= 15) или JSON-строку"""
+    command_re, comparisons = command_syntax()
+    line = line.strip()
+    if line.startswith('{'):
+        import json
+        data = json.loads(line)
+        command = {
+            'field': data['field'],
+            'op': {'set': '=', 'add': '+=', 'sub': '-='}.get(data.get('op', 'set'), data.get('op')),
+            'value': data['value'],
+            'if': None
+        }
+        condition = data.get('if')
+        if condition:
+            command['if'] = (condition['field'], condition['op'], condition['value'])
+    else:
+        match = command_re.match(line)
+        if not match:
+            raise ValueError(f"не понимаю команду: {line}")
+        if_field, if_op, if_value, field, op, value = match.groups()
+        command = {'field': field, 'op': op, 'value': value.strip(), 'if': None}
+        if if_field:
+            command['if'] = (if_field, if_op, parse_number(if_value))
+        if field in FIELD_LIMITS:
+            command['value'] = parse_number(command['value'])
+    
+    field = command['field']
+    if field in FIELD_LIMITS:
+        value = command['value']
+        if not isinstance(value, (int, float)) or isinstance(value, bool):
+            raise ValueError(f"значение {field} должно быть числом: {value!r}")
+        if FIELD_TYPES[field] is int and not float(value).is_integer():
+            # Здоровье - целые проценты
+            raise ValueError(f"{field} должно быть целым: {value}")
+        if FIELD_TYPES[field] is int:
+            command['value'] = int(value)
+    if command['field'] not in FIELD_LIMITS and command['field'] not in TEXT_FIELDS:
+        raise ValueError(f"неизвестное поле: {command['field']}")
+    if command['op'] not in ('=', '+=', '-='):
+        raise ValueError(f"неизвестная операция: {command['op']}")
+    if command['field'] in TEXT_FIELDS and command['op'] != '=':
+        raise ValueError(f"поле {command['field']} можно только присвоить")
+    if command['if'] is not None:
+        if command['if'][0] not in FIELD_LIMITS or command['if'][1] not in comparisons:
+            raise ValueError(f"неверное условие: {command['if']}")
+    return command
+
+def apply_command(config, command):
+    """Применяет команду к конфигурации. Возвращает True, если она выполнилась"""
+    condition = command['if']
+    if condition is not None:
+        field, comparison, value = condition
+        if not command_syntax()[1][comparison](config[field], value):
+            return False
+    
+    field = command['field']
+    value = command['value']
+    if field in TEXT_FIELDS:
+        config[field] = str(value)
+        return True
+    
+    low, high = FIELD_LIMITS[field]
+    if command['op'] == '=':
+        if not low <= value <= high:
+            raise ValueError(f"{field} должно быть от {low} до {high}")
+        config[field] = value
+    else:
+        # Относительные изменения ограничиваются допустимым диапазоном
+        delta = value if command['op'] == '+=' else -value
+        config[field] = min(high, max(low, config[field] + delta))
+    return True
+
+def run_batch(lines, verbose=True):
+    """Применяет пачку команд к актуальному состоянию и сохраняет результат одной записью"""
+    commands = []
+    errors = 0
+    for number, line in enumerate(lines, 1):
+        if not line.strip() or line.lstrip().startswith('#'):
+            continue
+        try:
+            commands.append((number, parse_command(line)))
+        except (ValueError, KeyError, TypeError) as e:
+            errors += 1
+            print(f"✗ Ошибка в строке {number}: {e}")
+    
+    # Условия (if health < 20: ...) проверяются на состоянии под блокировкой файла
+    batch = {'applied': 0, 'errors': 0, 'config': None}
+    def apply(config):
+        batch.update(applied=0, errors=0, config=config)
+        for number, command in commands:
+            # Каждая команда - на копии: неверная не портит остальные
+            candidate = dict(config)
+            try:
+                if apply_command(candidate, command):
+                    validate_state(candidate)
+                    config.update(candidate)
+                    batch['applied'] += 1
+            except (ValueError, KeyError, TypeError) as e:
+                batch['errors'] += 1
+                print(f"✗ Ошибка в строке {number}: {e}")
+        return batch['applied'] or None
+    
+    try:
+        saved = store.modify(apply)
+    except (ValueError, OSError) as e:
+        print(f"✗ Ошибка сохранения: {e}")
+        saved = None
+    applied = batch['applied']
+    errors += batch['errors']
+    if applied and saved is None:
+        print("✗ Ошибка сохранения")
+        errors += 1
+    config = batch['config'] if batch['config'] is not None else load_config()
+    if verbose:
+        print(f"✓ Выполнено команд: {applied}, ошибок: {errors}")
+    return applied, errors, config
+
+def serve_connection(conn):
+    """Одно соединение сервера команд: каждая порция строк - одна запись и один ответ"""
+    import json
+    with conn, conn.makefile('rwb') as stream:
+        pending = b""
+        while True:
+            try:
+                chunk = stream.read1(65536)
+            except OSError:
+                break
+            if not chunk:
+                break
+            pending += chunk
+            *lines, pending = pending.split(b"\n")
+            if not lines:
+                continue
+            try:
+                applied, errors, config = run_batch(
+                    [line.decode('utf-8', 'replace') for line in lines], verbose=False)
+                reply = {'applied': applied, 'errors': errors,
+                         'health': config['health'], 'radiation': config['radiation'],
+                         'is_dead': config.get('is_dead', False)}
+            except Exception as e:
+                # Ошибка одной порции не роняет сервер: клиент получает ее текст
+                print(f"✗ Ошибка обработки команд: {e}")
+                reply = {'applied': 0, 'errors': len(lines), 'error': str(e)}
+            try:
+                stream.write((json.dumps(reply) + "\n").encode('utf-8'))
+                stream.flush()
+            except OSError:
+                break
+
+def serve(path=EDIT_SOCKET):
+    """Сервер команд. Каждое соединение - в своем потоке: медленный клиент не задерживает других"""
+    import os
+    import socket
+    import threading
+    
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    os.chmod(path, 0o666)
+    server.listen(8)
+    print(f"Сервер команд слушает {path}")
+    
+    try:
+        while True:
+            conn, _ = server.accept()
+            # Записи из разных потоков упорядочивает блокировка StateStore
+            threading.Thread(target=serve_connection, args=(conn,), daemon=True).start()
+    except KeyboardInterrupt:
+        print("\nСервер остановлен")
+    finally:
+        server.close()
+        os.unlink(path)
+
 if __name__ == "__main__":
     import sys
     
+    if len(sys.argv) > 1 and sys.argv[1] == "--batch":
+        # Пакетный режим: команды из файла или stdin
+        if len(sys.argv) > 2 and sys.argv[2] != "-":
+            with open(sys.argv[2], 'r', encoding='utf-8') as f:
+                applied, errors, _ = run_batch(f.readlines())
+        else:
+            applied, errors, _ = run_batch(sys.stdin)
+        sys.exit(1 if errors else 0)
+    
+    if len(sys.argv) > 1 and sys.argv[1] == "--serve":
+        serve(sys.argv[2] if len(sys.argv) > 2 else EDIT_SOCKET)
+        sys.exit(0)
+    
     if len(sys.argv) == 1:
         # Интерактивный режим
         edit_config()
@@ -196,6 +395,8 @@ if __name__ == "__main__":
                 print("Использование:")
                 print("  python3 edit_config.py --name 'Имя' --suit 'Костюм' --health 75 --radiation 1500")
                 print("  python3 edit_config.py (для интерактивного режима)")
+                print("  python3 edit_config.py --batch [файл]  (команды: health -= 15, if radiation >= 5000: health -= 10)")
+                print("  python3 edit_config.py --serve [сокет]  (сервер команд)")
                 sys.exit(1)
         
         quick_set(name, suit, health, radiation)
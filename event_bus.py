@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+import socket
+
+# Типы событий определены в event_names; здесь - для подписчиков
+from event_names import EVENT_MEDKIT, EVENT_DEATH, EVENT_RESURRECTION, EVENT_STATE  # noqa: F401
+
+# Сокет, через который демон рассылает события
+EVENT_SOCKET = "/tmp/stalker_events.sock"
+
+
+class EventPublisher:
+    """Рассылает события подписчикам через Unix сокет (JSON по строке на событие)"""
+
+    def __init__(self, path=EVENT_SOCKET):
+        self.path = path
+        self.subscribers = []
+
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(path)
+        # Дисплей может работать не от root
+        os.chmod(path, 0o666)
+        self.server.listen(16)
+        self.server.setblocking(False)
+
+    def _accept_pending(self):
+        """Принимает подписчиков, подключившихся с прошлого события"""
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            conn.setblocking(False)
+            self.subscribers.append(conn)
+
+    def publish(self, event_type, **data):
+        """Отправляет событие всем подписчикам. Медленные подписчики отключаются"""
+        self._accept_pending()
+        if not self.subscribers:
+            return 0
+
+        message = dict(data, type=event_type, time=time.time())
+        payload = (json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8")
+
+        alive = []
+        for conn in self.subscribers:
+            try:
+                if conn.send(payload) == len(payload):
+                    alive.append(conn)
+                    continue
+            except OSError:
+                pass
+            conn.close()
+        self.subscribers = alive
+        return len(alive)
+
+    def close(self):
+        for conn in self.subscribers:
+            conn.close()
+        self.subscribers = []
+        self.server.close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class EventSubscriber:
+    """Получает события демона. Если демон не запущен, connect() вернет False"""
+
+    def __init__(self, path=EVENT_SOCKET):
+        self.path = path
+        self.sock = None
+        self._buffer = b""
+
+    def connect(self):
+        """Подключается к демону. Возвращает True при успехе"""
+        self.close()
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            return False
+        sock.setblocking(False)
+        self.sock = sock
+        return True
+
+    @property
+    def connected(self):
+        return self.sock is not None
+
+    def fileno(self):
+        return None if self.sock is None else self.sock.fileno()
+
+    def read_events(self):
+        """Читает пришедшие события. При разрыве соединения подписчик отключается"""
+        if self.sock is None:
+            return []
+
+        closed = False
+        while True:
+            try:
+                chunk = self.sock.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                chunk = b""
+            if not chunk:
+                closed = True
+                break
+            self._buffer += chunk
+
+        events = []
+        *lines, self._buffer = self._buffer.split(b"\n")
+        for line in lines:
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                continue
+        # Закрываем после разбора: последние события перед выходом демона не теряются
+        if closed:
+            self.close()
+        return events
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+        self._buffer = b""
+
+
+def main():
+    """Печатает события демона (пример подписчика)"""
+    import select
+
+    subscriber = EventSubscriber()
+    if not subscriber.connect():
+        print(f"Не удалось подключиться к {EVENT_SOCKET}")
+        return
+    try:
+        while subscriber.connected:
+            select.select([subscriber.fileno()], [], [])
+            for event in subscriber.read_events():
+                print(json.dumps(event, ensure_ascii=False))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        subscriber.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import zlib
+import struct
+import threading
+from collections import namedtuple
+
+JOURNAL_FILE = "medkit_journal.bin"
+# Ротация: размер одного файла и число старых файлов (.1, .2, ...)
+JOURNAL_MAX_BYTES = 256 * 1024
+JOURNAL_BACKUPS = 4
+# Как часто буфер сбрасывается на диск с fsync (секунды)
+JOURNAL_FSYNC_INTERVAL = 5.0
+
+MAGIC = b"STJ2"
+# Прежний формат - без ID персонажа. Читается, но не дописывается
+MAGIC_V1 = b"STJ1"
+
+# Типы записей
+KIND_SNAPSHOT = 0
+KIND_MEDKIT = 1
+KIND_DEATH = 2
+KIND_RESURRECTION = 3
+
+KIND_NAMES = {
+    KIND_SNAPSHOT: "snapshot",
+    KIND_MEDKIT: "medkit",
+    KIND_DEATH: "death",
+    KIND_RESURRECTION: "resurrection"
+}
+
+# время, тип, Δздоровье, Δрадиация, здоровье, радиация, мертв, длина имени предмета,
+# длина ID персонажа
+RECORD_HEADER = struct.Struct("<dBhdhdBBB")
+RECORD_HEADER_V1 = struct.Struct("<dBhdhdBB")
+RECORD_CRC = struct.Struct("<I")
+
+# character - ID персонажа в режиме нескольких персонажей, "" - единственный персонаж
+JournalRecord = namedtuple("JournalRecord", [
+    "timestamp", "kind", "item", "health_delta", "radiation_delta",
+    "health", "radiation", "is_dead", "character"
+], defaults=("",))
+
+
+def encode_record(record):
+    """Упаковывает запись: заголовок, имя предмета, ID персонажа и CRC32"""
+    item = record.item.encode("utf-8")[:255]
+    character = record.character.encode("utf-8")[:255]
+    data = RECORD_HEADER.pack(
+        record.timestamp, record.kind, record.health_delta, record.radiation_delta,
+        record.health, record.radiation, int(record.is_dead),
+        len(item), len(character)) + item + character
+    return data + RECORD_CRC.pack(zlib.crc32(data))
+
+
+def _scan(data):
+    """Целые записи по порядку: (запись, смещение конца). Останавливается на первой
+    оборванной или испорченной записи"""
+    if data.startswith(MAGIC):
+        header = RECORD_HEADER
+    elif data.startswith(MAGIC_V1):
+        header = RECORD_HEADER_V1
+    else:
+        return
+    offset = len(MAGIC)
+    while offset + header.size <= len(data):
+        fields = header.unpack_from(data, offset)
+        item_start = offset + header.size
+        character_start = item_start + fields[7]
+        end = character_start + (fields[8] if header is RECORD_HEADER else 0)
+        if end + RECORD_CRC.size > len(data):
+            return
+        (crc,) = RECORD_CRC.unpack_from(data, end)
+        if zlib.crc32(data[offset:end]) != crc:
+            return
+        timestamp, kind, health_delta, radiation_delta, health, radiation, is_dead = fields[:7]
+        item = data[item_start:character_start].decode("utf-8", "replace")
+        character = data[character_start:end].decode("utf-8", "replace")
+        offset = end + RECORD_CRC.size
+        yield JournalRecord(timestamp, kind, item, health_delta, radiation_delta,
+                            health, radiation, bool(is_dead), character), offset
+
+
+def decode_records(data):
+    """Распаковывает записи. Оборванная или испорченная запись в конце отбрасывается"""
+    for record, _ in _scan(data):
+        yield record
+
+
+def valid_length(data):
+    """Длина начала файла, занятого целыми записями (0 - нет даже заголовка)"""
+    if not data.startswith((MAGIC, MAGIC_V1)):
+        return 0
+    end = len(MAGIC)
+    for _, end in _scan(data):
+        pass
+    return end
+
+
+def make_record(kind, item, old_state, new_state, timestamp=None, character=None):
+    """Создает запись по состоянию до и после события. character=None - единственный персонаж"""
+    return JournalRecord(
+        time.time() if timestamp is None else timestamp,
+        kind, item,
+        int(new_state['health']) - int(old_state['health']),
+        float(new_state['radiation']) - float(old_state['radiation']),
+        int(new_state['health']), float(new_state['radiation']),
+        bool(new_state.get('is_dead', False)),
+        "" if character is None else str(character))
+
+
+class JournalWriter:
+    """Буферизованная запись журнала с периодическим fsync и ротацией по размеру"""
+
+    def __init__(self, path=JOURNAL_FILE, max_bytes=JOURNAL_MAX_BYTES,
+                 backups=JOURNAL_BACKUPS, fsync_interval=JOURNAL_FSYNC_INTERVAL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.fsync_interval = fsync_interval
+        # ID персонажа -> последнее состояние ("" - единственный персонаж)
+        self.last_states = {}
+        # То же на конец уже записанной части журнала
+        self._flushed_states = {}
+        self._buffer = bytearray()
+        self._timer = None
+        self._lock = threading.Lock()
+        self._repair()
+
+    def _repair(self):
+        """Отрезает оборванный хвост (сбой посреди записи). Иначе все, что допишется
+        после него, читатель не увидит: он останавливается на первой плохой CRC"""
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        length = valid_length(data)
+        if length != len(data):
+            print(f"Journal {self.path}: dropped {len(data) - length} bytes of a torn record")
+            os.truncate(self.path, length)
+        if data.startswith(MAGIC_V1):
+            # Старый формат не дописываем - он уходит в .1, новые записи идут в новый файл
+            self._rotate()
+
+    def append(self, record):
+        """Добавляет запись в буфер. На диск она попадет не позже fsync_interval"""
+        with self._lock:
+            self._buffer += encode_record(record)
+            self.last_states[record.character] = {
+                'health': record.health, 'radiation': record.radiation,
+                'is_dead': record.is_dead}
+            if self.fsync_interval <= 0:
+                self._flush_locked()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.fsync_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def snapshot(self, state, character=None):
+        """Записывает полное состояние - точку, с которой начинается воспроизведение"""
+        self.append(make_record(KIND_SNAPSHOT, "", state, state, character=character))
+
+    def flush(self):
+        """Сбрасывает буфер на диск с fsync"""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._buffer:
+            return
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            size = 0
+        if size and size + len(self._buffer) > self.max_bytes:
+            self._rotate()
+            size = 0
+
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            if size == 0:
+                os.write(fd, MAGIC)
+            os.write(fd, bytes(self._buffer))
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        self._buffer.clear()
+        self._flushed_states = dict(self.last_states)
+
+    def _rotate(self):
+        """Сдвигает старые файлы (.1 -> .2 ...) и начинает новый со снимка состояния"""
+        for i in range(self.backups - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.unlink(self.path)
+        # Новый файл должен воспроизводиться без старых - снимок каждого персонажа
+        first = bytearray()
+        for character, state in self._flushed_states.items():
+            first += encode_record(make_record(KIND_SNAPSHOT, "", state, state, character=character))
+        self._buffer[:0] = first
+
+    def close(self):
+        self.flush()
+
+
+def journal_files(path=JOURNAL_FILE, backups=JOURNAL_BACKUPS):
+    """Файлы журнала от старых к новым"""
+    files = [f"{path}.{i}" for i in range(backups, 0, -1)] + [path]
+    return [f for f in files if os.path.exists(f)]
+
+
+def read_journal(path=JOURNAL_FILE, backups=JOURNAL_BACKUPS):
+    """Читает все записи журнала по порядку"""
+    for filename in journal_files(path, backups):
+        with open(filename, 'rb') as f:
+            data = f.read()
+        yield from decode_records(data)
+
+
+def history(path=JOURNAL_FILE, since=None, until=None, kinds=None, character=None):
+    """Записи за период (timestamp) с фильтром по типу и персонажу"""
+    for record in read_journal(path):
+        if character is not None and record.character != str(character):
+            continue
+        if since is not None and record.timestamp < since:
+            continue
+        if until is not None and record.timestamp > until:
+            continue
+        if kinds is not None and record.kind not in kinds:
+            continue
+        yield record
+
+
+def replay_all(records):
+    """Восстанавливает состояние каждого персонажа по его последней записи: {ID: состояние}.
+
+    Каждая запись хранит состояние после события целиком; разности - только для
+    отчета. Поэтому изменения мимо журнала (edit_config, ручная правка) не копятся в ошибку"""
+    states = {}
+    for record in records:
+        states[record.character] = {'health': record.health, 'radiation': record.radiation,
+                                    'is_dead': record.is_dead}
+    return states
+
+
+def replay(records, character=""):
+    """Состояние одного персонажа ("" - единственный); None, если записей о нем нет"""
+    return replay_all(records).get(str(character))
+
+
+def main():
+    """Печатает журнал и восстановленное по нему состояние"""
+    import sys
+
+    path = sys.argv[1] if len(sys.argv) > 1 else JOURNAL_FILE
+    records = list(read_journal(path))
+    for record in records:
+        item = f"{record.character}/{record.item}" if record.character else record.item
+        print(f"{time.ctime(record.timestamp)}  {KIND_NAMES.get(record.kind, record.kind):<12} "
+              f"{item:<20} health {record.health_delta:+4d} -> {record.health:3d}  "
+              f"radiation {record.radiation_delta:+9.1f} -> {record.radiation:8.1f}"
+              f"{'  DEAD' if record.is_dead else ''}")
+    for character, state in sorted(replay_all(records).items()):
+        print(f"Состояние{' ' + character if character else ''}: {state}")
+
+
+if __name__ == "__main__":
+    main()
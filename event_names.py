@@ -0,0 +1,9 @@
+#!/usr/bin/env python3
+
+# Типы событий демона. Отдельно от event_bus: модулям, которым нужны только имена
+# (демон до запуска рассылки, звуки), не нужен socket
+
+EVENT_MEDKIT = "medkit"
+EVENT_DEATH = "death"
+EVENT_RESURRECTION = "resurrection"
+EVENT_STATE = "state"
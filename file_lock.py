@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+import os
+import time
+
+from metrics import LOCK_WAIT_SECONDS, LOCK_HOLD_SECONDS, LOCK_CONTENDED
+
+
+def lock_path(path):
+    """Файл блокировки рядом с данными: stalker_config.json -> .stalker_config.json.lock.
+
+    Сам файл данных блокировать нельзя: атомарная запись подменяет его новым inode"""
+    directory, name = os.path.split(os.path.abspath(path))
+    return os.path.join(directory, f".{name}.lock")
+
+
+class FileLock:
+    """Рекомендательная блокировка fcntl.flock между процессами-писателями.
+
+    Повторный вход из того же потока не блокирует (нужен снаружи threading.RLock
+    владельца: flock не различает потоки одного процесса). Читатели ее не берут"""
+
+    def __init__(self, path):
+        self.path = lock_path(path)
+        self._fd = None
+        self._depth = 0
+        self._acquired_at = 0.0
+
+    def acquire(self):
+        import fcntl
+
+        self._depth += 1
+        if self._depth > 1:
+            return
+        if self._fd is None:
+            try:
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+            except OSError:
+                # Каталог только для чтения - писать все равно некуда, работаем без блокировки
+                return
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            LOCK_CONTENDED.inc()
+            start = time.perf_counter()
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            LOCK_WAIT_SECONDS.observe(time.perf_counter() - start)
+        self._acquired_at = time.perf_counter()
+
+    def release(self):
+        import fcntl
+
+        self._depth -= 1
+        if self._depth > 0 or self._fd is None:
+            return
+        LOCK_HOLD_SECONDS.observe(time.perf_counter() - self._acquired_at)
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import select
+import struct
+
+# Флаги inotify (linux/inotify.h)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+INOTIFY_EVENT = struct.Struct("iIII")
+
+# Интервал проверки файла, если inotify недоступен
+STAT_POLL_INTERVAL = 0.5
+
+
+def _load_libc():
+    try:
+        import ctypes
+        # Символы libc уже есть в процессе - без find_library (он запускает ldconfig)
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.inotify_init1
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class FileWatcher:
+    """Ждет изменения файла через inotify, а без него - через stat"""
+
+    def __init__(self, path, poll_interval=STAT_POLL_INTERVAL, use_inotify=True):
+        self.path = os.path.abspath(path)
+        self.directory, self.filename = os.path.split(self.path)
+        self.poll_interval = poll_interval
+        self.fd = None
+        self._stamp = self._file_stamp()
+
+        libc = _load_libc() if use_inotify else None
+        if libc is not None:
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd >= 0:
+                # Следим за каталогом: атомарная запись заменяет файл переименованием.
+                # IN_MODIFY не нужен: он приходит на каждый write, а запись в файл целиком
+                # заканчивается IN_CLOSE_WRITE
+                mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+                if libc.inotify_add_watch(fd, os.fsencode(self.directory), mask) >= 0:
+                    self.fd = fd
+                else:
+                    os.close(fd)
+
+    @property
+    def uses_inotify(self):
+        return self.fd is not None
+
+    def fileno(self):
+        """Дескриптор для select/poll (None в режиме опроса)"""
+        return self.fd
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def read_events(self):
+        """Читает накопившиеся события inotify. Возвращает True, если файл изменился"""
+        changed = False
+        while True:
+            try:
+                data = os.read(self.fd, 4096)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            offset = 0
+            while offset + INOTIFY_EVENT.size <= len(data):
+                _, _, _, name_len = INOTIFY_EVENT.unpack_from(data, offset)
+                start = offset + INOTIFY_EVENT.size
+                name = data[start:start + name_len].rstrip(b"\0")
+                if os.fsdecode(name) == self.filename:
+                    changed = True
+                offset = start + name_len
+        return changed
+
+    def wait(self, timeout=None):
+        """Блокируется до изменения файла. Возвращает True, если файл изменился"""
+        if self.fd is None:
+            return self._wait_stat(timeout)
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            ready, _, _ = select.select([self.fd], [], [], remaining)
+            if not ready:
+                return False
+            if self.read_events():
+                return True
+
+    def _wait_stat(self, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            stamp = self._file_stamp()
+            if stamp != self._stamp:
+                self._stamp = stamp
+                return True
+            if deadline is None:
+                time.sleep(self.poll_interval)
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(self.poll_interval, remaining))
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+import os
+import json
+
+CATALOG_FILE = "items.json"
+
+# Встроенный каталог предметов (используется, если items.json нет или он испорчен)
+DEFAULT_ITEMS = {
+    "medkit_regular.txt": {
+        "name": "Обычная аптечка",
+        "health_restore": 60,
+        "radiation_reduce": 10,
+        "sound": "medkit"
+    },
+    "medkit_military.txt": {
+        "name": "Армейская аптечка",
+        "health_restore": 100,
+        "radiation_reduce": 10,
+        "sound": "medkit"
+    },
+    "medkit_science.txt": {
+        "name": "Научная аптечка",
+        "health_restore": 100,
+        "radiation_reduce": 100,
+        "sound": "medkit"
+    },
+    "antidote.txt": {
+        "name": "Антидот",
+        "health_restore": 0,
+        "radiation_reduce": 100,
+        "sound": "antidote"
+    },
+    "vodka.txt": {
+        "name": "Водка",
+        "health_restore": 0,
+        "radiation_reduce": 30,
+        "sound": "vodka"
+    },
+    "ressurect.txt": {
+        "name": "Воскрешение",
+        "health_restore": 100,  # Воскрешает с 100% здоровья
+        "radiation_reduce": 100,
+        "is_ressurect": True,  # Флаг воскрешения
+        "reusable": True,  # Не помечается как использованное
+        "sound": "resurrect"
+    }
+}
+
+# Поля предмета, которые влияют на состояние персонажа
+EFFECT_FIELDS = ("health_restore", "radiation_reduce", "is_ressurect")
+
+
+def compile_items(items):
+    """Проверяет описания предметов и строит таблицы поиска"""
+    effects = {}
+    info = {}
+    for filename, item in items.items():
+        try:
+            item_effects = {
+                "health_restore": item["health_restore"],
+                "radiation_reduce": item["radiation_reduce"]
+            }
+            if not all(isinstance(v, (int, float)) and not isinstance(v, bool)
+                       for v in item_effects.values()):
+                raise ValueError("effects must be numbers")
+            # Здоровье - целое число процентов (validate_state не примет 12.5)
+            if not isinstance(item_effects["health_restore"], int):
+                raise ValueError("health_restore must be an integer")
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"Skipping item {filename}: {e}")
+            continue
+        if item.get("is_ressurect", False):
+            item_effects["is_ressurect"] = True
+        effects[filename] = item_effects
+        info[filename] = {
+            "name": item.get("name", "Неизвестная"),
+            "reusable": bool(item.get("reusable", False)),
+            "sound": item.get("sound")
+        }
+    return effects, info
+
+
+class ItemCatalog:
+    """Каталог предметов из items.json. Перечитывается при изменении файла"""
+
+    def __init__(self, path=CATALOG_FILE):
+        self.path = path
+        # Увеличивается при каждой перезагрузке каталога
+        self.generation = 0
+        self._stamp = None
+        # Файл, который не удалось загрузить: перечитывается, но ошибка печатается один раз
+        self._failed_stamp = None
+        self._load(DEFAULT_ITEMS)
+        self.refresh()
+
+    def _load(self, items):
+        self.effects, self.info = compile_items(items)
+        # Порядок в файле - приоритет, если на флешке несколько предметов
+        self.priority = {filename: i for i, filename in enumerate(self.effects)}
+        self.filenames = frozenset(self.effects)
+        self.generation += 1
+
+    def refresh(self):
+        """Перечитывает каталог, если файл изменился. Возвращает True при перезагрузке"""
+        try:
+            st = os.stat(self.path)
+            stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            stamp = None
+        if stamp == self._stamp:
+            return False
+
+        if stamp is None:
+            self._stamp = stamp
+            self._load(DEFAULT_ITEMS)
+            return True
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                items = json.load(f)["items"]
+            if not isinstance(items, dict):
+                raise TypeError(f"\"items\" must be an object, not {type(items).__name__}")
+            self._load(items)
+        except Exception as e:
+            # Оставляем предыдущий каталог; метку не запоминаем - файл перечитаем снова
+            if stamp != self._failed_stamp:
+                print(f"Error loading item catalog: {e}")
+                self._failed_stamp = stamp
+            return False
+        self._stamp = stamp
+        self._failed_stamp = None
+        print(f"📦 Каталог предметов загружен: {len(self.effects)} шт.")
+        return True
+
+    def match(self, names):
+        """Находит предмет среди имен файлов на флешке (одно пересечение множеств)"""
+        found = self.filenames.intersection(names)
+        if not found:
+            return None
+        return min(found, key=self.priority.__getitem__)
+
+    def display_name(self, filename):
+        return self.info.get(filename, {}).get("name", "Неизвестная")
+
+    def is_reusable(self, filename):
+        return self.info.get(filename, {}).get("reusable", False)
+
+    def sound(self, filename):
+        return self.info.get(filename, {}).get("sound")
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+
+import os
+import asyncio
+import logging
+import threading
+
+from medkit_daemon import MedkitDaemon, MEDKIT_USED_FILE, CONFIG_COALESCE_WINDOW, EVENT_MEDKIT
+from state_store import StateStore, CONFIG_FILE
+from usb_io import create_used_marker, mount_device
+from metrics import (MOUNT_SECONDS, APPLY_SECONDS, MOUNT_FAILURES, MEDKITS_APPLIED,
+                     MEDKITS_REJECTED, DAEMON_ERRORS)
+
+# Сколько ждать mount/touch/sync, прежде чем считать флешку зависшей
+SUBPROCESS_TIMEOUT = 10
+
+log = logging.getLogger("medkit.async")
+
+
+class AsyncMedkitDaemon:
+    """Демон аптечек на asyncio: каждая флешка обрабатывается в своей задаче"""
+
+    def __init__(self, daemon=None, subprocess_timeout=SUBPROCESS_TIMEOUT, use_sudo=False,
+                 characters=None):
+        if daemon is None:
+            # Конфиг записывает отдельная корутина, а не таймер в потоке
+            if characters is not None:
+                characters.coalesce_window = None
+            daemon = MedkitDaemon(store=StateStore(CONFIG_FILE, coalesce_window=None),
+                                  use_sudo=use_sudo, characters=characters)
+        self.daemon = daemon
+        self.subprocess_timeout = subprocess_timeout
+        self.drive_tasks = {}
+        self.config_dirty = None
+        self.log_queue = None
+
+    async def run_command(self, *args):
+        """Запускает команду без блокировки цикла. Возвращает (код, stderr)"""
+        process = await asyncio.create_subprocess_exec(
+            *args, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+        try:
+            _, stderr = await asyncio.wait_for(process.communicate(), self.subprocess_timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            return None, f"timeout after {self.subprocess_timeout}s: {' '.join(args)}"
+        return process.returncode, stderr.decode(errors="replace")
+
+    async def run_io(self, func, *args):
+        """Выполняет файловую операцию в потоке исполнителя с тайм-аутом"""
+        loop = asyncio.get_running_loop()
+        return await asyncio.wait_for(loop.run_in_executor(None, func, *args),
+                                      self.subprocess_timeout)
+
+    async def auto_mount(self, device="/dev/sda1", mount_point="/media/usb0"):
+        """Монтирует флешку, если устройство есть, но не смонтировано"""
+        if not os.path.exists(device) or os.path.ismount(mount_point):
+            return
+        log.debug("mount device=%s mount_point=%s", device, mount_point)
+        with MOUNT_SECONDS.time():
+            if not await self.mount(device, mount_point):
+                MOUNT_FAILURES.inc()
+
+    async def mount(self, device, mount_point):
+        """Монтирует напрямую или через sudo. Возвращает True при успехе"""
+        if not self.daemon.use_sudo:
+            try:
+                await self.run_io(mount_device, device, mount_point)
+                print("✅ USB flash drive auto-mounted")
+                return True
+            except PermissionError:
+                log.debug("no mount capability, using sudo device=%s", device)
+            except (OSError, asyncio.TimeoutError) as e:
+                log.warning("mount failed device=%s: %s", device, e)
+                return False
+        returncode, stderr = await self.run_command('mkdir', '-p', mount_point)
+        if returncode != 0:
+            print(f"Mount error: {stderr}")
+            return False
+        returncode, stderr = await self.run_command('sudo', 'mount', device, mount_point)
+        if returncode == 0:
+            print("✅ USB flash drive auto-mounted")
+            return True
+        log.warning("mount failed device=%s: %s", device, stderr)
+        return False
+
+    async def mark_medkit_used(self, drive_path, medkit_file):
+        """Помечает аптечку как использованную (кроме воскрешения)"""
+        if self.daemon.catalog.is_reusable(medkit_file):
+            print("♻️ Воскрешение можно использовать многократно")
+            return True
+
+        used_file = os.path.join(drive_path, MEDKIT_USED_FILE)
+        if not self.daemon.use_sudo:
+            try:
+                await self.run_io(create_used_marker, used_file)
+                print("✅ Аптечка помечена как использованная")
+                return True
+            except PermissionError:
+                pass
+            except (OSError, asyncio.TimeoutError) as e:
+                print(f"❌ Ошибка пометки аптечки: {e}")
+                return False
+
+        returncode, stderr = await self.run_command('sudo', 'touch', used_file)
+        if returncode != 0:
+            print(f"❌ Ошибка создания USED.txt: {stderr}")
+            return False
+
+        returncode, stderr = await self.run_command('sudo', 'sync', used_file)
+        if returncode is None:
+            print(f"❌ Ошибка синхронизации: {stderr}")
+
+        print("✅ Аптечка помечена как использованная")
+        return True
+
+    async def handle_drive(self, drive):
+        """Проверяет одну флешку и применяет аптечку"""
+        loop = asyncio.get_running_loop()
+        daemon = self.daemon
+
+        # Медленная флешка не должна тормозить остальные
+        if not await loop.run_in_executor(None, daemon.is_usb_drive, drive):
+            return False
+        medkit_info = await loop.run_in_executor(None, daemon.check_medkit_on_drive, drive)
+        if not medkit_info:
+            return False
+
+        with APPLY_SECONDS.time():
+            used = await self.apply_medkit(drive, medkit_info)
+        if used:
+            MEDKITS_APPLIED.inc()
+        else:
+            MEDKITS_REJECTED.inc()
+            log.info("medkit not applied item=%s drive=%s", medkit_info[0], drive)
+        return used
+
+    def apply_blocking(self, drive, medkit_file, effects):
+        """Владелец, хранилище и применение аптечки - в потоке исполнителя.
+
+        Здесь чтение флешки, блокировка файла и fsync журнала транзакций: в цикле
+        событий они останавливали бы все остальные флешки. Возвращает
+        (владелец, хранилище, результат apply_to_store) или None"""
+        daemon = self.daemon
+        owner = daemon.drive_owner(drive)
+        store = daemon.store_for(owner)
+        if store is None:
+            return None
+        # Запись begin (с fsync) в том же шаге, что и изменение состояния
+        applied = daemon.apply_to_store(store, medkit_file, effects, owner, drive)
+        if applied is None:
+            return None
+        return owner, store, applied
+
+    async def apply_medkit(self, drive, medkit_info):
+        """Применяет найденную аптечку к владельцу флешки"""
+        loop = asyncio.get_running_loop()
+        daemon = self.daemon
+        medkit_file, effects, _ = medkit_info
+        log.debug("using item=%s effects=%s drive=%s", medkit_file, effects, drive)
+
+        # Без тайм-аута: брошенное ожидание не отменит уже начатую транзакцию в потоке
+        result = await loop.run_in_executor(None, self.apply_blocking, drive, medkit_file, effects)
+        if result is None:
+            return False
+        owner, store, applied = result
+        (health_restored, radiation_reduced), old_state, config, txid = applied
+        was_dead = old_state.get('is_dead', False)
+        self.config_dirty.set()
+        daemon.publish_state_change(config, was_dead, owner)
+
+        if await self.mark_medkit_used(drive, medkit_file):
+            if txid is not None:
+                await loop.run_in_executor(None, daemon.finish_transactions, [txid], store)
+        else:
+            # Лечение уже применено; метку создадим, когда флешка появится снова
+            log.warning("USED.txt not created, will retry drive=%s item=%s", drive, medkit_file)
+
+        await loop.run_in_executor(None, daemon.remember_used, drive, medkit_file)
+        self.log_queue.put_nowait((medkit_file, old_state, dict(config), owner))
+        log_message = daemon.medkit_log_message(medkit_file, health_restored, radiation_reduced)
+        print(f"💊 {log_message}")
+        daemon.publish(EVENT_MEDKIT, item=medkit_file, health_restored=health_restored,
+                       radiation_reduced=radiation_reduced, state=config, character=owner)
+        print(f"Medkit used from {drive}")
+        return True
+
+    def start_drive_task(self, drive):
+        """Запускает обработку флешки, если она еще не обрабатывается"""
+        task = self.drive_tasks.get(drive)
+        if task is not None and not task.done():
+            return
+        task = asyncio.ensure_future(self.handle_drive(drive))
+        self.drive_tasks[drive] = task
+        task.add_done_callback(self._drive_task_done)
+
+    def _drive_task_done(self, task):
+        if not task.cancelled() and task.exception() is not None:
+            DAEMON_ERRORS.inc()
+            log.error("error in drive task", exc_info=task.exception())
+
+    async def detect_events(self, watcher):
+        """Корутина обнаружения: ждет событий монтирования в отдельном потоке"""
+        loop = asyncio.get_running_loop()
+        changes = asyncio.Queue()
+
+        def watch():
+            # Фоновый поток не мешает завершению цикла событий
+            while True:
+                change = watcher.wait()
+                try:
+                    loop.call_soon_threadsafe(changes.put_nowait, change)
+                except RuntimeError:
+                    return
+
+        threading.Thread(target=watch, daemon=True).start()
+
+        await self.auto_mount()
+        self.daemon.update_mounts(watcher.mounts)
+        for drive in list(watcher.mounts):
+            self.start_drive_task(drive)
+
+        while True:
+            change = await changes.get()
+            self.daemon.scheduler.wakeup(adapt=False)
+            self.daemon.update_mounts(watcher.mounts)
+            for device in change.devices:
+                if device == "/dev/sda1":
+                    asyncio.ensure_future(self.auto_mount(device))
+            for drive in change.added:
+                log.debug("mount added drive=%s", drive)
+                self.start_drive_task(drive)
+
+    async def detect_polling(self):
+        """Корутина обнаружения с опросом (запасной режим)"""
+        loop = asyncio.get_running_loop()
+        scheduler = self.daemon.scheduler
+        seen = set()
+        while True:
+            scheduler.wakeup()
+            # find_usb_drives сам монтирует /dev/sda1 (в потоке исполнителя)
+            drives = await loop.run_in_executor(None, self.daemon.find_usb_drives)
+            for drive in drives:
+                self.start_drive_task(drive)
+            # Интервал как у синхронного демона: короткий после новой флешки, в простое растет
+            if set(drives) - seen:
+                scheduler.activity()
+            seen = set(drives)
+            scheduler.set_critical(await loop.run_in_executor(None, self.daemon.critical_health))
+            await asyncio.sleep(scheduler.delay())
+
+    async def config_writer(self, window=CONFIG_COALESCE_WINDOW):
+        """Корутина записи конфига: объединяет изменения за окно в одну запись"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.config_dirty.wait()
+            await asyncio.sleep(window)
+            self.config_dirty.clear()
+            await loop.run_in_executor(None, self.daemon.store.flush)
+            if self.daemon.characters is not None:
+                await loop.run_in_executor(None, self.daemon.characters.flush)
+            await loop.run_in_executor(None, self.daemon.commit_durable)
+
+    async def simulation_loop(self):
+        """Корутина симуляции радиации: спит до ближайшего тика"""
+        while True:
+            await asyncio.sleep(self.daemon.simulation_delay())
+            self.daemon.run_simulation()
+
+    async def log_writer(self):
+        """Корутина записи журнала событий"""
+        loop = asyncio.get_running_loop()
+        while True:
+            entry = await self.log_queue.get()
+            await loop.run_in_executor(None, self.daemon.record_medkit_use, *entry)
+
+    async def main(self, poll=False, watcher=None):
+        self.config_dirty = asyncio.Event()
+        self.log_queue = asyncio.Queue()
+
+        if poll:
+            detector = self.detect_polling()
+        else:
+            if watcher is None:
+                try:
+                    from mount_watcher import MountWatcher
+                    watcher = MountWatcher()
+                except (OSError, ValueError) as e:
+                    print(f"Mount events unavailable ({e}), falling back to polling")
+            detector = self.detect_polling() if watcher is None else self.detect_events(watcher)
+
+        print("Medkit daemon (asyncio) started.")
+        coros = [detector, self.config_writer(), self.log_writer()]
+        if self.daemon.simulation is not None:
+            coros.append(self.simulation_loop())
+        tasks = [asyncio.ensure_future(coro) for coro in coros]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks + list(self.drive_tasks.values()):
+                task.cancel()
+            while not self.log_queue.empty():
+                self.daemon.record_medkit_use(*self.log_queue.get_nowait())
+
+    def run(self, poll=False, watcher=None):
+        """Основной цикл мониторинга"""
+        daemon = self.daemon
+        daemon.recover_transactions()
+        daemon.start_journal()
+        if daemon.publisher is None:
+            try:
+                from event_bus import EventPublisher
+                daemon.publisher = EventPublisher()
+            except OSError as e:
+                print(f"Event socket unavailable: {e}")
+        try:
+            asyncio.run(self.main(poll=poll, watcher=watcher))
+        except KeyboardInterrupt:
+            print("Medkit daemon stopped.")
+        finally:
+            daemon.store.close()
+            if daemon.characters is not None:
+                daemon.characters.close()
+            daemon.commit_durable()
+            daemon.journal.close()
+            if daemon.publisher is not None:
+                daemon.publisher.close()
@@ -1,95 +1,318 @@
 #!/usr/bin/env python3
 
 import os
-import json
+import stat
 import time
-import subprocess
-from pathlib import Path
+import threading
+
+from state_store import StateStore, CONFIG_FILE
+from event_names import EVENT_MEDKIT, EVENT_DEATH, EVENT_RESURRECTION, EVENT_STATE
+from mount_watcher import read_media_mounts
+# Каталог, журналы, метрики, персонажи и планировщик импортируются и создаются при первом
+# использовании: balance.py и другие модули берут отсюда только функции
 
-CONFIG_FILE = "stalker_config.json"
 MEDKIT_USED_FILE = "USED.txt"
+BY_UUID_DIR = "/dev/disk/by-uuid"
+# Несколько аптечек, вставленных одновременно, сохраняются одной записью
+CONFIG_COALESCE_WINDOW = 0.2
+
+
+class _Log:
+    """Логгер демона. logging (десятки миллисекунд импорта) загружается только ради записи,
+    которая будет выведена: без --log-level это предупреждения и ошибки"""
+
+    # Порог как у logging: DEBUG 10, INFO 20, WARNING 30, ERROR 40
+    level = 30
+
+    def __init__(self, name):
+        self.name = name
+
+    def _log(self, level, msg, *args, **kwargs):
+        if level < self.level:
+            return
+        import logging
+        logging.getLogger(self.name).log(level, msg, *args, **kwargs)
+
+    def debug(self, msg, *args, **kwargs):
+        self._log(10, msg, *args, **kwargs)
+
+    def info(self, msg, *args, **kwargs):
+        self._log(20, msg, *args, **kwargs)
+
+    def warning(self, msg, *args, **kwargs):
+        self._log(30, msg, *args, **kwargs)
+
+    def exception(self, msg, *args, **kwargs):
+        self._log(40, msg, *args, exc_info=True, **kwargs)
+
+
+log = _Log("medkit")
+
+def apply_medkit_effects(config, effects, verbose=True):
+    """Применяет эффекты аптечки к состоянию. Возвращает (здоровье, радиация) или None.
+
+    Общая для демона и калькулятора баланса (balance.py)"""
+    is_ressurect = effects.get('is_ressurect', False)
+    is_dead = config.get('is_dead', False)
+    log.debug("apply is_dead=%s is_ressurect=%s", is_dead, is_ressurect)
+    
+    # ЛОГИКА СМЕРТИ И ВОСКРЕШЕНИЯ
+    if is_dead and not is_ressurect:
+        if verbose:
+            print("💀 Сталкер мертв! Нужно воскрешение.")
+        return None
+    
+    # Если сталкер мертв и это воскрешение - воскрешаем
+    if is_dead and is_ressurect:
+        config['is_dead'] = False
+        config['health'] = 100
+        config['radiation'] = 0
+        if verbose:
+            print("✨ Сталкер воскрешен полностью здоровым!")
+        health_restored = 100
+        radiation_reduced = config['radiation']
+    else:
+        # Применяем обычные эффекты
+        old_health = config['health']
+        old_radiation = config['radiation']
+        
+        config['health'] = min(100, config['health'] + effects['health_restore'])
+        health_restored = config['health'] - old_health
+        
+        radiation_reduce = (effects['radiation_reduce'] / 100) * config['radiation']
+        config['radiation'] = max(0, config['radiation'] - radiation_reduce)
+        radiation_reduced = old_radiation - config['radiation']
+        
+        # Проверяем смерть после эффектов
+        if config['health'] <= 0:
+            config['is_dead'] = True
+            config['health'] = 0
+            if verbose:
+                print("💀 Сталкер умер!")
+    
+    log.debug("final state health=%s radiation=%s is_dead=%s",
+              config['health'], config['radiation'], config.get('is_dead', False))
+    return health_restored, radiation_reduced
 
-# Типы аптечек и их эффекты
-MEDKIT_TYPES = {
-    "medkit_regular.txt": {  # Обычная аптечка
-        "health_restore": 60,
-        "radiation_reduce": 10
-    },
-    "medkit_military.txt": {  # Армейская аптечка
-        "health_restore": 100, 
-        "radiation_reduce": 10
-    },
-    "medkit_science.txt": {  # Научная аптечка
-        "health_restore": 100,
-        "radiation_reduce": 100
-    },
-    "antidote.txt": {  # Антидот
-        "health_restore": 0,
-        "radiation_reduce": 100
-    },
-    "vodka.txt": {  # Водка
-        "health_restore": 0, 
-        "radiation_reduce": 30
-    },
-    "ressurect.txt": {  # Воскрешение
-        "health_restore": 100,  # Воскрешает с 100% здоровья
-        "radiation_reduce": 100,
-        "is_ressurect": True  # Флаг воскрешения
-    }
-}
 
 class MedkitDaemon:
-    def __init__(self):
+    def __init__(self, store=None, publisher=None, use_sudo=False, catalog=None, journal=None,
+                 characters=None, ledger=None):
+        # Таблица персонажей (CharacterTable) в режиме нескольких КПК, иначе None
+        self.characters = characters
+        # Симуляция радиации (SimulationEngine), включается enable_simulation()
+        self.simulation = None
+        # Журнал событий (вместо medkit_log.txt); None - создается при первой записи
+        self._journal = journal
+        # Журнал транзакций использования аптечек (состояние и USED.txt - ровно один раз)
+        self._ledger = ledger
+        # (txid, хранилище): метка создана, ждем записи состояния на диск
+        self.unflushed_txids = []
+        # Каталог предметов (items.json), перечитывается без перезапуска
+        self._catalog = catalog
+        # UUID флешек, аптечки с которых уже использованы
         self.used_medkits = set()
+        # Индекс содержимого флешек: (устройство, поколение монтирования) -> запись
+        self.medkit_index = {}
+        self.mount_generations = {}
+        # Индекс, used_medkits и unflushed_txids меняются и из потоков исполнителя (medkit_async).
+        # Под блокировкой только работа со словарями - сканирование медленной флешки идет без нее
+        self.index_lock = threading.RLock()
+        # Каталог ссылок на устройства по UUID (подменяется в стенде с фальшивым корнем)
+        self.by_uuid_dir = BY_UUID_DIR
+        # True - монтировать и помечать аптечки через sudo (как раньше)
+        self.use_sudo = use_sudo
+        self.store = store if store is not None else StateStore(CONFIG_FILE, coalesce_window=CONFIG_COALESCE_WINDOW)
+        # Рассылка событий дисплею и другим подписчикам
+        self.publisher = publisher
+        # Звуки событий (audio_cues.CueTrigger), включаются --audio
+        self.cues = None
+        # Интервал опроса флешек; --low-power заменяет его адаптивным
+        self._scheduler = None
+
+    @property
+    def journal(self):
+        if self._journal is None:
+            from event_journal import JournalWriter
+            self._journal = JournalWriter()
+        return self._journal
+
+    @property
+    def ledger(self):
+        if self._ledger is None:
+            from consumption_ledger import ConsumptionLedger
+            self._ledger = ConsumptionLedger()
+        return self._ledger
+
+    @property
+    def catalog(self):
+        if self._catalog is None:
+            from item_catalog import ItemCatalog
+            self._catalog = ItemCatalog()
+        return self._catalog
+
+    @property
+    def scheduler(self):
+        if self._scheduler is None:
+            from power_scheduler import AdaptiveScheduler
+            self._scheduler = AdaptiveScheduler("daemon")
+        return self._scheduler
+
+    @scheduler.setter
+    def scheduler(self, scheduler):
+        self._scheduler = scheduler
     
+    def publish(self, event_type, **data):
+        """Отправляет событие подписчикам (если рассылка включена)"""
+        if self.cues is not None:
+            # Только постановка в очередь - микшер работает в своем потоке
+            self.cues.on_event(dict(data, type=event_type))
+        if self.publisher is None:
+            return
+        try:
+            self.publisher.publish(event_type, **data)
+        except Exception as e:
+            print(f"Error publishing event: {e}")
+    
+    def auto_mount(self, device="/dev/sda1", mount_point="/media/usb0"):
+        """Монтирует флешку, если устройство есть, но не смонтировано"""
+        if os.path.exists(device) and not os.path.ismount(mount_point):
+            from usb_io import mount_device, mount_device_sudo
+            from metrics import MOUNT_SECONDS, MOUNT_FAILURES
+            try:
+                log.debug("mount device=%s mount_point=%s", device, mount_point)
+                with MOUNT_SECONDS.time():
+                    if self.use_sudo:
+                        mount_device_sudo(device, mount_point)
+                    else:
+                        try:
+                            mount_device(device, mount_point)
+                        except PermissionError:
+                            # Нет CAP_SYS_ADMIN - монтируем через sudo
+                            log.debug("no mount capability, using sudo device=%s", device)
+                            mount_device_sudo(device, mount_point)
+                print("✅ USB flash drive auto-mounted")
+            except Exception as e:
+                MOUNT_FAILURES.inc()
+                log.warning("mount failed device=%s: %s", device, e)
+
     def find_usb_drives(self):
         """Находит все подключенные USB флешки"""
         usb_drives = []
         
-        print(f"DEBUG: Checking /media/usb0 - exists: {os.path.exists('/media/usb0')}, ismount: {os.path.ismount('/media/usb0')}")  # ← ДОБАВИТЬ
-        
         # Пытаемся смонтировать флешку если устройство есть но не смонтировано
-        if os.path.exists('/dev/sda1') and not os.path.ismount('/media/usb0'):
-            try:
-                print("DEBUG: Attempting to mount /dev/sda1...")
-                subprocess.run(['mkdir', '-p', '/media/usb0'], check=True)
-                # ИСПОЛЬЗУЕМ SUDO ДЛЯ МОНТИРОВАНИЯ
-                result = subprocess.run(['sudo', 'mount', '/dev/sda1', '/media/usb0'],
-                                      capture_output=True, text=True)
-                if result.returncode == 0:
-                    print("✅ USB flash drive auto-mounted")
-                else:
-                    print(f"DEBUG: Mount failed: {result.stderr}")
-            except Exception as e:
-                print(f"Mount error: {e}")        
-        # Проверяем стандартные точки монтирования
-        mount_points = [
-            "/media/*",
-            "/mnt/*", 
-            "/run/media/*/*"
-        ]
-        
-        print(f"DEBUG: Checking mount points: {mount_points}")  # ← ДОБАВИТЬ
-        
-        for pattern in mount_points:
+        self.auto_mount()
+        # Точки монтирования под /media, /mnt и /run/media - из той же таблицы, что и поколения
+        mounts = read_media_mounts()
+        self.update_mounts(mounts)
+        log.debug("media mounts=%s", sorted(mounts))
+        for mount in sorted(mounts):
             try:
-                from glob import glob
-                mounts = glob(pattern)
-                print(f"DEBUG: Pattern {pattern} found: {mounts}")  # ← ДОБАВИТЬ
-                for mount in mounts:
-                    if os.path.ismount(mount) and os.access(mount, os.R_OK):
-                        print(f"DEBUG: Checking mount {mount}")  # ← ДОБАВИТЬ
-                        if self.is_usb_drive(mount):
-                            usb_drives.append(mount)
-                            print(f"DEBUG: Added USB drive: {mount}")  # ← ДОБАВИТЬ
+                if os.access(mount, os.R_OK) and self.is_usb_drive(mount):
+                    usb_drives.append(mount)
             except Exception as e:
-                print(f"DEBUG: Error in pattern {pattern}: {e}")  # ← ДОБАВИТЬ
+                log.warning("error checking mount=%s: %s", mount, e)
         
-        print(f"DEBUG: Final USB drives list: {usb_drives}")  # ← ДОБАВИТЬ
-        return usb_drives        
+        log.debug("usb drives=%s", usb_drives)
         return usb_drives
     
 
+    def update_mounts(self, mounts):
+        """Запоминает поколения (mount_id) точек монтирования и забывает отмонтированные"""
+        with self.index_lock:
+            self.mount_generations = {mount_point: entry.mount_id
+                                      for mount_point, entry in mounts.items()}
+            for key, entry in list(self.medkit_index.items()):
+                if self.mount_generations.get(entry['mount_point']) != entry['generation']:
+                    del self.medkit_index[key]
+
+    def device_uuid(self, st_dev, mount_stat=None):
+        """Находит UUID файловой системы по номеру устройства"""
+        try:
+            with os.scandir(self.by_uuid_dir) as entries:
+                for entry in entries:
+                    try:
+                        st = os.stat(entry.path)
+                    except OSError:
+                        continue
+                    if st.st_rdev == st_dev and st_dev:
+                        return entry.name
+                    # Стенд с фальшивым корнем: ссылка ведет прямо на каталог флешки
+                    if (mount_stat is not None and stat.S_ISDIR(st.st_mode)
+                            and os.path.samestat(st, mount_stat)):
+                        return entry.name
+        except OSError:
+            pass
+        return None
+
+    def index_drive(self, mount_point):
+        """Сканирует корень флешки один раз за монтирование и кэширует результат"""
+        mount_stat = os.stat(mount_point)
+        st_dev = mount_stat.st_dev
+        with self.index_lock:
+            # Новый каталог предметов - старый индекс больше не верен
+            if self.catalog.refresh():
+                self.medkit_index.clear()
+            generation = self.mount_generations.get(mount_point)
+            key = (st_dev, generation)
+            if generation is not None and key in self.medkit_index:
+                return self.medkit_index[key]
+        
+        from metrics import SCAN_SECONDS, DRIVES_SCANNED
+        with SCAN_SECONDS.time():
+            with os.scandir(mount_point) as entries:
+                names = {entry.name for entry in entries}
+            uuid = self.device_uuid(st_dev, mount_stat)
+        DRIVES_SCANNED.inc()
+        log.debug("scanned mount_point=%s generation=%s uuid=%s files=%d",
+                  mount_point, generation, uuid, len(names))
+        has_used_file = MEDKIT_USED_FILE in names
+        # Аптечка с этой флешки уже применена, но транзакция не завершена
+        pending = self.ledger.pending_for(uuid)
+        if pending and not has_used_file:
+            has_used_file = self.create_used_file(mount_point)
+        
+        owner = None
+        if self.characters is not None:
+            from character_table import OWNER_FILE, read_owner
+            if OWNER_FILE in names:
+                owner = read_owner(mount_point)
+        
+        with self.index_lock:
+            # Ту же флешку мог одновременно просканировать другой поток
+            if generation is not None and key in self.medkit_index:
+                return self.medkit_index[key]
+            if pending and has_used_file:
+                self.finish_transactions(pending)
+            if has_used_file and uuid is not None:
+                self.used_medkits.add(uuid)
+            entry = {
+                'mount_point': mount_point,
+                'generation': generation,
+                'uuid': uuid,
+                'medkit': self.catalog.match(names),
+                'used': has_used_file or uuid in self.used_medkits or bool(pending),
+                'owner': owner,
+                'applied': False
+            }
+            # Без поколения нельзя понять, что флешку переподключили - не кэшируем
+            if generation is not None:
+                self.medkit_index[key] = entry
+        return entry
+
+    def remember_used(self, drive_path, medkit_file):
+        """Запоминает примененную аптечку, чтобы больше не трогать флешку"""
+        try:
+            entry = self.index_drive(drive_path)
+        except OSError:
+            return
+        with self.index_lock:
+            entry['applied'] = True
+            if not self.catalog.is_reusable(medkit_file):
+                entry['used'] = True
+                if entry['uuid'] is not None:
+                    self.used_medkits.add(entry['uuid'])
+
     def is_usb_drive(self, mount_point):
         """Проверяет, что это USB флешка, а не системный раздел"""
         try:
@@ -99,212 +322,480 @@ class MedkitDaemon:
                 return False
             
             # Проверяем наличие файлов аптечек
-            for medkit_file in MEDKIT_TYPES.keys():
-                if os.path.exists(os.path.join(mount_point, medkit_file)):
-                    return True
-            
-            return False
+            return self.index_drive(mount_point)['medkit'] is not None
         except:
             return False
     
     def check_medkit_on_drive(self, drive_path):
         """Проверяет наличие аптечки на флешке"""
+        entry = self.index_drive(drive_path)
+        
         # Проверяем, не использована ли уже аптечка на этой флешке
-        used_file = os.path.join(drive_path, MEDKIT_USED_FILE)
-        if os.path.exists(used_file):
+        if entry['used'] or entry['applied'] or entry['medkit'] is None:
             return None
         
-        # Ищем файл аптечки
-        for medkit_file, effects in MEDKIT_TYPES.items():
-            medkit_path = os.path.join(drive_path, medkit_file)
-            if os.path.exists(medkit_path):
-                return medkit_file, effects, medkit_path
-        
-        return None
+        medkit_file = entry['medkit']
+        effects = self.catalog.effects.get(medkit_file)
+        if effects is None:
+            return None
+        return medkit_file, effects, os.path.join(drive_path, medkit_file)
     
+    def drive_owner(self, drive_path):
+        """ID владельца флешки (только в режиме нескольких персонажей)"""
+        if self.characters is None:
+            return None
+        return self.index_drive(drive_path)['owner']
+
+    def store_for(self, owner):
+        """Хранилище состояния персонажа, которому принадлежит флешка"""
+        if self.characters is None:
+            return self.store
+        if owner is None:
+            from character_table import OWNER_FILE
+            print(f"❓ На флешке нет {OWNER_FILE}")
+            return None
+        store = self.characters.store(owner)
+        if store.get() is None:
+            print(f"❓ Неизвестный персонаж: {owner}")
+            return None
+        return store
+
     def load_config(self):
         """Загружает конфигурацию персонажа"""
-        try:
-            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"Error loading config: {e}")
-            return None
-    
-    def check_and_update_death_status(self, config):
-        """Автоматически проверяет и обновляет статус смерти"""
-        if config['health'] <= 0 and not config.get('is_dead', False):
-            config['is_dead'] = True
-            config['health'] = 0
-            print("💀 Сталкер умер от потери здоровья!")
-            return True
-        elif config['health'] > 0 and config.get('is_dead', False):
-            config['is_dead'] = False
-            print("✨ Сталкер ожил!")
-            return True
-        return False
+        return self.store.get()
 
     def save_config(self, config):
         """Сохраняет конфигурацию персонажа"""
-        try:
-            # АВТОМАТИЧЕСКАЯ ПРОВЕРКА СМЕРТИ ПЕРЕД СОХРАНЕНИЕМ
-            death_status_changed = self.check_and_update_death_status(config)
-            
-            with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-                json.dump(config, f, ensure_ascii=False, indent=2)
-            
-            if death_status_changed:
-                print("📄 Конфиг сохранен с обновленным статусом смерти")
-            return True
-        except Exception as e:
-            print(f"Error saving config: {e}")
-            return False
+        return self.store.save(config)
         
     def mark_medkit_used(self, drive_path, medkit_file):
         """Помечает аптечку как использованную (кроме воскрешения)"""
-        # Воскрешение не помечается как использованное
-        if medkit_file == "ressurect.txt":
+        # Воскрешение (и другие многоразовые предметы) не помечается как использованное
+        if self.catalog.is_reusable(medkit_file):
             print("♻️ Воскрешение можно использовать многократно")
             return True
             
+        if not self.create_used_file(drive_path):
+            return False
+        print("✅ Аптечка помечена как использованная")
+        return True
+
+    def create_used_file(self, drive_path):
+        """Создает USED.txt на флешке. Возвращает True при успехе"""
+        from usb_io import create_used_marker, create_used_marker_sudo
+        used_file = os.path.join(drive_path, MEDKIT_USED_FILE)
         try:
-            used_file = os.path.join(drive_path, MEDKIT_USED_FILE)
-            
-            # Создаем файл
-            result = subprocess.run(['sudo', 'touch', used_file], 
-                                  capture_output=True, text=True)
-            if result.returncode != 0:
-                print(f"❌ Ошибка создания USED.txt: {result.stderr}")
-                return False
-            
-            # Синхронизируем
-            subprocess.run(['sudo', 'sync', used_file], check=False)
-            
-            print("✅ Аптечка помечена как использованная")
+            if self.use_sudo:
+                create_used_marker_sudo(used_file)
+            else:
+                try:
+                    # Создаем файл и синхронизируем без fork
+                    create_used_marker(used_file)
+                except PermissionError:
+                    create_used_marker_sudo(used_file)
             return True
-            
         except Exception as e:
             print(f"❌ Ошибка пометки аптечки: {e}")
             return False
 
+    def finish_transactions(self, txids, store=None):
+        """Завершает транзакции, как только состояние записано на диск"""
+        with self.index_lock:
+            for txid in txids:
+                self.unflushed_txids.append((txid, store))
+            self.commit_durable()
+
+    def commit_durable(self):
+        """Пишет commit для транзакций, чье новое состояние уже на диске"""
+        # Хранилище неизвестно (транзакция прошлого появления флешки) - ждем все
+        with self.index_lock:
+            any_dirty = self.store.dirty or (self.characters is not None and self.characters.dirty)
+            waiting = []
+            for txid, store in self.unflushed_txids:
+                if (store.dirty if store is not None else any_dirty):
+                    waiting.append((txid, store))
+                else:
+                    self.ledger.commit(txid)
+            self.unflushed_txids = waiting
+
+    def recover_transactions(self):
+        """Доводит до конца транзакции, прерванные сбоем"""
+        recovered = self.ledger.recover(self.store_for)
+        if recovered:
+            print(f"♻️ Восстановлено прерванных применений аптечек: {recovered}")
+
+    def apply_medkit_effects(self, config, effects):
+        """Применяет эффекты аптечки к состоянию. Возвращает (здоровье, радиация) или None"""
+        return apply_medkit_effects(config, effects)
+
+    def apply_to_store(self, store, medkit_file, effects, owner, drive_path):
+        """Применяет аптечку к актуальному состоянию владельца под блокировкой файла.
+
+        Возвращает ((здоровье, радиация), состояние до, состояние после, txid) или None"""
+        from state_schema import validate_state
+        if not store.get():
+            return None
+        reusable = self.catalog.is_reusable(medkit_file)
+        use = {}
+
+        def apply(config):
+            # При конфликте с другим писателем повторяется на его версии состояния
+            old_state = dict(config)
+            result = self.apply_medkit_effects(config, effects)
+            if result is None:
+                return None
+            # Журнал фиксирует ровно то, что попадет в файл: проверка схемы до begin.
+            # ValueError здесь - аптечка не применяется и в журнал не попадает
+            config.update(validate_state(config))
+            if not use:
+                # С этой записи аптечка использована, даже если дальше что-то сорвется
+                txid = None
+                if not reusable:
+                    txid = self.ledger.begin(self.index_drive(drive_path)['uuid'], medkit_file,
+                                             owner, old_state, config)
+                use.update(old_state=old_state, config=config, txid=txid)
+            return result
+
+        result = store.modify(apply)
+        if result is None:
+            return None
+        return result, use['old_state'], use['config'], use['txid']
+
+    def publish_state_change(self, config, was_dead, owner=None):
+        """Сообщает подписчикам о смерти или воскрешении"""
+        if was_dead and not config.get('is_dead', False):
+            self.publish(EVENT_RESURRECTION, state=config, character=owner)
+        elif config.get('is_dead', False):
+            self.publish(EVENT_DEATH, state=config, character=owner)
+
+    def medkit_log_message(self, medkit_file, health_restored, radiation_reduced):
+        """Формирует строку лога об использовании аптечки"""
+        medkit_name = self.catalog.display_name(medkit_file)
+        
+        return f"{medkit_name} использована. Здоровье: +{health_restored}%, Радиация: -{radiation_reduced:.1f}"
+
+    def record_medkit_use(self, medkit_file, old_state, config, owner=None):
+        """Записывает использование аптечки в журнал событий"""
+        from event_journal import make_record, KIND_MEDKIT, KIND_DEATH, KIND_RESURRECTION
+        if old_state.get('is_dead', False) and not config.get('is_dead', False):
+            kind = KIND_RESURRECTION
+        elif config.get('is_dead', False):
+            kind = KIND_DEATH
+        else:
+            kind = KIND_MEDKIT
+        try:
+            self.journal.append(make_record(kind, medkit_file, old_state, config, character=owner))
+        except Exception as e:
+            print(f"Error writing journal: {e}")
+
     def use_medkit_auto(self, medkit_info, drive_path):
         """Автоматически использует аптечку"""
         medkit_file, effects, medkit_path = medkit_info
+        log.debug("using item=%s effects=%s drive=%s", medkit_file, effects, drive_path)
         
-        print(f"🔍 DEBUG: Using {medkit_file}, effects: {effects}")  # ← ДОБАВИТЬ
-        
-        config = self.load_config()
-        if not config:
+        owner = self.drive_owner(drive_path)
+        store = self.store_for(owner)
+        if store is None:
+            return False
+        applied = self.apply_to_store(store, medkit_file, effects, owner, drive_path)
+        if applied is None:
             return False
+        (health_restored, radiation_reduced), old_state, config, txid = applied
+        was_dead = old_state.get('is_dead', False)
         
-        is_ressurect = effects.get('is_ressurect', False)
-        is_dead = config.get('is_dead', False)
+        self.publish_state_change(config, was_dead, owner)
         
-        print(f"🔍 DEBUG: is_dead={is_dead}, is_ressurect={is_ressurect}")  # ← ДОБАВИТЬ
+        # Помечаем как использованную (кроме воскрешения)
+        if self.mark_medkit_used(drive_path, medkit_file):
+            if txid is not None:
+                self.finish_transactions([txid], store)
+        else:
+            # Лечение уже применено; метку создадим, когда флешка появится снова
+            log.warning("USED.txt not created, will retry drive=%s item=%s", drive_path, medkit_file)
         
-        # ЛОГИКА СМЕРТИ И ВОСКРЕШЕНИЯ
-        if is_dead and not is_ressurect:
-            print("💀 Сталкер мертв! Нужно воскрешение.")
-            return False
+        # Логируем
+        self.record_medkit_use(medkit_file, old_state, config, owner)
+        log_message = self.medkit_log_message(medkit_file, health_restored, radiation_reduced)
         
-        # Если сталкер мертв и это воскрешение - воскрешаем
-        if is_dead and is_ressurect:
-            config['is_dead'] = False
-            config['health'] = 100
-            config['radiation'] = 0
-            print("✨ Сталкер воскрешен полностью здоровым!")
-            health_restored = 100
-            radiation_reduced = config['radiation']
-        else:
-            # Применяем обычные эффекты
-            old_health = config['health']
-            old_radiation = config['radiation']
-            
-            config['health'] = min(100, config['health'] + effects['health_restore'])
-            health_restored = config['health'] - old_health
-            
-            radiation_reduce = (effects['radiation_reduce'] / 100) * config['radiation']
-            config['radiation'] = max(0, config['radiation'] - radiation_reduce)
-            radiation_reduced = old_radiation - config['radiation']
-            
-            # Проверяем смерть после эффектов
-            if config['health'] <= 0:
-                config['is_dead'] = True
-                config['health'] = 0
-                print("💀 Сталкер умер!")
+        print(f"💊 {log_message}")
+        self.publish(EVENT_MEDKIT, item=medkit_file, health_restored=health_restored,
+                     radiation_reduced=radiation_reduced, state=config, character=owner)
+        return True
+
+    def process_drive(self, drive):
+        """Проверяет флешку и применяет найденную аптечку"""
+        medkit_info = self.check_medkit_on_drive(drive)
         
-        print(f"🔍 DEBUG: Final state - health={config['health']}, radiation={config['radiation']}, is_dead={config.get('is_dead', False)}")  # ← ДОБАВИТЬ
+        if medkit_info:
+            from metrics import APPLY_SECONDS, MEDKITS_APPLIED, MEDKITS_REJECTED
+            # Используем аптечку автоматически
+            with APPLY_SECONDS.time():
+                used = self.use_medkit_auto(medkit_info, drive)
+            if used:
+                MEDKITS_APPLIED.inc()
+                self.remember_used(drive, medkit_info[0])
+                print(f"Medkit used from {drive}")
+            else:
+                MEDKITS_REJECTED.inc()
+                log.info("medkit not applied item=%s drive=%s", medkit_info[0], drive)
+
+    def enable_simulation(self, settings_path=None):
+        """Включает симуляцию радиации и здоровья во времени"""
+        from simulation import SimulationEngine, SIMULATION_FILE
+        if settings_path is None:
+            settings_path = SIMULATION_FILE
+        self.simulation = SimulationEngine(self.simulation_stores, settings_path,
+                                           publish=self.publish_simulation)
+
+    def simulation_stores(self):
+        """Хранилища всех персонажей, которых продвигает симуляция"""
+        if self.characters is None:
+            return {None: self.store}
+        self.characters.refresh()
+        return {char_id: self.characters.store(char_id) for char_id in self.characters.characters}
+
+    def publish_simulation(self, owner, old_state, config):
+        """Сообщает об изменениях, сделанных симуляцией"""
+        if config.get('is_dead', False) and not old_state.get('is_dead', False):
+            print("☢️ Сталкер погиб от радиации!")
+            self.record_medkit_use("radiation", old_state, config, owner)
+            self.publish_state_change(config, False, owner)
+        self.publish(EVENT_STATE, state=config, character=owner)
+
+    def run_simulation(self):
+        """Выполняет наступившие тики симуляции"""
+        if self.simulation is not None:
+            self.simulation.run_due()
+
+    def simulation_delay(self):
+        """Сколько можно ждать событий до следующего тика симуляции"""
+        if self.simulation is None:
+            return None
+        return self.simulation.next_delay()
+
+    def critical_health(self):
+        """Есть ли персонаж при смерти или мертвый (тогда флешки опрашиваются чаще)"""
+        from power_scheduler import is_critical
+        return any(is_critical(store.get()) for store in self.simulation_stores().values())
+
+    def start_journal(self):
+        """Записывает снимок состояния каждого персонажа при запуске - точку отсчета для журнала"""
+        for char_id, store in self.simulation_stores().items():
+            config = store.get()
+            if config:
+                self.journal.snapshot(config, character=char_id)
+
+    def run(self, poll=False, watcher=None):
+        """Основной цикл мониторинга"""
+        self.recover_transactions()
+        self.start_journal()
+        if self.publisher is None:
+            try:
+                from event_bus import EventPublisher
+                self.publisher = EventPublisher()
+            except OSError as e:
+                print(f"Event socket unavailable: {e}")
         
-        # Сохраняем конфиг
-        if not self.save_config(config):
-            return False
+        try:
+            if poll:
+                self.run_polling()
+                return
+            
+            if watcher is None:
+                try:
+                    from mount_watcher import MountWatcher
+                    watcher = MountWatcher()
+                except (OSError, ValueError) as e:
+                    print(f"Mount events unavailable ({e}), falling back to polling")
+                    self.run_polling()
+                    return
+            
+            self.run_events(watcher)
+        finally:
+            # Дописываем отложенные изменения конфига и журнала
+            self.store.close()
+            if self.characters is not None:
+                self.characters.close()
+            self.commit_durable()
+            self.journal.close()
+            if self.publisher is not None:
+                self.publisher.close()
+
+    def run_events(self, watcher):
+        """Цикл мониторинга по событиям монтирования (без опроса)"""
+        from metrics import DAEMON_ERRORS
+        print("Medkit daemon started. Waiting for mount events...")
         
-        # Помечаем как использованную (кроме воскрешения)
-        if not self.mark_medkit_used(drive_path, medkit_file):
-            return False
+        try:
+            # Обрабатываем флешки, вставленные до запуска
+            self.auto_mount()
+            self.update_mounts(watcher.mounts)
+            for drive in list(watcher.mounts):
+                if os.access(drive, os.R_OK) and self.is_usb_drive(drive):
+                    self.process_drive(drive)
+            
+            while True:
+                try:
+                    change = watcher.wait(self.simulation_delay())
+                    # Пробуждения по событиям только считаются - ждать здесь нечего
+                    self.scheduler.wakeup(adapt=False)
+                    self.run_simulation()
+                    self.handle_mount_change(change, watcher.mounts)
+                
+                except KeyboardInterrupt:
+                    raise
+                except Exception:
+                    DAEMON_ERRORS.inc()
+                    log.exception("error in daemon loop")
+                    time.sleep(5)
+        except KeyboardInterrupt:
+            print("Medkit daemon stopped.")
+        finally:
+            watcher.close()
+
+    def handle_mount_change(self, change, mounts):
+        """Обрабатывает одно изменение таблицы монтирования (MountChange)"""
+        self.update_mounts(mounts)
         
-        # ... остальной код логирования ...        
-        # Логируем
-        medkit_name = {
-            "medkit_regular.txt": "Обычная аптечка",
-            "medkit_military.txt": "Армейская аптечка", 
-            "medkit_science.txt": "Научная аптечка",
-            "antidote.txt": "Антидот",
-            "vodka.txt": "Водка",
-            "ressurect.txt": "Воскрешение"
-        }.get(medkit_file, "Неизвестная")
+        # Новое блочное устройство - пробуем смонтировать
+        for device in change.devices:
+            log.debug("block device added device=%s", device)
+            if device == "/dev/sda1":
+                self.auto_mount(device)
         
-        log_message = f"{medkit_name} использована. Здоровье: +{health_restored}%, Радиация: -{radiation_reduced:.1f}"
+        for drive in change.added:
+            log.debug("mount added drive=%s", drive)
+            if os.access(drive, os.R_OK) and self.is_usb_drive(drive):
+                self.process_drive(drive)
         
-        try:
-            with open("medkit_log.txt", "a", encoding='utf-8') as f:
-                f.write(f"{time.ctime()}: {log_message}\n")
-        except:
-            pass
+        for drive in change.removed:
+            log.debug("mount removed drive=%s", drive)
         
-        print(f"💊 {log_message}")
-        return True
-    def run(self):
-        """Основной цикл мониторинга"""
+        self.commit_durable()
+
+    def run_polling(self):
+        """Основной цикл мониторинга с опросом (запасной режим)"""
+        from metrics import DAEMON_ERRORS
         print("Medkit daemon started. Monitoring USB drives...")
         
+        scheduler = self.scheduler
+        seen = set()
         while True:
             try:
+                scheduler.wakeup()
                 # Ищем USB флешки
                 usb_drives = self.find_usb_drives()
-                print(f"DEBUG: Found {len(usb_drives)} USB drives: {usb_drives}")
                 for drive in usb_drives:
                     # Проверяем аптечку на флешке
-                    medkit_info = self.check_medkit_on_drive(drive)
-                    
-                    if medkit_info:
-                        # Используем аптечку автоматически
-                        if self.use_medkit_auto(medkit_info, drive):
-                            print(f"Medkit used from {drive}")
+                    self.process_drive(drive)
+                self.commit_durable()
                 
-                # УВЕЛИЧИМ ЧАСТОТУ ПРОВЕРКИ - ждем только 1 секунду
-                time.sleep(1)  # ← ИЗМЕНИТЬ с 2 на 1
+                self.run_simulation()
+                
+                # Новая флешка - опрашиваем часто; в простое реже (режим --low-power)
+                if set(usb_drives) - seen:
+                    scheduler.activity()
+                seen = set(usb_drives)
+                scheduler.set_critical(self.critical_health())
+                time.sleep(scheduler.wait_time(self.simulation_delay()))
                 
             except KeyboardInterrupt:
                 print("Medkit daemon stopped.")
                 break
-            except Exception as e:
-                print(f"Error in daemon: {e}")
+            except Exception:
+                DAEMON_ERRORS.inc()
+                log.exception("error in daemon loop")
                 time.sleep(5)
+def daemonize():
+    """Уходит в фон двойным fork, без запуска второго интерпретатора.
+    Возвращает True в процессе демона и False в исходном процессе"""
+    import sys
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid > 0:
+        os.waitpid(pid, 0)
+        return False
+    os.setsid()
+    if os.fork() > 0:
+        os._exit(0)
+    # Вывод демона, как и раньше, никуда не идет
+    fd = os.open(os.devnull, os.O_RDWR)
+    for std in (0, 1, 2):
+        os.dup2(fd, std)
+    if fd > 2:
+        os.close(fd)
+    return True
+
 def main():
-    # Запускаем в фоновом режиме
     import sys
-    
-    if len(sys.argv) > 1 and sys.argv[1] == "--foreground":
-        daemon = MedkitDaemon()
-        daemon.run()
-    else:
-        # Запускаем в фоне
-        import subprocess
-        subprocess.Popen([
-            sys.executable, __file__, "--foreground"
-        ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    args = sys.argv[1:]
+    # Без --foreground уходим в фон. Модули уже загружены - второй запуск Python не нужен
+    if "--foreground" not in args and not daemonize():
         print("Medkit daemon started in background.")
+        return
+
+    # --log-level LEVEL, --log-file FILE: отладочный вывод (по умолчанию только предупреждения)
+    # Без них logging не импортируется: предупреждения выводит его обработчик по умолчанию
+    if "--log-level" in args[:-1] or "--log-file" in args[:-1]:
+        import logging
+        level = args[args.index("--log-level") + 1] if "--log-level" in args[:-1] else "WARNING"
+        log_file = args[args.index("--log-file") + 1] if "--log-file" in args[:-1] else None
+        logging.basicConfig(level=level.upper(), filename=log_file,
+                            format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+        _Log.level = logging.getLogger().getEffectiveLevel()
+
+    # Метрики: Unix сокет (python3 metrics.py) и/или файл --metrics-file FILE.
+    # SIGUSR1 включает/сохраняет cProfile, SIGUSR2 - tracemalloc
+    from metrics import MetricsServer, MetricsFileWriter, Profiler
+    instruments = []
+    try:
+        instruments.append(MetricsServer())
+    except OSError as e:
+        log.warning("metrics socket unavailable: %s", e)
+    if "--metrics-file" in args[:-1]:
+        instruments.append(MetricsFileWriter(args[args.index("--metrics-file") + 1]))
+    Profiler().install()
+
+    # --sudo: монтировать и помечать аптечки через sudo, а не напрямую
+    use_sudo = "--sudo" in args
+    # --characters FILE: один демон на много персонажей (флешки с owner.txt)
+    characters = None
+    if "--characters" in args[:-1]:
+        from character_table import CharacterTable
+        characters = CharacterTable(args[args.index("--characters") + 1])
+    if "--async" in args:
+        # Каждая флешка обрабатывается в своей задаче asyncio
+        from medkit_async import AsyncMedkitDaemon
+        daemon = AsyncMedkitDaemon(use_sudo=use_sudo, characters=characters)
+        medkit_daemon = daemon.daemon
+    else:
+        daemon = MedkitDaemon(use_sudo=use_sudo, characters=characters)
+        medkit_daemon = daemon
+    # --audio [DEVICE]: звуки событий через ALSA (DEVICE - имя PCM, null - без вывода)
+    if "--audio" in args:
+        from audio_cues import start_audio
+        index = args.index("--audio") + 1
+        device = args[index] if args[index:] and not args[index].startswith("--") else None
+        medkit_daemon.cues = start_audio(device, medkit_daemon.catalog)
+    # --low-power [БЮДЖЕТ]: в режиме опроса интервал растет в простое до 30 с,
+    # БЮДЖЕТ - не больше стольких пробуждений в минуту
+    if "--low-power" in args:
+        from power_scheduler import AdaptiveScheduler, parse_power_args
+        idle_interval, budget = parse_power_args(args)
+        medkit_daemon.scheduler = AdaptiveScheduler("daemon", idle_interval=idle_interval, budget=budget)
+    # --simulate: радиация и урон во времени (настройки в simulation.json)
+    if "--simulate" in args:
+        medkit_daemon.enable_simulation()
+    # --poll: старый режим с опросом раз в секунду
+    try:
+        daemon.run(poll="--poll" in args)
+    finally:
+        if medkit_daemon.cues is not None:
+            medkit_daemon.cues.close()
+        for instrument in instruments:
+            instrument.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import threading
+
+METRICS_SOCKET = "/tmp/stalker_metrics.sock"
+# Файл для textfile-коллектора (node_exporter), если сокет не нужен
+METRICS_FILE = "medkit_metrics.prom"
+METRICS_FILE_INTERVAL = 15
+# Сюда сохраняются результаты профилирования по сигналу
+PROFILE_FILE = "medkit_profile.pstats"
+TRACEMALLOC_FILE = "medkit_tracemalloc.txt"
+
+# Границы корзин гистограмм времени (секунды)
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Counter:
+    """Монотонный счетчик"""
+
+    __slots__ = ('name', 'help', 'value', '_lock')
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help}",
+                f"# TYPE {self.name} counter",
+                f"{self.name} {self.value}"]
+
+
+class Histogram:
+    """Гистограмма длительностей с фиксированными корзинами"""
+
+    __slots__ = ('name', 'help', 'buckets', 'counts', 'sum', 'count', '_lock')
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+            self.sum += value
+            self.count += 1
+
+    def time(self):
+        """Контекстный менеджер: with histogram.time(): ..."""
+        return _Timer(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            cumulative = 0
+            for bound, count in zip(self.buckets, self.counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+            lines.append(f"{self.name}_sum {self.sum:.6f}")
+            lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class MetricsRegistry:
+    """Все метрики процесса; render() выдает формат Prometheus"""
+
+    def __init__(self):
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help_text, *args):
+        with self._lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, help_text, *args)
+            return metric
+
+    def counter(self, name, help_text):
+        return self._get(Counter, name, help_text)
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, help_text, buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def write(self, path=METRICS_FILE):
+        """Атомарно записывает метрики в файл"""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+
+# Общий реестр процесса
+REGISTRY = MetricsRegistry()
+
+SCAN_SECONDS = REGISTRY.histogram("medkit_scan_seconds", "Сканирование корня флешки")
+MOUNT_SECONDS = REGISTRY.histogram("medkit_mount_seconds", "Монтирование флешки")
+APPLY_SECONDS = REGISTRY.histogram("medkit_apply_seconds", "Применение аптечки целиком")
+CONFIG_WRITE_SECONDS = REGISTRY.histogram("medkit_config_write_seconds", "Атомарная запись состояния")
+LOCK_WAIT_SECONDS = REGISTRY.histogram("medkit_lock_wait_seconds", "Ожидание блокировки файла состояния")
+LOCK_HOLD_SECONDS = REGISTRY.histogram("medkit_lock_hold_seconds", "Удержание блокировки файла состояния")
+
+DRIVES_SCANNED = REGISTRY.counter("medkit_drives_scanned_total", "Просканированные флешки")
+MOUNT_FAILURES = REGISTRY.counter("medkit_mount_failures_total", "Неудачные монтирования")
+MEDKITS_APPLIED = REGISTRY.counter("medkit_applied_total", "Примененные аптечки")
+MEDKITS_REJECTED = REGISTRY.counter("medkit_rejected_total", "Аптечки, которые не удалось применить")
+CONFIG_WRITES = REGISTRY.counter("medkit_config_writes_total", "Записи состояния на диск")
+LOCK_CONTENDED = REGISTRY.counter("medkit_lock_contended_total", "Блокировка была занята другим процессом")
+MERGED_UPDATES = REGISTRY.counter("medkit_merged_updates_total",
+                                  "Отложенные изменения, повторно примененные к более новому файлу")
+DAEMON_ERRORS = REGISTRY.counter("medkit_daemon_errors_total", "Ошибки в цикле демона")
+
+
+class MetricsServer:
+    """Отдает метрики каждому подключившемуся к Unix сокету и закрывает соединение"""
+
+    def __init__(self, path=METRICS_SOCKET, registry=REGISTRY):
+        import socket
+
+        self.path = path
+        self.registry = registry
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(path)
+        self.sock.listen(4)
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            with conn:
+                try:
+                    conn.sendall(self.registry.render().encode('utf-8'))
+                except OSError:
+                    pass
+
+    def close(self):
+        self.sock.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+class MetricsFileWriter:
+    """Периодически перезаписывает файл метрик; последний раз - при закрытии"""
+
+    def __init__(self, path=METRICS_FILE, interval=METRICS_FILE_INTERVAL, registry=REGISTRY):
+        self.path = path
+        self.interval = interval
+        self.registry = registry
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def write(self):
+        try:
+            self.registry.write(self.path)
+        except OSError as e:
+            print(f"Error writing metrics: {e}")
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self.write()
+
+
+class Profiler:
+    """cProfile и tracemalloc, включаемые и выключаемые сигналами во время работы"""
+
+    def __init__(self, profile_path=PROFILE_FILE, tracemalloc_path=TRACEMALLOC_FILE):
+        self.profile_path = profile_path
+        self.tracemalloc_path = tracemalloc_path
+        self._profile = None
+
+    def install(self):
+        """SIGUSR1 - cProfile, SIGUSR2 - tracemalloc (повторный сигнал сохраняет результат)"""
+        import signal
+        signal.signal(signal.SIGUSR1, lambda signum, frame: self.toggle_cpu())
+        signal.signal(signal.SIGUSR2, lambda signum, frame: self.toggle_memory())
+
+    def toggle_cpu(self):
+        import cProfile
+        if self._profile is None:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+            print("⏱️ Профилирование включено")
+            return
+        self._profile.disable()
+        self._profile.dump_stats(self.profile_path)
+        self._profile = None
+        print(f"⏱️ Профиль сохранен в {self.profile_path}")
+
+    def toggle_memory(self, limit=25):
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            print("🧠 Трассировка памяти включена")
+            return
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        with open(self.tracemalloc_path, 'w', encoding='utf-8') as f:
+            for stat in snapshot.statistics('lineno')[:limit]:
+                f.write(f"{stat}\n")
+        print(f"🧠 Снимок памяти сохранен в {self.tracemalloc_path}")
+
+
+def main():
+    """Печатает метрики работающего демона"""
+    import sys
+    import socket
+
+    path = sys.argv[1] if len(sys.argv) > 1 else METRICS_SOCKET
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except OSError:
+            print(f"Не удалось подключиться к {path}")
+            return
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    sys.stdout.write(b"".join(chunks).decode('utf-8'))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+
+import os
+import select
+from collections import namedtuple
+
+MOUNTINFO_FILE = "/proc/self/mountinfo"
+
+# Точки монтирования, на которых ищем флешки
+MEDIA_ROOTS = ("/media/", "/mnt/", "/run/media/")
+
+# Netlink сокет ядра для hotplug событий (uevent)
+NETLINK_KOBJECT_UEVENT = 15
+
+MountChange = namedtuple("MountChange", ["added", "removed", "devices"])
+# mount_id меняется при каждом новом монтировании - это "поколение" точки монтирования
+MountEntry = namedtuple("MountEntry", ["mount_id", "source"])
+
+
+def unescape_mount_path(path):
+    """Раскодирует восьмеричные escape-последовательности (\\040 и т.п.)"""
+    if "\\" not in path:
+        return path
+    result = []
+    i = 0
+    while i < len(path):
+        if path[i] == "\\" and path[i + 1:i + 4].isdigit():
+            result.append(chr(int(path[i + 1:i + 4], 8)))
+            i += 4
+        else:
+            result.append(path[i])
+            i += 1
+    return "".join(result)
+
+
+def parse_mountinfo(text):
+    """Разбирает /proc/self/mountinfo в словарь {точка монтирования: MountEntry}"""
+    mounts = {}
+    for line in text.splitlines():
+        fields = line.split()
+        try:
+            separator = fields.index("-")
+        except ValueError:
+            continue
+        if len(fields) < 5 or len(fields) < separator + 3:
+            continue
+        mount_point = unescape_mount_path(fields[4])
+        mounts[mount_point] = MountEntry(int(fields[0]), unescape_mount_path(fields[separator + 2]))
+    return mounts
+
+
+def filter_media_mounts(mounts, media_roots=MEDIA_ROOTS):
+    """Оставляет только точки монтирования под /media, /mnt и /run/media"""
+    return {
+        mount_point: entry
+        for mount_point, entry in mounts.items()
+        if mount_point.startswith(media_roots)
+    }
+
+
+def read_media_mounts(path=MOUNTINFO_FILE):
+    """Однократно читает таблицу монтирования. При ошибке возвращает пустой словарь"""
+    try:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            return filter_media_mounts(parse_mountinfo(f.read()))
+    except OSError:
+        return {}
+
+
+class ProcMountTable:
+    """Таблица монтирования ядра. Изменения сигнализируются через POLLPRI"""
+
+    events = select.POLLPRI | select.POLLERR
+
+    def __init__(self, path=MOUNTINFO_FILE):
+        self.fd = os.open(path, os.O_RDONLY)
+
+    def fileno(self):
+        return self.fd
+
+    def read(self):
+        os.lseek(self.fd, 0, os.SEEK_SET)
+        chunks = []
+        while True:
+            chunk = os.read(self.fd, 65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        return b"".join(chunks).decode("utf-8", "replace")
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FakeMountTable:
+    """Подменная таблица монтирования для тестов без флешек и sudo"""
+
+    events = select.POLLIN
+
+    def __init__(self):
+        self.mounts = {}
+        self._next_id = 100
+        self._read_fd, self._write_fd = os.pipe()
+        os.set_blocking(self._read_fd, False)
+
+    def fileno(self):
+        return self._read_fd
+
+    def mount(self, mount_point, source="/dev/sda1", fstype="vfat"):
+        """Добавляет точку монтирования и будит наблюдателя"""
+        self.mounts[mount_point] = (self._next_id, source, fstype)
+        self._next_id += 1
+        os.write(self._write_fd, b"m")
+
+    def unmount(self, mount_point):
+        """Удаляет точку монтирования и будит наблюдателя"""
+        if self.mounts.pop(mount_point, None) is not None:
+            os.write(self._write_fd, b"u")
+
+    def read(self):
+        try:
+            while os.read(self._read_fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        lines = ["22 1 179:2 / / rw,relatime - ext4 /dev/mmcblk0p2 rw"]
+        for mount_point, (mount_id, source, fstype) in self.mounts.items():
+            escaped = mount_point.replace(" ", "\\040")
+            lines.append(f"{mount_id} 22 8:1 / {escaped} rw,relatime - {fstype} {source} rw")
+        return "\n".join(lines) + "\n"
+
+    def close(self):
+        os.close(self._read_fd)
+        os.close(self._write_fd)
+
+
+def open_uevent_socket():
+    """Открывает netlink сокет для получения hotplug событий ядра"""
+    import socket
+    try:
+        sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_KOBJECT_UEVENT)
+        sock.bind((0, 1))
+        sock.setblocking(False)
+        return sock
+    except (AttributeError, OSError):
+        return None
+
+
+def parse_uevent(data):
+    """Разбирает сообщение uevent в словарь переменных"""
+    env = {}
+    for item in data.split(b"\0")[1:]:
+        key, sep, value = item.partition(b"=")
+        if sep:
+            env[key.decode("ascii", "replace")] = value.decode("utf-8", "replace")
+    return env
+
+
+class MountWatcher:
+    """Ждет событий монтирования вместо периодического опроса"""
+
+    def __init__(self, table=None, uevents=True, media_roots=MEDIA_ROOTS):
+        self.table = table if table is not None else ProcMountTable()
+        self.media_roots = tuple(media_roots)
+        self.poller = select.poll()
+        self.poller.register(self.table.fileno(), self.table.events)
+
+        self.uevent_sock = open_uevent_socket() if uevents else None
+        if self.uevent_sock is not None:
+            self.poller.register(self.uevent_sock.fileno(), select.POLLIN)
+
+        self.mounts = filter_media_mounts(parse_mountinfo(self.table.read()), self.media_roots)
+
+    def wait(self, timeout=None):
+        """Блокируется до изменения таблицы монтирования или появления блочного устройства"""
+        timeout_ms = None if timeout is None else int(timeout * 1000)
+        events = self.poller.poll(timeout_ms)
+
+        mounts_changed = False
+        devices = []
+        for fd, _ in events:
+            if fd == self.table.fileno():
+                mounts_changed = True
+            elif self.uevent_sock is not None and fd == self.uevent_sock.fileno():
+                devices.extend(self._read_block_devices())
+
+        if not mounts_changed:
+            return MountChange([], [], devices)
+
+        mounts = filter_media_mounts(parse_mountinfo(self.table.read()), self.media_roots)
+        added = [m for m in mounts if self.mounts.get(m) != mounts[m]]
+        removed = [m for m in self.mounts if m not in mounts]
+        self.mounts = mounts
+        return MountChange(added, removed, devices)
+
+    def _read_block_devices(self):
+        """Читает накопившиеся uevent и возвращает новые разделы (/dev/sdXN)"""
+        devices = []
+        while True:
+            try:
+                data = self.uevent_sock.recv(8192)
+            except (BlockingIOError, InterruptedError):
+                break
+            env = parse_uevent(data)
+            if (env.get("ACTION") == "add" and env.get("SUBSYSTEM") == "block"
+                    and env.get("DEVTYPE") == "partition" and "DEVNAME" in env):
+                devices.append("/dev/" + env["DEVNAME"])
+        return devices
+
+    def close(self):
+        self.table.close()
+        if self.uevent_sock is not None:
+            self.uevent_sock.close()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+import math
+import time
+
+from metrics import REGISTRY
+
+# Интервал опроса сразу после активности (флешка, событие демона) и предел при простое
+ACTIVE_INTERVAL = 1.0
+IDLE_INTERVAL = 30.0
+# Во сколько раз растет интервал на каждом пустом пробуждении
+BACKOFF = 2.0
+# Сколько секунд после активности держать быстрый опрос
+ACTIVE_HOLD = 60
+# Здоровье, при котором ждем аптечку с минимальной задержкой (как "КРИТИЧЕСКОЕ" у дисплея)
+CRITICAL_HEALTH = 20
+# Корзины задержки: при опросе она доходит до IDLE_INTERVAL
+LATENCY_BUCKETS = (0.01, 0.1, 0.5, 1, 2, 5, 10, 30, 60)
+
+
+def is_critical(state):
+    """Персонаж при смерти или мертв - вот-вот вставит аптечку или воскрешение"""
+    return bool(state) and (state.get('is_dead', False) or state['health'] <= CRITICAL_HEALTH)
+
+
+class AdaptiveScheduler:
+    """Интервал пробуждений цикла опроса: быстро после активности, экспоненциально реже в простое.
+
+    Цикл ждет delay() секунд, вызывает wakeup(), а если что-то нашлось - activity().
+    idle_interval=None - постоянный интервал (обычный режим, без экономии).
+    budget - не больше стольких пробуждений в минуту (ведро токенов с запасом на минуту);
+    бюджет сильнее активности и критического здоровья"""
+
+    def __init__(self, name, active_interval=ACTIVE_INTERVAL, idle_interval=None, backoff=BACKOFF,
+                 hold=ACTIVE_HOLD, budget=None, clock=time.monotonic):
+        self.active_interval = active_interval
+        self.idle_interval = active_interval if idle_interval is None else max(active_interval, idle_interval)
+        self.backoff = backoff
+        self.hold = hold
+        self.budget = budget
+        self.clock = clock
+        self.interval = active_interval
+        self.critical = False
+        self.wakeups = 0
+        now = clock()
+        self._last_wakeup = now
+        self._previous_wakeup = now
+        self._last_activity = now
+        self._tokens = float(budget or 0)
+        self._refilled = now
+        self._wakeups_total = REGISTRY.counter(f"medkit_{name}_wakeups_total",
+                                               f"Пробуждения цикла {name}")
+        # Для опроса - сколько событие могло ждать (время с прошлого пробуждения)
+        self._latency = REGISTRY.histogram(f"medkit_{name}_latency_seconds",
+                                           f"Задержка реакции цикла {name} на активность",
+                                           LATENCY_BUCKETS)
+
+    def _refill(self, now):
+        if self.budget:
+            self._tokens = min(float(self.budget),
+                               self._tokens + (now - self._refilled) * self.budget / 60)
+        self._refilled = now
+
+    def delay(self):
+        """Сколько секунд ждать до следующего пробуждения"""
+        now = self.clock()
+        interval = self.active_interval if self.critical else self.interval
+        due = self._last_wakeup + interval
+        if self.budget:
+            self._refill(now)
+            if self._tokens < 1:
+                # Бюджет исчерпан - ждем, пока накопится токен
+                due = max(due, now + (1 - self._tokens) * 60 / self.budget)
+        return max(0.0, due - now)
+
+    def wakeup(self, adapt=True):
+        """Отмечает пробуждение. Без активности в последние hold секунд интервал растет.
+        adapt=False - цикл просыпается по событиям, пробуждение только учитывается"""
+        now = self.clock()
+        self.wakeups += 1
+        self._wakeups_total.inc()
+        if self.budget:
+            self._refill(now)
+            self._tokens = max(0.0, self._tokens - 1)
+        self._previous_wakeup = self._last_wakeup
+        self._last_wakeup = now
+        if adapt and now - self._last_activity >= self.hold:
+            self.interval = min(self.idle_interval, self.interval * self.backoff)
+
+    def activity(self, happened_at=None):
+        """Что-то произошло: снова быстрый опрос.
+
+        happened_at (time.time() события) - точная задержка; без него для опроса
+        берется верхняя граница - время с предыдущего пробуждения"""
+        now = self.clock()
+        self.interval = self.active_interval
+        self._last_activity = now
+        if happened_at is not None:
+            latency = time.time() - happened_at
+        else:
+            latency = now - self._previous_wakeup
+        self._latency.observe(max(0.0, latency))
+
+    def set_critical(self, critical):
+        """Критическое здоровье: опрос с active_interval, пока не пройдет (в пределах бюджета)"""
+        self.critical = bool(critical)
+
+    def wait_time(self, other=None):
+        """delay() с учетом другого срока (например, тика симуляции); None - без срока"""
+        delay = self.delay()
+        return delay if other is None else min(delay, other)
+
+
+def parse_power_args(args):
+    """--low-power [БЮДЖЕТ]: экономный режим и бюджет пробуждений в минуту.
+    Возвращает (idle_interval, budget) для AdaptiveScheduler"""
+    if "--low-power" not in args:
+        return None, None
+    index = args.index("--low-power") + 1
+    budget = None
+    if args[index:] and not args[index].startswith("--"):
+        try:
+            budget = float(args[index])
+        except ValueError:
+            print(f"✗ Бюджет пробуждений должен быть числом: {args[index]}")
+    if budget is not None and not (math.isfinite(budget) and budget > 0):
+        budget = None
+    return IDLE_INTERVAL, budget
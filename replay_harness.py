@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+from collections import Counter
+
+from state_store import StateStore
+from state_schema import DEFAULT_STATE
+from mount_watcher import MountWatcher, FakeMountTable
+from medkit_daemon import MedkitDaemon, MEDKIT_USED_FILE
+from item_catalog import ItemCatalog, DEFAULT_ITEMS
+from character_table import CharacterTable, OWNER_FILE
+from event_journal import JournalWriter
+from consumption_ledger import ConsumptionLedger
+from metrics import MEDKITS_APPLIED, MEDKITS_REJECTED
+
+# События аудита (sys.addaudithook), означающие запуск нового процесса
+FORK_EVENTS = ("os.fork", "os.forkpty", "os.posix_spawn", "os.exec", "os.system",
+               "subprocess.Popen")
+
+# События аудита, которые соответствуют системным вызовам
+SYSCALL_EVENTS = ("open", "os.", "subprocess.", "socket.")
+
+# Счетчик событий аудита; считает только во время воспроизведения
+_audit = {"installed": False, "active": False, "counts": Counter()}
+
+
+def _audit_hook(event, args):
+    if _audit["active"] and event.startswith(SYSCALL_EVENTS):
+        _audit["counts"][event] += 1
+
+
+def install_audit_hook():
+    """Ставит счетчик один раз: хук аудита нельзя снять, повторные считали бы дважды"""
+    if not _audit["installed"]:
+        sys.addaudithook(_audit_hook)
+        _audit["installed"] = True
+
+
+def generate_trace(seed=0, sticks=50, characters=8, events=500, storm_size=10,
+                   kill_ratio=0.05, storm_ratio=0.03):
+    """Синтетическая трасса: флешки с разными предметами, горячие подключения, штормы, смерти"""
+    rng = random.Random(seed)
+    items = list(DEFAULT_ITEMS)
+    char_ids = [f"p{i}" for i in range(characters)]
+    stick_specs = {
+        f"usb{i}": {"item": rng.choice(items), "owner": rng.choice(char_ids)}
+        for i in range(sticks)
+    }
+    names = list(stick_specs)
+    mounted = []
+    trace_events = []
+    for _ in range(events):
+        roll = rng.random()
+        free = [name for name in names if name not in mounted]
+        if roll < kill_ratio:
+            trace_events.append(["kill", rng.choice(char_ids)])
+        elif roll < kill_ratio + storm_ratio and free:
+            # Шторм: много флешек одним изменением таблицы монтирования
+            batch = rng.sample(free, min(storm_size, len(free)))
+            mounted.extend(batch)
+            trace_events.append(["storm", batch])
+        elif mounted and (not free or rng.random() < 0.5):
+            stick = mounted.pop(rng.randrange(len(mounted)))
+            trace_events.append(["unmount", stick])
+        elif free:
+            stick = rng.choice(free)
+            mounted.append(stick)
+            trace_events.append(["mount", stick])
+    return {"seed": seed, "characters": char_ids, "sticks": stick_specs, "events": trace_events}
+
+
+def save_trace(trace, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(trace, f, ensure_ascii=False)
+
+
+def load_trace(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+class FakeRoot:
+    """Демон на фальшивом корне: флешки - каталоги, монтирование - FakeMountTable"""
+
+    def __init__(self, root, trace):
+        self.root = root
+        self.media = os.path.join(root, "media")
+        by_uuid = os.path.join(root, "by-uuid")
+        os.makedirs(by_uuid)
+
+        self.sticks = {}
+        for name, spec in trace["sticks"].items():
+            path = os.path.join(self.media, name)
+            os.makedirs(path)
+            open(os.path.join(path, spec["item"]), 'w').close()
+            with open(os.path.join(path, OWNER_FILE), 'w', encoding='utf-8') as f:
+                f.write(spec["owner"])
+            # Своя "файловая система" у каждой флешки: UUID, метки USED и журнал транзакций
+            os.symlink(path, os.path.join(by_uuid, f"uuid-{name}"))
+            self.sticks[name] = path
+
+        characters_path = os.path.join(root, "characters.json")
+        with open(characters_path, 'w', encoding='utf-8') as f:
+            json.dump({"characters": {char_id: dict(DEFAULT_STATE, name=char_id)
+                                      for char_id in trace["characters"]}}, f)
+        # Запись при каждом сохранении - число записей не зависит от таймеров
+        self.characters = CharacterTable(characters_path, coalesce_window=0)
+
+        self.table = FakeMountTable()
+        self.watcher = MountWatcher(self.table, uevents=False, media_roots=(self.media + os.sep,))
+        self.daemon = MedkitDaemon(
+            store=StateStore(os.path.join(root, "stalker_config.json")),
+            catalog=ItemCatalog(os.path.join(root, "items.json")),
+            journal=JournalWriter(os.path.join(root, "medkit_journal.bin")),
+            characters=self.characters,
+            ledger=ConsumptionLedger(os.path.join(root, "medkit_ledger.log")))
+        self.daemon.by_uuid_dir = by_uuid
+        self.daemon.update_mounts(self.watcher.mounts)
+
+    def apply(self, event):
+        """Выполняет одно событие трассы и прогоняет его через демон"""
+        action, arg = event
+        if action == "kill":
+            config = self.characters.get(arg)
+            if config is not None and not config['is_dead']:
+                config['health'] = 0
+                self.characters.save(arg, config)
+            return
+        if action == "mount":
+            self.table.mount(self.sticks[arg])
+        elif action == "storm":
+            for name in arg:
+                self.table.mount(self.sticks[name])
+        elif action == "unmount":
+            self.table.unmount(self.sticks[arg])
+        self.daemon.handle_mount_change(self.watcher.wait(0), self.watcher.mounts)
+
+    def digest(self):
+        """Отпечаток итогового состояния: персонажи и помеченные флешки"""
+        self.characters.flush()
+        h = hashlib.sha256()
+        with open(self.characters.path, 'rb') as f:
+            h.update(f.read())
+        for name in sorted(self.sticks):
+            h.update(f"{name}:{os.path.exists(os.path.join(self.sticks[name], MEDKIT_USED_FILE))}".encode())
+        return h.hexdigest()[:16]
+
+    def close(self):
+        self.watcher.close()
+        self.daemon.journal.close()
+        self.characters.close()
+
+
+def replay(trace, root, quiet=True):
+    """Воспроизводит трассу на фальшивом корне. Возвращает словарь с результатами"""
+    install_audit_hook()
+    fake = FakeRoot(root, trace)
+    latencies = []
+    applied_before = MEDKITS_APPLIED.value
+    rejected_before = MEDKITS_REJECTED.value
+    stdout = sys.stdout
+    if quiet:
+        # Сообщения демона печатаются, как обычно, но не на экран
+        sys.stdout = open(os.devnull, 'w')
+    _audit["counts"].clear()
+    _audit["active"] = True
+    start = time.perf_counter()
+    try:
+        for event in trace["events"]:
+            applied = MEDKITS_APPLIED.value
+            event_start = time.perf_counter()
+            fake.apply(event)
+            elapsed = time.perf_counter() - event_start
+            if MEDKITS_APPLIED.value != applied:
+                # Задержка события целиком: в шторме последняя аптечка ждет все предыдущие
+                latencies.append(elapsed)
+        fake.characters.flush()
+        total = time.perf_counter() - start
+    finally:
+        _audit["active"] = False
+        if quiet:
+            sys.stdout.close()
+            sys.stdout = stdout
+    counts = Counter(_audit["counts"])
+    result = {
+        "events": len(trace["events"]),
+        "medkits": MEDKITS_APPLIED.value - applied_before,
+        "rejected": MEDKITS_REJECTED.value - rejected_before,
+        "seconds": total,
+        "latencies": latencies,
+        "config_writes": fake.characters.writes,
+        "forks": sum(counts[event] for event in FORK_EVENTS),
+        "syscalls": counts,
+        "digest": fake.digest()
+    }
+    fake.close()
+    return result
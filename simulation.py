@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+import heapq
+import itertools
+
+SIMULATION_FILE = "simulation.json"
+
+# Настройки по умолчанию (simulation.json может переопределить любые из них)
+DEFAULT_SETTINGS = {
+    # Как часто продвигать симуляцию и как часто сохранять результат (секунды)
+    "tick_interval": 5,
+    "persist_interval": 30,
+    # Мощность облучения в зонах, R в минуту
+    "zones": {
+        "clean": 0,
+        "background": 2,
+        "anomaly": 60,
+        "hotspot": 600
+    },
+    # Зона по умолчанию и зоны отдельных персонажей (по ID)
+    "zone": "clean",
+    "character_zones": {},
+    # Доля радиации, которую задерживает костюм
+    "suit_protection": {
+        "SEVA Suit": 0.6,
+        "Экзоскелет": 0.5,
+        "Ветер Свободы": 0.3,
+        "Заря": 0.2
+    }
+}
+
+# Урон здоровью от накопленной радиации: (порог, % здоровья в минуту).
+# Пороги совпадают с предупреждениями StalkerDisplay.show_status_warnings
+RADIATION_DAMAGE = (
+    (8000, 10),
+    (5000, 3),
+    (2000, 1)
+)
+
+MAX_RADIATION = 10000
+
+
+def radiation_damage_rate(radiation):
+    """Урон здоровью (% в минуту) при данном уровне радиации"""
+    for threshold, rate in RADIATION_DAMAGE:
+        if radiation >= threshold:
+            return rate
+    return 0
+
+
+def advance_state(config, dt, exposure_rate, protection, health_debt=0.0):
+    """Продвигает состояние на dt секунд. Возвращает накопленный дробный урон"""
+    if config.get('is_dead', False) or dt <= 0:
+        return health_debt
+
+    dose = exposure_rate * (1 - protection) * dt / 60
+    if dose:
+        config['radiation'] = round(min(MAX_RADIATION, config['radiation'] + dose), 2)
+
+    health_debt += radiation_damage_rate(config['radiation']) * dt / 60
+    damage = int(health_debt)
+    if damage:
+        config['health'] = max(0, config['health'] - damage)
+        health_debt -= damage
+    return health_debt
+
+
+def merge_settings(base, override):
+    """Накладывает настройки из файла на умолчания. Вложенные словари сливаются по ключам:
+    {"zones": {"anomaly": 90}} меняет одну зону, а не заменяет все"""
+    merged = dict(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_settings(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+class TickScheduler:
+    """Планировщик периодических задач на куче: ближайшая задача за O(log n)"""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._heap = []
+        self._counter = itertools.count()
+        # Номер задачи -> интервал; меняется set_interval без пересоздания задачи
+        self._intervals = {}
+
+    def every(self, interval, callback):
+        """Вызывает callback(now) каждые interval секунд. Возвращает номер задачи"""
+        seq = next(self._counter)
+        self._intervals[seq] = interval
+        heapq.heappush(self._heap, (self.clock() + interval, seq, callback))
+        return seq
+
+    def set_interval(self, seq, interval):
+        """Меняет интервал задачи. Если новый короче, она наступит не позже чем через interval"""
+        if self._intervals.get(seq) == interval:
+            return
+        self._intervals[seq] = interval
+        latest = self.clock() + interval
+        for i, (due, job, callback) in enumerate(self._heap):
+            if job == seq and due > latest:
+                self._heap[i] = (latest, job, callback)
+                heapq.heapify(self._heap)
+                break
+
+    def next_delay(self):
+        """Сколько секунд до ближайшей задачи (None, если задач нет)"""
+        if not self._heap:
+            return None
+        return max(0.0, self._heap[0][0] - self.clock())
+
+    def run_due(self):
+        """Выполняет все наступившие задачи. Возвращает их число"""
+        now = self.clock()
+        ran = 0
+        while self._heap and self._heap[0][0] <= now:
+            due, seq, callback = heapq.heappop(self._heap)
+            callback(now)
+            ran += 1
+            # Интервал берется после вызова: задача могла перечитать настройки
+            interval = self._intervals[seq]
+            # Пропущенные тики не догоняем по одному - следующий через interval
+            next_due = due + interval
+            if next_due <= now:
+                next_due = now + interval
+            heapq.heappush(self._heap, (next_due, seq, callback))
+        return ran
+
+
+class SimulationEngine:
+    """Радиация и здоровье во времени: облучение в зонах, урон от радиации, защита костюма"""
+
+    def __init__(self, stores, settings_path=SIMULATION_FILE, publish=None, clock=time.monotonic):
+        # stores() возвращает {ID персонажа или None: хранилище}
+        self.stores = stores
+        self.settings_path = settings_path
+        # publish(ID, состояние до, состояние после) вызывается при каждом изменении
+        self.publish = publish
+        self.settings = dict(DEFAULT_SETTINGS)
+        self._settings_stamp = None
+        self._health_debt = {}
+        self.scheduler = None
+        self.reload_settings()
+
+        self.scheduler = TickScheduler(clock)
+        self._last_tick = clock()
+        self._tick_job = self.scheduler.every(self.settings["tick_interval"], self.tick)
+        self._persist_job = self.scheduler.every(self.settings["persist_interval"], self.persist)
+
+    def reload_settings(self):
+        """Перечитывает simulation.json, если он изменился"""
+        try:
+            st = os.stat(self.settings_path)
+            stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            stamp = None
+        if stamp == self._settings_stamp:
+            return False
+        self._settings_stamp = stamp
+        settings = dict(DEFAULT_SETTINGS)
+        if stamp is not None:
+            try:
+                with open(self.settings_path, 'r', encoding='utf-8') as f:
+                    settings = merge_settings(DEFAULT_SETTINGS, json.load(f))
+                for key in ("tick_interval", "persist_interval"):
+                    value = settings[key]
+                    if isinstance(value, bool) or not isinstance(value, (int, float)) or not value > 0:
+                        raise ValueError(f"{key} must be a positive number: {value!r}")
+            except Exception as e:
+                print(f"Error loading simulation settings: {e}")
+                return False
+        self.settings = settings
+        if self.scheduler is not None:
+            # Интервалы меняются без перезапуска, как и остальные настройки
+            self.scheduler.set_interval(self._tick_job, settings["tick_interval"])
+            self.scheduler.set_interval(self._persist_job, settings["persist_interval"])
+        return True
+
+    def exposure_for(self, char_id):
+        """Мощность облучения в зоне персонажа (R/мин)"""
+        zone = self.settings["character_zones"].get(char_id, self.settings["zone"])
+        return self.settings["zones"].get(zone, 0)
+
+    def protection_for(self, config):
+        """Защита костюма персонажа (0..1)"""
+        return min(1.0, max(0.0, self.settings["suit_protection"].get(config.get('suit'), 0)))
+
+    def tick(self, now):
+        """Продвигает всех персонажей одним пакетом. Изменения остаются в памяти"""
+        dt = now - self._last_tick
+        self._last_tick = now
+        self.reload_settings()
+
+        for char_id, store in self.stores().items():
+            if not store.get():
+                continue
+            tick = {}
+            health_debt = self._health_debt.get(char_id, 0.0)
+
+            def advance(config, char_id=char_id, tick=tick, health_debt=health_debt):
+                # Повторяется на версии другого писателя - долг берется из начала тика
+                old_state = dict(config)
+                self._health_debt[char_id] = advance_state(
+                    config, dt, self.exposure_for(char_id), self.protection_for(config), health_debt)
+                if config['health'] == old_state['health'] and config['radiation'] == old_state['radiation']:
+                    return None
+                tick.update(old_state=old_state, config=config)
+                return True
+
+            if store.modify(advance, defer=True) is None:
+                continue
+            old_state, config = tick['old_state'], tick['config']
+            if config.get('is_dead', False):
+                # Смерть сохраняем сразу
+                store.flush()
+            if self.publish is not None:
+                self.publish(char_id, old_state, config)
+
+    def persist(self, now):
+        """Сохраняет накопленные изменения одной записью"""
+        for store in self.stores().values():
+            # Персонажи из общей таблицы записываются первым же flush()
+            if store.dirty:
+                store.flush()
+
+    def next_delay(self):
+        return self.scheduler.next_delay()
+
+    def run_due(self):
+        return self.scheduler.run_due()
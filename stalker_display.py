@@ -1,167 +1,309 @@
 #!/usr/bin/env python3
 
-import os
-import time
-import json
 import sys
+import select
+from functools import lru_cache
+
+from state_store import StateStore, CONFIG_FILE, check_death_status
+
+# Бэкенды вывода и планировщик пробуждений импортируются при первом использовании
+
+# Как часто пытаться переподключиться к демону
+RECONNECT_INTERVAL = 5
+# Сколько готовых фрагментов кадра (полосы, текст радиации, предупреждения) хранить
+RENDER_CACHE_SIZE = 256
+
+
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
+def _progress_bar(filled, width):
+    return "[" + '█' * filled + '░' * (width - filled) + "]"
+
+
+# typed: 1250 и 1250.0 форматируются по-разному
+@lru_cache(maxsize=RENDER_CACHE_SIZE, typed=True)
+def _radiation_text(value):
+    if value < 1000:
+        return f"{value:>4} R"
+    else:
+        return f"{value/1000:>5.1f} kR"
+
+
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
+def _status_warnings(is_dead, health_level, radiation_level):
+    """Блок предупреждений для уровней здоровья и радиации"""
+    messages = []
+    
+    # Проверяем смерть
+    if is_dead:
+        messages.append("💀 СТАЛКЕР МЕРТВ! Требуется воскрешение!")
+    
+    if health_level == 2:
+        messages.append("КРИТИЧЕСКОЕ СОСТОЯНИЕ! Нужна медицинская помощь!")
+    elif health_level == 1:
+        messages.append("Состояние тяжелое, требуется лечение")
+    
+    if radiation_level == 3:
+        messages.append("СМЕРТЕЛЬНЫЙ УРОВЕНЬ РАДИАЦИИ!")
+    elif radiation_level == 2:
+        messages.append("Высокий уровень радиации, нужны антидоты")
+    elif radiation_level == 1:
+        messages.append("Повышенный радиационный фон")
+    
+    if not messages:
+        messages.append("Состояние в норме")
+    
+    return tuple(f"  {msg}" for msg in messages)
+
+
+def _record_death(config):
+    return True if check_death_status(config, verbose=False, allow_revive=False) else None
 
-CONFIG_FILE = "stalker_config.json"
 
 class StalkerDisplay:
-    def __init__(self):
+    def __init__(self, store=None, character_id=None, backend=None):
+        self.store = store if store is not None else StateStore(CONFIG_FILE, create_missing=True)
+        # ID персонажа в режиме нескольких КПК (события других персонажей пропускаются)
+        self.character_id = character_id
         self.character_data = self.load_config()
+        # Куда выводится кадр: терминал или framebuffer (display_backends)
+        if backend is None:
+            from display_backends import TerminalBackend
+            backend = TerminalBackend()
+        self.backend = backend
+        # Состояние, по которому нарисован текущий кадр
+        self.drawn_state = None
+        # Устройство вывода звука для --audio ("" - по умолчанию), None - без звука
+        self.audio_device = None
+        # Звуки событий демона (audio_cues.CueTrigger)
+        self.cues = None
+        # Интервал опроса файла и переподключения к демону (создается в run).
+        # Экономный режим (--low-power): предел интервала в простое и бюджет пробуждений
+        self.scheduler = None
+        self.idle_interval = None
+        self.power_budget = None
     
     def load_config(self):
-        """Загружает конфигурацию из файла"""
-        default_config = {
-            'name': 'STALKER',
-            'suit': 'SEVA Suit', 
-            'health': 85,
-            'radiation': 1250,
-            'is_dead': False
-        }
-        
-        try:
-            if os.path.exists(CONFIG_FILE):
-                with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-                    # Проверяем что все необходимые поля есть
-                    for key in default_config:
-                        if key not in config:
-                            config[key] = default_config[key]
-                    
-                    # АВТОМАТИЧЕСКАЯ ПРОВЕРКА СМЕРТИ ПРИ ЗАГРУЗКЕ
-                    if config['health'] <= 0 and not config.get('is_dead', False):
-                        config['is_dead'] = True
-                        config['health'] = 0
-                    
-                    return config
-            else:
-                # Создаем файл с настройками по умолчанию
-                self.save_config(default_config)
-                return default_config
-        except Exception as e:
-            print(f"Ошибка загрузки конфига: {e}")
-            return default_config    
+        """Загружает конфигурацию (файл читается только после изменения)"""
+        config = self.store.get()
+        if config is None:
+            from state_schema import DEFAULT_STATE
+            return dict(DEFAULT_STATE)
+        return config
 
     def save_config(self, config=None):
         """Сохраняет конфигурацию в файл"""
         if config is None:
             config = self.character_data
-        
-        # АВТОМАТИЧЕСКАЯ ПРОВЕРКА СМЕРТИ ПЕРЕД СОХРАНЕНИЕМ
-        if config['health'] <= 0 and not config.get('is_dead', False):
-            config['is_dead'] = True
-            config['health'] = 0
-            print("💀 Сталкер умер от потери здоровья!")
-        elif config['health'] > 0 and config.get('is_dead', False):
-            config['is_dead'] = False
-            print("✨ Сталкер ожил!")
-        
-        try:
-            with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-                json.dump(config, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"Ошибка сохранения конфига: {e}")
+        self.store.save(config)
     
     def clear_screen(self):
-        os.system('clear')
+        """Очищает экран (без запуска clear)"""
+        self.backend.clear()
+        self.drawn_state = None
     
     def draw_progress_bar(self, value, max_value, width=30):
         """Рисует текстовый прогресс-бар"""
-        filled = int((value / max_value) * width)
-        bar = '█' * filled + '░' * (width - filled)
-        return f"[{bar}]"
+        return _progress_bar(int((value / max_value) * width), width)
     
     def format_radiation(self, value):
-        if value < 1000:
-            return f"{value:>4} R"
-        else:
-            return f"{value/1000:>5.1f} kR"
+        return _radiation_text(value)
     
-    def update_display(self):
-        # АВТОМАТИЧЕСКАЯ ПРОВЕРКА СМЕРТИ ПЕРЕД ОТОБРАЖЕНИЕМ
-        if self.character_data['health'] <= 0 and not self.character_data.get('is_dead', False):
-            self.character_data['is_dead'] = True
-            self.character_data['health'] = 0
-            self.save_config(self.character_data)
-            print("💀 Сталкер умер от потери здоровья!")
-        
-        self.clear_screen()
-        
-        print("╔══════════════════════════════════════════════╗")
-        print("║               STALKER STATUS                ║")
-        print("╠══════════════════════════════════════════════╣")
-        print(f"║ Name:   {self.character_data['name']:<34} ║")
-        print(f"║ Suit:   {self.character_data['suit']:<34} ║")
+    def render_frame(self):
+        """Собирает кадр в виде списка строк"""
+        lines = [
+            "╔══════════════════════════════════════════════╗",
+            "║               STALKER STATUS                ║",
+            "╠══════════════════════════════════════════════╣",
+            f"║ Name:   {self.character_data['name']:<34} ║",
+            f"║ Suit:   {self.character_data['suit']:<34} ║",
+        ]
         
         # Статус смерти
         status = "МЕРТВ" if self.character_data.get('is_dead', False) else "ЖИВ"
-        print(f"║ Status:   {status:<34} ║")
+        lines.append(f"║ Status:   {status:<34} ║")
         
-        print("╠══════════════════════════════════════════════╣")
+        lines.append("╠══════════════════════════════════════════════╣")
         
         # Health
         health_bar = self.draw_progress_bar(self.character_data['health'], 100, 25)
-        print(f"║ Health:    {self.character_data['health']:>3}% {health_bar} ║")
+        lines.append(f"║ Health:    {self.character_data['health']:>3}% {health_bar} ║")
         
         # Radiation
         rad_text = self.format_radiation(self.character_data['radiation'])
         rad_bar = self.draw_progress_bar(self.character_data['radiation'], 10000, 25)
-        print(f"║ Radiation: {rad_text} {rad_bar} ║")
+        lines.append(f"║ Radiation: {rad_text} {rad_bar} ║")
         
-        print("╚══════════════════════════════════════════════╝")
+        lines.append("╚══════════════════════════════════════════════╝")
         
         # Статусные сообщения
-        print("\n" + "═" * 50)
-        self.show_status_warnings()
-        print("═" * 50)
+        lines.append("")
+        lines.append("═" * 50)
+        lines.extend(self.show_status_warnings())
+        lines.append("═" * 50)
+        return lines
+    
+    def update_display(self):
+        # Состояние не менялось - кадр на экране актуален, ничего не собираем и не пишем
+        state = tuple(self.character_data.items())
+        if state == self.drawn_state:
+            return
+        
+        # АВТОМАТИЧЕСКАЯ ПРОВЕРКА СМЕРТИ ПЕРЕД ОТОБРАЖЕНИЕМ
+        if check_death_status(self.character_data, allow_revive=False):
+            # Записываем только смерть - поверх актуального состояния, а не своей копии
+            self.store.modify(_record_death)
+        self.drawn_state = tuple(self.character_data.items())
+        
+        # Бэкенд сам перерисовывает только изменившиеся строки или области
+        self.backend.draw(self.build_view())
+    
+    def build_view(self):
+        """Данные кадра для бэкенда: значения и отформатированный текст"""
+        from display_backends import DisplayView
+        data = self.character_data
+        is_dead = data.get('is_dead', False)
+        return DisplayView(
+            name=data['name'],
+            suit=data['suit'],
+            status="МЕРТВ" if is_dead else "ЖИВ",
+            is_dead=is_dead,
+            health=data['health'],
+            health_text=f"{data['health']:>3}%",
+            radiation=data['radiation'],
+            radiation_text=self.format_radiation(data['radiation']),
+            radiation_fraction=max(0.0, min(1.0, data['radiation'] / 10000)),
+            warnings=self.show_status_warnings(),
+            lines=self.render_frame() if self.backend.wants_lines else None
+        )
     
     def show_status_warnings(self):
-        """Показывает предупреждения о состоянии"""
+        """Возвращает строки предупреждений о состоянии"""
         health = self.character_data['health']
         radiation = self.character_data['radiation']
-        
-        messages = []
-        
-        # Проверяем смерть
-        if self.character_data.get('is_dead', False):
-            messages.append("💀 СТАЛКЕР МЕРТВ! Требуется воскрешение!")
-        
-        if health <= 20:
-            messages.append("КРИТИЧЕСКОЕ СОСТОЯНИЕ! Нужна медицинская помощь!")
-        elif health <= 50:
-            messages.append("Состояние тяжелое, требуется лечение")
-        
-        if radiation >= 8000:
-            messages.append("СМЕРТЕЛЬНЫЙ УРОВЕНЬ РАДИАЦИИ!")
-        elif radiation >= 5000:
-            messages.append("Высокий уровень радиации, нужны антидоты")
-        elif radiation >= 2000:
-            messages.append("Повышенный радиационный фон")
-        
-        if not messages:
-            messages.append("Состояние в норме")
-        
-        for msg in messages:
-            print(f"  {msg}")
+        # Блок зависит только от порогов, поэтому кэшируется по ним
+        health_level = 2 if health <= 20 else 1 if health <= 50 else 0
+        radiation_level = 3 if radiation >= 8000 else 2 if radiation >= 5000 else 1 if radiation >= 2000 else 0
+        return list(_status_warnings(self.character_data.get('is_dead', False),
+                                     health_level, radiation_level))
+    
+    def apply_events(self, events):
+        """Применяет состояние из событий демона. Возвращает True, если оно изменилось"""
+        changed = False
+        for event in events:
+            if self.character_id is not None and event.get('character') != self.character_id:
+                continue
+            state = event.get('state')
+            if state and state != self.character_data:
+                self.character_data = dict(state)
+                changed = True
+        return changed
     
     def run(self):
         """Основной цикл отображения"""
+        # Первый кадр выводим до импорта inotify и подключения к демону
+        self.clear_screen()
+        self.update_display()
+
+        from file_watcher import FileWatcher
+        from event_bus import EventSubscriber
+        from power_scheduler import AdaptiveScheduler, is_critical
+        if self.audio_device is not None and self.cues is None:
+            # Клипы декодируются один раз, уже после первого кадра
+            from audio_cues import start_audio
+            from item_catalog import ItemCatalog
+            self.cues = start_audio(self.audio_device or None, ItemCatalog(), self.character_id)
+        watcher = FileWatcher(self.store.path)
+        subscriber = EventSubscriber()
+        subscriber.connect()
+        scheduler = self.scheduler
+        if scheduler is None:
+            # Без inotify опрашиваем файл, иначе просыпаемся по таймеру только для переподключения
+            active_interval = RECONNECT_INTERVAL if watcher.uses_inotify else watcher.poll_interval
+            scheduler = self.scheduler = AdaptiveScheduler("display", active_interval, self.idle_interval,
+                                                           budget=self.power_budget)
+        polled = False
         try:
             while True:
+                # Файл мог измениться, пока создавались наблюдатели
+                if self.store.refresh():
+                    self.character_data = self.load_config()
+                    if polled:
+                        # Изменение нашел опрос: задержка - до интервала опроса
+                        scheduler.activity()
+                scheduler.set_critical(is_critical(self.character_data))
                 self.update_display()
-                # Обновляем данные из файла каждые 2 секунды
-                time.sleep(2)
-                self.character_data = self.load_config()
+                
+                # Ждем события от демона или изменения файла конфигурации
+                fds = [fd for fd in (watcher.fileno(), subscriber.fileno()) if fd is not None]
+                if not watcher.uses_inotify or not subscriber.connected:
+                    timeout = scheduler.delay()
+                else:
+                    timeout = None
+                ready, _, _ = select.select(fds, [], [], timeout)
+                # Пустое пробуждение по таймеру - в простое интервал растет
+                polled = not ready
+                scheduler.wakeup(adapt=polled)
+                
+                if subscriber.connected and subscriber.fileno() in ready:
+                    events = subscriber.read_events()
+                    if self.apply_events(events):
+                        scheduler.activity(events[-1].get('time'))
+                    if self.cues is not None:
+                        for event in events:
+                            self.cues.on_event(event)
+                elif not subscriber.connected and not ready:
+                    subscriber.connect()
+                
+                if watcher.fileno() in ready:
+                    watcher.read_events()
                 
         except KeyboardInterrupt:
             print("\nВыход из программы...")
+        finally:
+            subscriber.close()
+            watcher.close()
+            if self.cues is not None:
+                self.cues.close()
+            self.backend.close()
 
 def main():
     try:
-        display = StalkerDisplay()
-        display.run()
+        store = None
+        character_id = None
+        # --character ID [--characters FILE]: персонаж из общей таблицы
+        if "--character" in sys.argv[1:-1]:
+            from character_table import CharacterTable, CHARACTERS_FILE
+            character_id = sys.argv[sys.argv.index("--character") + 1]
+            characters_file = CHARACTERS_FILE
+            if "--characters" in sys.argv[1:-1]:
+                characters_file = sys.argv[sys.argv.index("--characters") + 1]
+            store = CharacterTable(characters_file, coalesce_window=0).store(character_id)
+        # --fb [DEVICE]: рисовать прямо в framebuffer (/dev/fb0, SPI LCD - /dev/fb1)
+        backend = None
+        if "--fb" in sys.argv[1:]:
+            from display_backends import DeviceFramebufferBackend
+            index = sys.argv.index("--fb") + 1
+            device = sys.argv[index] if sys.argv[index:] and sys.argv[index].startswith("/dev/") else "/dev/fb0"
+            backend = DeviceFramebufferBackend(device)
+        display = StalkerDisplay(store, character_id, backend)
+        # --audio [DEVICE]: звуки событий демона (если демон запущен без --audio)
+        if "--audio" in sys.argv[1:]:
+            index = sys.argv.index("--audio") + 1
+            display.audio_device = sys.argv[index] if sys.argv[index:] and not sys.argv[index].startswith("--") else ""
+        # --low-power [БЮДЖЕТ]: таймерные пробуждения (опрос файла, переподключение) реже в простое
+        if "--low-power" in sys.argv[1:]:
+            from power_scheduler import parse_power_args
+            display.idle_interval, display.power_budget = parse_power_args(sys.argv[1:])
+        # --metrics-file FILE: пробуждения и задержка дисплея (сокет метрик занят демоном)
+        metrics_writer = None
+        if "--metrics-file" in sys.argv[1:-1]:
+            from metrics import MetricsFileWriter
+            metrics_writer = MetricsFileWriter(sys.argv[sys.argv.index("--metrics-file") + 1])
+        try:
+            display.run()
+        finally:
+            if metrics_writer is not None:
+                metrics_writer.close()
     except Exception as e:
         print(f"Произошла ошибка: {e}")
 
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+
+import os
+import math
+import struct
+import zlib
+
+# Версия схемы состояния. При увеличении добавьте миграцию в MIGRATIONS
+SCHEMA_VERSION = 1
+# Ключ версии в JSON (в самом состоянии персонажа его нет)
+SCHEMA_KEY = "schema"
+
+# Состояние персонажа по умолчанию
+DEFAULT_STATE = {
+    'name': 'STALKER',
+    'suit': 'SEVA Suit',
+    'health': 85,
+    'radiation': 1250,
+    'is_dead': False
+}
+
+# Типы полей состояния
+FIELD_TYPES = {
+    'name': str,
+    'suit': str,
+    'health': int,
+    'radiation': (int, float),
+    'is_dead': bool
+}
+
+# Допустимые значения числовых полей
+FIELD_LIMITS = {
+    'health': (0, 100),
+    'radiation': (0, 10000)
+}
+TEXT_FIELDS = ('name', 'suit')
+# Длина текстовых полей в байтах UTF-8 (столько помещается в снимок)
+TEXT_LIMIT = 64
+# Длина ID персонажа в снимке таблицы
+ID_LIMIT = 32
+
+
+def _migrate_0(data):
+    """0 -> 1: файлы без версии, в которых могло не быть части полей (например is_dead)"""
+    for key, value in DEFAULT_STATE.items():
+        data.setdefault(key, value)
+    return data
+
+
+# version -> функция, переводящая состояние из version в version + 1
+MIGRATIONS = {
+    0: _migrate_0,
+}
+
+
+def migrate(data, version):
+    """Доводит состояние из JSON до текущей версии схемы"""
+    if version > SCHEMA_VERSION:
+        raise ValueError(f"schema {version} is newer than supported {SCHEMA_VERSION}")
+    while version < SCHEMA_VERSION:
+        data = MIGRATIONS[version](data)
+        version += 1
+    return data
+
+
+def _clip_text(text):
+    """Обрезает строку до TEXT_LIMIT байт, не разрывая символ"""
+    data = text.encode('utf-8')
+    if len(data) <= TEXT_LIMIT:
+        return text
+    return data[:TEXT_LIMIT].decode('utf-8', 'ignore')
+
+
+def validate_state(data):
+    """Проверяет состояние после миграции. Возвращает новый словарь только с полями схемы.
+
+    Неверный тип - ValueError; числа вне допустимого диапазона прижимаются к границам"""
+    if not isinstance(data, dict):
+        raise ValueError(f"state must be an object, not {type(data).__name__}")
+    state = {}
+    for key, expected in FIELD_TYPES.items():
+        if key not in data:
+            raise ValueError(f"missing field: {key}")
+        value = data[key]
+        if expected is int and isinstance(value, float) and math.isfinite(value):
+            # Дробное здоровье (ручная правка, health += 0.5) округляем, а не отвергаем
+            value = int(round(value))
+        # bool - подкласс int, но здоровьем быть не может
+        if not isinstance(value, expected) or (expected is not bool and isinstance(value, bool)):
+            raise ValueError(f"field {key} has wrong type: {type(value).__name__}")
+        if key in FIELD_LIMITS:
+            if isinstance(value, float) and not math.isfinite(value):
+                raise ValueError(f"field {key} is not a finite number: {value}")
+            low, high = FIELD_LIMITS[key]
+            value = min(high, max(low, value))
+        elif key in TEXT_FIELDS:
+            value = _clip_text(value)
+        state[key] = value
+    return state
+
+
+def load_state(data):
+    """Единый загрузчик состояния из JSON: миграция и проверка"""
+    if not isinstance(data, dict):
+        raise ValueError(f"state must be an object, not {type(data).__name__}")
+    data = dict(data)
+    version = data.pop(SCHEMA_KEY, 0)
+    return validate_state(migrate(data, version))
+
+
+def dump_state(state):
+    """Состояние для записи в JSON (с версией схемы)"""
+    return {SCHEMA_KEY: SCHEMA_VERSION, **state}
+
+
+def load_table(data):
+    """Таблица персонажей из JSON: {"schema": N, "characters": {id: состояние}}"""
+    if not isinstance(data, dict) or not isinstance(data.get("characters"), dict):
+        raise ValueError("characters table must contain a 'characters' object")
+    version = data.get(SCHEMA_KEY, 0)
+    return {str(char_id): validate_state(migrate(dict(state), version))
+            for char_id, state in data["characters"].items()}
+
+
+def dump_table(states):
+    return {SCHEMA_KEY: SCHEMA_VERSION, "characters": states}
+
+
+# Двоичный снимок состояния: заголовок, записи фиксированной длины и CRC32.
+# Лежит рядом с JSON и хранит отпечаток файла, из которого сделан: если JSON
+# поменяли вручную, отпечаток не совпадет и читатель вернется к JSON
+SNAPSHOT_MAGIC = b"STKS"
+# magic, версия схемы, резерв, count, st_dev, st_ino, st_mtime_ns, st_size JSON
+SNAPSHOT_HEADER = struct.Struct("<4sHHIQQqQ")
+# id, name, suit, health, radiation, флаги
+SNAPSHOT_RECORD = struct.Struct(f"<{ID_LIMIT}s{TEXT_LIMIT}s{TEXT_LIMIT}sidB")
+SNAPSHOT_CRC = struct.Struct("<I")
+FLAG_DEAD = 1
+# Радиация была float (1250 и 1250.0 выводятся по-разному)
+FLAG_FLOAT_RADIATION = 2
+
+
+def snapshot_path(path):
+    """Файл снимка для JSON: stalker_config.json -> stalker_config.snap"""
+    return os.path.splitext(path)[0] + ".snap"
+
+
+def encode_snapshot(stamp, states):
+    """states - список (id, состояние). None, если что-то не помещается в формат"""
+    parts = [SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SCHEMA_VERSION, 0, len(states), *stamp)]
+    for char_id, state in states:
+        raw_id = char_id.encode('utf-8')
+        if len(raw_id) > ID_LIMIT:
+            return None
+        flags = (FLAG_DEAD if state['is_dead'] else 0) | \
+                (FLAG_FLOAT_RADIATION if isinstance(state['radiation'], float) else 0)
+        parts.append(SNAPSHOT_RECORD.pack(
+            raw_id, state['name'].encode('utf-8'), state['suit'].encode('utf-8'),
+            state['health'], state['radiation'], flags))
+    data = b"".join(parts)
+    return data + SNAPSHOT_CRC.pack(zlib.crc32(data))
+
+
+def write_snapshot(path, stamp, states):
+    """Перезаписывает снимок на месте. Возвращает True при успехе.
+
+    Файл не заменяется и не укорачивается: читатели держат его в mmap.
+    Прочитанную посреди записи копию отбрасывает проверка CRC"""
+    data = encode_snapshot(stamp, states)
+    if data is None:
+        return False
+    try:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    except OSError:
+        return False
+    try:
+        os.pwrite(fd, data, 0)
+    except OSError:
+        return False
+    finally:
+        os.close(fd)
+    return True
+
+
+class SnapshotReader:
+    """Читает снимок через mmap, без разбора JSON"""
+
+    def __init__(self, path):
+        self.path = path
+        self._map = None
+        self._ino = None
+
+    def _open(self):
+        import mmap
+
+        self.close()
+        try:
+            fd = os.open(self.path, os.O_RDONLY)
+        except OSError:
+            return False
+        try:
+            st = os.fstat(fd)
+            if st.st_size < SNAPSHOT_HEADER.size + SNAPSHOT_CRC.size:
+                return False
+            self._map = mmap.mmap(fd, 0, prot=mmap.PROT_READ)
+            self._ino = st.st_ino
+        except (OSError, ValueError):
+            return False
+        finally:
+            os.close(fd)
+        return True
+
+    def _decode(self, stamp):
+        buf = self._map
+        if buf is None:
+            return None
+        magic, version, _, count, *snap_stamp = SNAPSHOT_HEADER.unpack_from(buf, 0)
+        if magic != SNAPSHOT_MAGIC or version != SCHEMA_VERSION or tuple(snap_stamp) != stamp:
+            return None
+        end = SNAPSHOT_HEADER.size + count * SNAPSHOT_RECORD.size
+        if end + SNAPSHOT_CRC.size > len(buf):
+            return None
+        data = buf[:end]
+        if SNAPSHOT_CRC.unpack_from(buf, end)[0] != zlib.crc32(data):
+            return None
+        return [(raw_id.rstrip(b"\0").decode('utf-8'), {
+                    'name': name.rstrip(b"\0").decode('utf-8'),
+                    'suit': suit.rstrip(b"\0").decode('utf-8'),
+                    'health': health,
+                    'radiation': radiation if flags & FLAG_FLOAT_RADIATION else int(radiation),
+                    'is_dead': bool(flags & FLAG_DEAD)
+                })
+                for raw_id, name, suit, health, radiation, flags
+                in SNAPSHOT_RECORD.iter_unpack(memoryview(data)[SNAPSHOT_HEADER.size:])]
+
+    def _stale(self):
+        """Снимок создан заново или вырос после отображения"""
+        if self._map is None:
+            return True
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return False
+        return st.st_ino != self._ino or st.st_size > len(self._map)
+
+    def read(self, stamp):
+        """Список (id, состояние), если снимок сделан из JSON с отпечатком stamp, иначе None"""
+        states = self._decode(stamp)
+        if states is None and self._stale() and self._open():
+            states = self._decode(stamp)
+        return states
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+
+def main():
+    """Проверяет JSON после ручной правки и сразу переводит его на текущую схему"""
+    import sys
+    import json
+    from state_store import StateStore, CONFIG_FILE
+    from character_table import CharacterTable
+
+    for path in sys.argv[1:] or [CONFIG_FILE]:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                is_table = "characters" in json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"✗ {path}: {e}")
+            continue
+        if is_table:
+            table = CharacterTable(path, coalesce_window=None)
+            if not table.refresh():
+                continue
+            # Перезапись в текущей схеме и новый снимок
+            for char_id in list(table.characters):
+                table.stage(char_id, table.get(char_id))
+            table.flush()
+            print(f"✓ {path}: персонажей {len(table.characters)}, схема {SCHEMA_VERSION}")
+        else:
+            store = StateStore(path, coalesce_window=None)
+            config = store.get()
+            if config is None:
+                continue
+            store.save(config)
+            store.flush()
+            print(f"✓ {path}: схема {SCHEMA_VERSION}")
+
+
+if __name__ == "__main__":
+    main()
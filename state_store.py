@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+
+import os
+import threading
+
+# json, схема, блокировка и метрики импортируются при первом использовании: дисплей читает
+# состояние из двоичного снимка и не пишет файл - ему они не нужны для первого кадра
+
+CONFIG_FILE = "stalker_config.json"
+
+def atomic_write_json(path, data):
+    """Атомарно записывает JSON: временный файл, fsync и переименование поверх старого"""
+    import json
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        mode = os.stat(path).st_mode & 0o777
+    except FileNotFoundError:
+        mode = 0o644
+
+    # Имя уникально для процесса и потока; tempfile не импортируем ради быстрого запуска
+    tmp_path = os.path.join(directory, f".{os.path.basename(path)}.{os.getpid()}.{threading.get_ident()}.tmp")
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        os.fchmod(fd, mode)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    # Фиксируем переименование в каталоге
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def check_death_status(config, verbose=True, allow_revive=True):
+    """Проверяет и обновляет статус смерти. Возвращает True, если статус изменился"""
+    if config['health'] <= 0 and not config.get('is_dead', False):
+        config['is_dead'] = True
+        config['health'] = 0
+        if verbose:
+            print("💀 Сталкер умер от потери здоровья!")
+        return True
+    elif allow_revive and config['health'] > 0 and config.get('is_dead', False):
+        config['is_dead'] = False
+        if verbose:
+            print("✨ Сталкер ожил!")
+        return True
+    return False
+
+
+def _replace_with(state):
+    """Изменение "записать состояние целиком" для повтора в StateStore.flush"""
+    def replace(config):
+        config.clear()
+        config.update(state)
+        return True
+    return replace
+
+
+def _replay(func, config):
+    """Повторяет изменение поверх чужой версии. Не прошедшее проверку пропускается"""
+    from state_schema import validate_state
+    candidate = dict(config)
+    try:
+        func(candidate)
+        check_death_status(candidate, verbose=False)
+        return validate_state(candidate)
+    except (ValueError, TypeError, KeyError) as e:
+        print(f"Error replaying update: {e}")
+        return config
+
+
+class StateStore:
+    """Состояние персонажа в памяти. Файл перечитывается только после его изменения"""
+
+    def __init__(self, path=CONFIG_FILE, create_missing=False, coalesce_window=0, snapshot=True):
+        self.path = path
+        self.create_missing = create_missing
+        # Окно (в секундах), в котором несколько сохранений объединяются в одну запись.
+        # None - запись только по явному вызову flush()
+        self.coalesce_window = coalesce_window
+        self.writes = 0
+        self._state = None
+        self._stamp = None
+        self._dirty = False
+        self._timer = None
+        # Изменения, еще не записанные на диск (см. modify)
+        self._pending = []
+        self._lock = threading.RLock()
+        # Между писателями-процессами; читатели не блокируются (создается первым писателем)
+        self._file_lock = None
+        # Двоичный снимок рядом с JSON: читается через mmap вместо разбора JSON
+        self.snapshot = snapshot
+        self._snapshot = None
+
+    def _writer_lock(self):
+        if self._file_lock is None:
+            from file_lock import FileLock
+            self._file_lock = FileLock(self.path)
+        return self._file_lock
+
+    def _snapshot_reader(self):
+        if self._snapshot is None and self.snapshot:
+            from state_schema import snapshot_path, SnapshotReader
+            self._snapshot = SnapshotReader(snapshot_path(self.path))
+        return self._snapshot
+
+    def _file_stamp(self):
+        """Отпечаток файла: inode, время изменения и размер"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def refresh(self):
+        """Перечитывает файл, если он изменился. Возвращает True при перезагрузке"""
+        if self._dirty:
+            # В памяти есть еще не записанные изменения - они новее файла
+            return False
+        stamp = self._file_stamp()
+        if stamp is None:
+            if self._state is None and self.create_missing:
+                from state_schema import DEFAULT_STATE
+                # Создаем файл с настройками по умолчанию
+                self.save(dict(DEFAULT_STATE))
+                return True
+            return False
+        if stamp == self._stamp and self._state is not None:
+            return False
+
+        config = self._load(stamp)
+        if config is None:
+            # Оставляем последнее удачно прочитанное состояние
+            return False
+        self._state = config
+        self._stamp = stamp
+        return True
+
+    def _load(self, stamp):
+        """Читает состояние с диска: снимок, а если он устарел - JSON"""
+        config = self._read_snapshot(stamp)
+        if config is None:
+            import json
+            from state_schema import load_state
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    # Миграция старых версий и проверка полей
+                    config = load_state(json.load(f))
+            except Exception as e:
+                print(f"Error loading config: {e}")
+                return None
+
+        # АВТОМАТИЧЕСКАЯ ПРОВЕРКА СМЕРТИ ПРИ ЗАГРУЗКЕ
+        check_death_status(config, verbose=False, allow_revive=False)
+        return config
+
+    def _read_snapshot(self, stamp):
+        """Состояние из снимка, если он сделан из текущей версии JSON"""
+        snapshot = self._snapshot_reader()
+        if snapshot is None:
+            return None
+        states = snapshot.read(stamp)
+        if not states or len(states) != 1:
+            return None
+        return states[0][1]
+
+    def get(self):
+        """Возвращает копию состояния или None, если его не удалось загрузить"""
+        with self._lock:
+            self.refresh()
+            if self._state is None:
+                return None
+            return dict(self._state)
+
+    def get_field(self, key):
+        """Возвращает одно поле состояния"""
+        state = self.get()
+        if state is None:
+            from state_schema import DEFAULT_STATE
+            return DEFAULT_STATE[key]
+        return state[key]
+
+    @property
+    def health(self):
+        return int(self.get_field('health'))
+
+    @property
+    def radiation(self):
+        return self.get_field('radiation')
+
+    @property
+    def is_dead(self):
+        return bool(self.get_field('is_dead'))
+
+    @property
+    def name(self):
+        return str(self.get_field('name'))
+
+    @property
+    def suit(self):
+        return str(self.get_field('suit'))
+
+    def update(self, **changes):
+        """Изменяет поля состояния и сохраняет его"""
+        from state_schema import FIELD_TYPES
+        for key, value in changes.items():
+            expected = FIELD_TYPES.get(key)
+            if expected is None:
+                raise KeyError(f"Unknown state field: {key}")
+            if not isinstance(value, expected) or (expected is int and isinstance(value, bool)):
+                raise TypeError(f"Field {key} has wrong type: {type(value).__name__}")
+
+        def apply(config):
+            config.update(changes)
+            return config
+        return self.modify(apply)
+
+    def modify(self, func, defer=False):
+        """Чтение-изменение-запись без потери чужих обновлений.
+
+        func(config) меняет свежее состояние на месте и возвращает результат;
+        None - менять нечего. Пока изменение не записано, func запоминается: если
+        файл тем временем записал другой процесс, flush() повторит ее поверх
+        новой версии. Поэтому func не должна иметь других побочных эффектов.
+        defer=True - как stage(): на диск при следующем flush().
+        Возвращает результат func или None, если менять нечего, новое состояние
+        не прошло проверку схемы или запись не удалась"""
+        from state_schema import DEFAULT_STATE, validate_state
+        with self._lock, self._writer_lock():
+            self.refresh()
+            config = dict(self._state) if self._state is not None else dict(DEFAULT_STATE)
+            try:
+                result = func(config)
+                if result is None:
+                    return None
+                check_death_status(config)
+                state = validate_state(config)
+            except (ValueError, TypeError, KeyError) as e:
+                # Неверное значение отвергаем, состояние остается прежним
+                print(f"Error updating config: {e}")
+                return None
+            if not self._put(state, func, defer):
+                return None
+            return result
+
+    def save(self, config):
+        """Сохраняет состояние целиком (с проверкой смерти). Возвращает True при успехе"""
+        from state_schema import validate_state
+        check_death_status(config)
+        state = validate_state(config)
+        return self._put(state, _replace_with(state), defer=False)
+
+    def stage(self, config):
+        """Обновляет состояние только в памяти; на диск попадет при следующем flush()"""
+        from state_schema import validate_state
+        check_death_status(config)
+        state = validate_state(config)
+        self._put(state, _replace_with(state), defer=True)
+
+    def _put(self, state, func, defer):
+        with self._lock:
+            self._state = state
+            self._dirty = True
+            self._pending.append(func)
+            if defer or self.coalesce_window is None:
+                return True
+            if self.coalesce_window <= 0:
+                return self.flush()
+            if self._timer is None:
+                self._timer = threading.Timer(self.coalesce_window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+            return True
+
+    @property
+    def dirty(self):
+        """Есть ли не записанные на диск изменения"""
+        return self._dirty
+
+    def flush(self):
+        """Записывает отложенные изменения на диск. Возвращает True при успехе"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._dirty:
+                return True
+            from metrics import CONFIG_WRITE_SECONDS, CONFIG_WRITES, MERGED_UPDATES
+            from state_schema import dump_state, write_snapshot
+            with self._writer_lock():
+                stamp = self._file_stamp()
+                if stamp is not None and stamp != self._stamp:
+                    # После нашего чтения файл записал другой процесс - переносим
+                    # свои изменения на его версию, а не затираем ее
+                    config = self._load(stamp)
+                    if config is not None:
+                        for func in self._pending:
+                            config = _replay(func, config)
+                        self._state = config
+                        MERGED_UPDATES.inc(len(self._pending))
+                try:
+                    with CONFIG_WRITE_SECONDS.time():
+                        atomic_write_json(self.path, dump_state(self._state))
+                except Exception as e:
+                    print(f"Error saving config: {e}")
+                    return False
+                self._stamp = self._file_stamp()
+                if self.snapshot and self._stamp is not None:
+                    write_snapshot(self._snapshot_reader().path, self._stamp, [("", self._state)])
+            CONFIG_WRITES.inc()
+            self.writes += 1
+            self._dirty = False
+            self._pending = []
+            return True
+
+    def close(self):
+        """Дописывает отложенные изменения"""
+        self.flush()
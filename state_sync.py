@@ -0,0 +1,551 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+import zlib
+import select
+import socket
+import struct
+from collections import deque
+
+from state_schema import FIELD_TYPES
+from state_store import atomic_write_json
+
+# Адрес сборщика (станции мастера): unix:ПУТЬ, tcp:ХОСТ:ПОРТ или serial:/dev/ttyX[:СКОРОСТЬ]
+SYNC_ADDRESS = "unix:/tmp/stalker_sync.sock"
+# Изменения копятся и уходят пачкой не чаще раза в BATCH_INTERVAL секунд
+BATCH_INTERVAL = 1.0
+BATCH_MAX = 64
+# Сколько неподтвержденных изменений хранить для досылки; больше - отправим снимок
+OUTBOX_LIMIT = 1000
+RECONNECT_INTERVAL = 5
+# Последние события устройства, которые помнит сборщик
+COLLECTOR_EVENTS = 50
+COLLECTOR_STATE_FILE = "sync_collector.json"
+
+# Кадр: тип, длина. Тело - JSON, сжатый общим для соединения потоком zlib
+# (Z_SYNC_FLUSH): повторяющиеся ключи и значения почти ничего не стоят
+FRAME = struct.Struct("<BI")
+MSG_HELLO = 1      # агент -> сборщик: {device, session, seq}
+MSG_WELCOME = 2    # сборщик -> агент: {session, ack}
+MSG_BATCH = 3      # агент -> сборщик: {deltas: [...]}
+MSG_ACK = 4        # сборщик -> агент: {seq}
+MSG_PULL = 5       # сборщик -> агент: прислать снимок
+MSG_SNAPSHOT = 6   # агент -> сборщик: {seq, characters: {id: состояние}}
+MSG_QUERY = 7      # клиент -> сборщик: состояние всех устройств
+MSG_STATUS = 8     # сборщик -> клиент: {devices: {...}}
+
+# Поля, изменения которых передаются
+SYNC_FIELDS = tuple(FIELD_TYPES)
+# Кадр разобран, но содержимое не то (нет "seq", не словарь, ...) - такой же разрыв связи,
+# как ошибка сокета: закрываем это соединение, остальные работают дальше
+PAYLOAD_ERRORS = (KeyError, TypeError, ValueError, AttributeError)
+
+
+class Link:
+    """Соединение с кадрами и потоковым сжатием поверх сокета или последовательного порта"""
+
+    def __init__(self, sock=None, fd=None):
+        self.sock = sock
+        self.fd = fd
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self._compress = zlib.compressobj(6)
+        self._decompress = zlib.decompressobj()
+        self._buffer = b""
+
+    def fileno(self):
+        return self.sock.fileno() if self.sock is not None else self.fd
+
+    def _write(self, data):
+        if self.sock is not None:
+            self.sock.sendall(data)
+            return
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self.fd, view):]
+
+    def send(self, kind, payload):
+        body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        body = self._compress.compress(body) + self._compress.flush(zlib.Z_SYNC_FLUSH)
+        self._write(FRAME.pack(kind, len(body)) + body)
+        self.bytes_sent += FRAME.size + len(body)
+
+    def receive(self):
+        """Читает пришедшее (вызывать, когда select сообщил о данных). Разрыв - ConnectionError"""
+        try:
+            chunk = self.sock.recv(65536) if self.sock is not None else os.read(self.fd, 65536)
+        except (BlockingIOError, InterruptedError):
+            return []
+        if not chunk:
+            raise ConnectionError("link closed")
+        self.bytes_received += len(chunk)
+        self._buffer += chunk
+        messages = []
+        while len(self._buffer) >= FRAME.size:
+            kind, length = FRAME.unpack_from(self._buffer)
+            if len(self._buffer) < FRAME.size + length:
+                break
+            body = self._buffer[FRAME.size:FRAME.size + length]
+            self._buffer = self._buffer[FRAME.size + length:]
+            try:
+                messages.append((kind, json.loads(self._decompress.decompress(body))))
+            except (ValueError, zlib.error) as e:
+                raise ConnectionError(f"bad frame: {e}")
+        return messages
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+        elif self.fd is not None:
+            os.close(self.fd)
+        self.sock = self.fd = None
+
+
+def _open_serial(path, baud=115200):
+    import termios
+    import tty
+
+    fd = os.open(path, os.O_RDWR | os.O_NOCTTY)
+    tty.setraw(fd)
+    attrs = termios.tcgetattr(fd)
+    speed = getattr(termios, f"B{baud}")
+    attrs[4] = attrs[5] = speed
+    termios.tcsetattr(fd, termios.TCSANOW, attrs)
+    return fd
+
+
+def _parse(address):
+    scheme, _, rest = address.partition(":")
+    if scheme not in ("unix", "tcp", "serial"):
+        # Просто путь - Unix сокет
+        return "unix", address
+    return scheme, rest
+
+
+def open_link(address=SYNC_ADDRESS):
+    """Подключается к сборщику. Ошибка подключения - OSError"""
+    scheme, rest = _parse(address)
+    if scheme == "serial":
+        path, _, baud = rest.partition(":")
+        return Link(fd=_open_serial(path, int(baud or 115200)))
+    if scheme == "tcp":
+        host, _, port = rest.rpartition(":")
+        sock = socket.create_connection((host, int(port)), timeout=RECONNECT_INTERVAL)
+        sock.settimeout(None)
+    else:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(rest)
+        except OSError:
+            sock.close()
+            raise
+    return Link(sock)
+
+
+class SyncAgent:
+    """Агент на КПК: отправляет сборщику изменения состояния пачками и досылает после разрыва"""
+
+    def __init__(self, device, stores, connect=open_link, batch_interval=BATCH_INTERVAL,
+                 batch_max=BATCH_MAX, outbox_limit=OUTBOX_LIMIT, clock=time.monotonic):
+        self.device = device
+        # stores() возвращает {ID персонажа или None: хранилище}, как для симуляции
+        self.stores = stores
+        self.connect_link = connect
+        self.batch_interval = batch_interval
+        self.batch_max = batch_max
+        self.outbox_limit = outbox_limit
+        self.clock = clock
+        # Новая сессия после перезапуска агента: номера изменений начинаются заново
+        self.session = os.urandom(8).hex()
+        self.seq = 0
+        # Изменения, которые сборщик еще не подтвердил
+        self.outbox = deque()
+        # Последнее переданное состояние каждого персонажа
+        self.sent = {}
+        self.link = None
+        self.welcomed = False
+        self.sent_seq = 0
+        self.need_snapshot = True
+        self._next_batch = clock()
+        self._next_connect = clock()
+
+    def record(self, char_id, state, event=None):
+        """Запоминает отличия state от переданного ранее (и событие, если есть)"""
+        char_id = char_id or ""
+        previous = self.sent.get(char_id, {})
+        changes = {field: state[field] for field in SYNC_FIELDS
+                   if field in state and previous.get(field) != state[field]}
+        if not changes and event is None:
+            return None
+        self.sent[char_id] = dict(previous, **changes)
+        self.seq += 1
+        delta = {"seq": self.seq, "char": char_id, "time": round(time.time(), 1), **changes}
+        if event is not None:
+            delta.update(event)
+        self.outbox.append(delta)
+        if len(self.outbox) > self.outbox_limit:
+            # Сборщик долго недоступен - при подключении пришлем снимок
+            self.outbox.popleft()
+            self.need_snapshot = True
+        return delta
+
+    def observe(self):
+        """Сверяет хранилища с переданным (ловит и правки edit_config, мимо шины событий)"""
+        for char_id, store in self.stores().items():
+            state = store.get()
+            if state:
+                self.record(char_id, state)
+
+    def on_event(self, event):
+        """Событие шины демона: аптечка, смерть, воскрешение, симуляция"""
+        kind = event.get('type')
+        info = None
+        if kind != 'state':
+            info = {"event": kind}
+            if event.get('item'):
+                info["item"] = event['item']
+        self.record(event.get('character'), event.get('state') or {}, info)
+
+    def snapshot(self):
+        characters = {}
+        for char_id, store in self.stores().items():
+            state = store.get()
+            if state:
+                characters[char_id or ""] = {field: state[field] for field in SYNC_FIELDS}
+        return characters
+
+    def connect(self):
+        """Подключается и представляется; ответ (WELCOME) обрабатывает receive()"""
+        self._next_connect = self.clock() + RECONNECT_INTERVAL
+        try:
+            self.link = self.connect_link()
+            self.link.send(MSG_HELLO, {"device": self.device, "session": self.session, "seq": self.seq})
+        except OSError:
+            self.disconnect()
+            return False
+        return True
+
+    def disconnect(self):
+        if self.link is not None:
+            self.link.close()
+        self.link = None
+        self.welcomed = False
+
+    def send_snapshot(self):
+        characters = self.snapshot()
+        for char_id, state in characters.items():
+            self.sent[char_id] = dict(state)
+        self.link.send(MSG_SNAPSHOT, {"seq": self.seq, "characters": characters})
+        # Снимок заменяет все изменения до него
+        self.outbox.clear()
+        self.sent_seq = self.seq
+        self.need_snapshot = False
+
+    def handle(self, kind, payload):
+        if kind == MSG_WELCOME:
+            self.welcomed = True
+            ack = payload.get("ack", 0) if payload.get("session") == self.session else None
+            oldest = self.outbox[0]["seq"] if self.outbox else self.seq + 1
+            if ack is None or self.need_snapshot or ack + 1 < oldest:
+                # Сборщик нас не знает или часть изменений уже выброшена
+                self.send_snapshot()
+            else:
+                # Продолжаем с последнего подтвержденного
+                self._acknowledge(ack)
+                self.sent_seq = ack
+                self.flush()
+        elif kind == MSG_ACK:
+            self._acknowledge(payload.get("seq", 0))
+        elif kind == MSG_PULL:
+            self.send_snapshot()
+
+    def _acknowledge(self, seq):
+        while self.outbox and self.outbox[0]["seq"] <= seq:
+            self.outbox.popleft()
+
+    def receive(self):
+        try:
+            for kind, payload in self.link.receive():
+                self.handle(kind, payload)
+        except OSError:
+            self.disconnect()
+        except PAYLOAD_ERRORS as e:
+            print(f"Sync: bad message from collector: {e!r}")
+            self.disconnect()
+
+    def flush(self):
+        """Отправляет неотправленные изменения пачками по batch_max"""
+        if self.link is None or not self.welcomed:
+            return 0
+        pending = [delta for delta in self.outbox if delta["seq"] > self.sent_seq]
+        try:
+            if self.need_snapshot:
+                self.send_snapshot()
+                return 0
+            for start in range(0, len(pending), self.batch_max):
+                batch = pending[start:start + self.batch_max]
+                self.link.send(MSG_BATCH, {"deltas": batch})
+                self.sent_seq = batch[-1]["seq"]
+        except OSError:
+            self.disconnect()
+        return len(pending)
+
+    def step(self, timeout=0, subscriber=None):
+        """Одна итерация: подключение, прием, а раз в batch_interval - сверка и отправка пачки"""
+        if self.link is None and self.clock() >= self._next_connect:
+            self.connect()
+        fds = [fd for fd in (self.link and self.link.fileno(),
+                             subscriber and subscriber.fileno()) if fd is not None]
+        ready, _, _ = select.select(fds, [], [], timeout) if fds else ([], [], [])
+        if subscriber is not None and subscriber.fileno() in ready:
+            for event in subscriber.read_events():
+                self.on_event(event)
+        if self.link is not None and self.link.fileno() in ready:
+            self.receive()
+        now = self.clock()
+        if now >= self._next_batch:
+            self._next_batch = now + self.batch_interval
+            self.observe()
+            self.flush()
+
+    def run(self):
+        from event_bus import EventSubscriber
+
+        subscriber = EventSubscriber()
+        subscriber.connect()
+        try:
+            while True:
+                if not subscriber.connected:
+                    subscriber.connect()
+                self.step(max(0.0, self._next_batch - self.clock()), subscriber)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            subscriber.close()
+            self.disconnect()
+
+
+class Collector:
+    """Сборщик на станции мастера: последнее состояние и события каждого устройства.
+
+    pump() обрабатывает все пришедшее без ожидания, поэтому сборщик можно
+    держать в том же процессе, что и агенты (local_link), без сети"""
+
+    def __init__(self):
+        # device -> {session, seq, characters, events, seen}
+        self.devices = {}
+        self.links = {}
+        self.server = None
+        self.deltas = 0
+
+    def listen(self, address=SYNC_ADDRESS):
+        scheme, rest = _parse(address)
+        if scheme == "serial":
+            # Одно устройство на порту - сразу соединение
+            path, _, baud = rest.partition(":")
+            self.attach(Link(fd=_open_serial(path, int(baud or 115200))))
+            return
+        if scheme == "tcp":
+            host, _, port = rest.rpartition(":")
+            self.server = socket.create_server((host, int(port)))
+        else:
+            try:
+                os.unlink(rest)
+            except FileNotFoundError:
+                pass
+            self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.server.bind(rest)
+            os.chmod(rest, 0o666)
+            self.server.listen(16)
+
+    def attach(self, link):
+        self.links[link.fileno()] = [link, None]
+
+    def local_link(self):
+        """Соединение с этим сборщиком внутри процесса (для агента в тестах и бенчмарке)"""
+        ours, theirs = socket.socketpair()
+        self.attach(Link(ours))
+        return Link(theirs)
+
+    def pump(self, timeout=0):
+        """Принимает подключения и обрабатывает пришедшие кадры"""
+        fds = list(self.links)
+        if self.server is not None:
+            fds.append(self.server.fileno())
+        ready, _, _ = select.select(fds, [], [], timeout)
+        for fd in ready:
+            if self.server is not None and fd == self.server.fileno():
+                conn, _ = self.server.accept()
+                self.attach(Link(conn))
+                continue
+            link, device = self.links[fd]
+            try:
+                for kind, payload in link.receive():
+                    device = self.handle(link, device, kind, payload)
+                self.links[fd][1] = device
+            except OSError:
+                link.close()
+                del self.links[fd]
+            except PAYLOAD_ERRORS as e:
+                print(f"Sync: bad message from {device or 'unknown device'}: {e!r}")
+                link.close()
+                del self.links[fd]
+
+    def handle(self, link, device, kind, payload):
+        """Обрабатывает кадр. Возвращает устройство соединения"""
+        if kind == MSG_HELLO:
+            device = payload["device"]
+            if not isinstance(device, str):
+                raise ValueError(f"device must be a string: {device!r}")
+            record = self.devices.setdefault(device, {
+                "session": None, "seq": 0, "characters": {},
+                "events": deque(maxlen=COLLECTOR_EVENTS), "seen": 0})
+            if record["session"] != payload.get("session"):
+                # Агент перезапущен - ждем от него снимок, номера начнутся заново
+                record["session"] = payload.get("session")
+                record["seq"] = 0
+            record["seen"] = time.time()
+            link.send(MSG_WELCOME, {"session": record["session"], "ack": record["seq"]})
+        elif kind == MSG_QUERY:
+            link.send(MSG_STATUS, {"devices": self.status()})
+        elif device is None:
+            raise ConnectionError("no HELLO")
+        elif kind == MSG_BATCH:
+            record = self.devices[device]
+            for delta in payload.get("deltas", []):
+                if delta["seq"] <= record["seq"]:
+                    # Повтор после разрыва - уже применено
+                    continue
+                if delta["seq"] != record["seq"] + 1:
+                    # Пропуск в номерах - состояние не восстановить по изменениям
+                    link.send(MSG_PULL, {})
+                    break
+                self.apply(record, delta)
+            record["seen"] = time.time()
+            link.send(MSG_ACK, {"seq": record["seq"]})
+        elif kind == MSG_SNAPSHOT:
+            record = self.devices[device]
+            characters = payload.get("characters", {})
+            seq = payload.get("seq", 0)
+            if not isinstance(characters, dict) or not isinstance(seq, int):
+                raise ValueError("bad snapshot")
+            record["characters"] = characters
+            record["seq"] = seq
+            record["seen"] = time.time()
+            link.send(MSG_ACK, {"seq": record["seq"]})
+        return device
+
+    def apply(self, record, delta):
+        state = record["characters"].setdefault(delta["char"], {})
+        for field in SYNC_FIELDS:
+            if field in delta:
+                state[field] = delta[field]
+        record["seq"] = delta["seq"]
+        if "event" in delta:
+            record["events"].append({key: delta[key] for key in ("time", "char", "event", "item")
+                                     if key in delta})
+        self.deltas += 1
+
+    def pull(self):
+        """Просит у всех подключенных устройств полный снимок"""
+        for link, device in list(self.links.values()):
+            if device is not None:
+                link.send(MSG_PULL, {})
+
+    def status(self):
+        return {device: {"seq": record["seq"], "seen": record["seen"],
+                         "characters": record["characters"], "events": list(record["events"])}
+                for device, record in self.devices.items()}
+
+    def write(self, path=COLLECTOR_STATE_FILE):
+        atomic_write_json(path, self.status())
+
+    def serve(self, address=SYNC_ADDRESS, state_file=None, interval=5):
+        self.listen(address)
+        print(f"Сборщик слушает {address}")
+        next_write = time.monotonic() + interval
+        try:
+            while True:
+                self.pump(interval)
+                if state_file and time.monotonic() >= next_write:
+                    self.write(state_file)
+                    next_write = time.monotonic() + interval
+        except KeyboardInterrupt:
+            print("\nСборщик остановлен")
+        finally:
+            if state_file:
+                self.write(state_file)
+
+
+def query(address=SYNC_ADDRESS):
+    """Полный снимок всех устройств со сборщика"""
+    link = open_link(address)
+    try:
+        link.send(MSG_QUERY, {})
+        while True:
+            select.select([link.fileno()], [], [], RECONNECT_INTERVAL)
+            for kind, payload in link.receive():
+                if kind == MSG_STATUS:
+                    return payload["devices"]
+    finally:
+        link.close()
+
+
+def main():
+    import sys
+
+    args = sys.argv[1:]
+    command = args[0] if args else "status"
+    # Позиционный аргумент - не флаг и не значение флага
+    positional = [arg for i, arg in enumerate(args[1:], 1)
+                  if not arg.startswith("--") and not args[i - 1].startswith("--")]
+    address = positional[0] if positional else SYNC_ADDRESS
+
+    if command == "collector":
+        # --state FILE: периодически сохранять состояние всех устройств
+        state_file = args[args.index("--state") + 1] if "--state" in args[:-1] else None
+        Collector().serve(address, state_file)
+    elif command == "agent":
+        # --device ID (по умолчанию имя хоста), --characters FILE - режим нескольких персонажей
+        device = args[args.index("--device") + 1] if "--device" in args[:-1] else socket.gethostname()
+        if "--characters" in args[:-1]:
+            from character_table import CharacterTable
+            table = CharacterTable(args[args.index("--characters") + 1])
+
+            def stores():
+                table.refresh()
+                return {char_id: table.store(char_id) for char_id in table.characters}
+        else:
+            from state_store import StateStore, CONFIG_FILE
+            store = StateStore(CONFIG_FILE)
+
+            def stores():
+                return {None: store}
+        SyncAgent(device, stores, connect=lambda: open_link(address)).run()
+    elif command == "status":
+        try:
+            devices = query(address)
+        except OSError as e:
+            print(f"Не удалось подключиться к {address}: {e}")
+            return
+        for device, record in sorted(devices.items()):
+            age = time.time() - record["seen"]
+            print(f"📟 {device}  (seq {record['seq']}, {age:.0f} с назад)")
+            for char_id, state in sorted(record["characters"].items()):
+                status = "💀" if state.get("is_dead") else "  "
+                print(f"   {status} {char_id or '-':<10} {state.get('name', ''):<16} "
+                      f"❤ {state.get('health', '?'):>3}%  ☢ {state.get('radiation', '?')}")
+            for event in record["events"][-5:]:
+                print(f"      {event.get('event')} {event.get('item', '')}")
+    else:
+        print("Использование:")
+        print("  python3 state_sync.py collector [АДРЕС] [--state FILE]")
+        print("  python3 state_sync.py agent [АДРЕС] [--device ID] [--characters FILE]")
+        print("  python3 state_sync.py status [АДРЕС]")
+        print(f"  АДРЕС: unix:ПУТЬ, tcp:ХОСТ:ПОРТ, serial:/dev/ttyS1[:115200] (по умолчанию {SYNC_ADDRESS})")
+
+
+if __name__ == "__main__":
+    main()
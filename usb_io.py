@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+import os
+
+# Файловые системы, которые пробуем при монтировании флешки
+MOUNT_FILESYSTEMS = ("vfat", "exfat", "ext4", "ntfs3")
+
+MS_NOSUID = 2
+MS_NODEV = 4
+MS_NOEXEC = 8
+
+_libc = None
+
+
+def _get_libc():
+    import ctypes
+    global _libc
+    if _libc is None:
+        # Символы libc уже есть в процессе - без find_library (он запускает ldconfig)
+        _libc = ctypes.CDLL(None, use_errno=True)
+        _libc.mount.argtypes = (ctypes.c_char_p, ctypes.c_char_p, ctypes.c_char_p,
+                                ctypes.c_ulong, ctypes.c_char_p)
+    return _libc
+
+
+def fsync_directory(path):
+    """Фиксирует изменения в каталоге (создание файла) на носителе"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def create_used_marker(used_file):
+    """Создает файл-метку и сбрасывает его и каталог на флешку без fork/sudo"""
+    fd = os.open(used_file, os.O_WRONLY | os.O_CREAT, 0o644)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    fsync_directory(os.path.dirname(used_file) or ".")
+
+
+def mount_device(device, mount_point, filesystems=MOUNT_FILESYSTEMS):
+    """Монтирует устройство системным вызовом mount(2). Нужен CAP_SYS_ADMIN"""
+    # ctypes импортируется только при первом монтировании
+    import ctypes
+    os.makedirs(mount_point, exist_ok=True)
+    libc = _get_libc()
+    flags = MS_NOSUID | MS_NODEV | MS_NOEXEC
+    last_errno = 0
+    for fstype in filesystems:
+        if libc.mount(os.fsencode(device), os.fsencode(mount_point),
+                      fstype.encode(), flags, None) == 0:
+            return fstype
+        last_errno = ctypes.get_errno()
+        if last_errno in (1, 13):
+            # EPERM/EACCES - нет прав, другие ФС пробовать бессмысленно
+            break
+    raise OSError(last_errno, f"mount {device}: {os.strerror(last_errno)}")
+
+
+def create_used_marker_sudo(used_file):
+    """Создает файл-метку через sudo touch и sudo sync"""
+    import subprocess
+    result = subprocess.run(['sudo', 'touch', used_file], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise OSError(result.stderr.strip())
+    subprocess.run(['sudo', 'sync', used_file], check=False)
+
+
+def mount_device_sudo(device, mount_point):
+    """Монтирует устройство через sudo mount"""
+    import subprocess
+    subprocess.run(['mkdir', '-p', mount_point], check=True)
+    result = subprocess.run(['sudo', 'mount', device, mount_point], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise OSError(result.stderr.strip())